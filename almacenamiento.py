@@ -0,0 +1,645 @@
+import os
+import sqlite3
+import threading
+import uuid
+from contextlib import contextmanager
+
+from cliente_sheets import CUOTA_POR_MINUTO, ClienteSheets, LimiteTasa
+from metricas import cronometrar, medir_libro
+
+# --- TABLAS ---
+# Nombres de las pestañas
+CATALOGO_WS = 'catalogo'
+INVENTARIO_WS = 'inventario'
+MOVIMIENTOS_WS = 'movimientos'
+CONTROL_WS = 'control'  # guarda el token de revisión de los datos
+
+# Cabeceras. Los datos del producto y su stock mínimo van una sola vez en el
+# catálogo; cada lote del inventario solo guarda código, cantidad, vencimiento
+# y un sello de versión que cambia con cada escritura del lote.
+catalogo_headers = ["codigo", "nombre", "marca", "precio_costo", "precio_venta", "stock_min"]
+inventario_headers = ["codigo", "cantidad", "fecha_vencimiento", "version"]
+movimientos_headers = ["timestamp", "tipo", "codigo", "nombre", "cantidad", "fecha_vencimiento", "precio_costo", "precio_venta"]
+
+# Cabeceras y clave de fila de cada tabla. Los movimientos son solo de agregado y no tienen clave.
+# En las tablas con 'version' se pueden hacer escrituras condicionales (ver `actualizar`);
+# 'delta' es la columna que se recalcula sumando la diferencia si hay conflicto.
+# Los movimientos guardan además la clave de la operación de la cola de escritura que
+# los agregó (ver `operaciones_guardadas`); esa columna no es parte del log que se muestra.
+TABLAS = {
+    CATALOGO_WS: {'cabeceras': catalogo_headers, 'clave': ('codigo',)},
+    INVENTARIO_WS: {
+        'cabeceras': inventario_headers, 'clave': ('codigo', 'fecha_vencimiento'),
+        'version': 'version', 'delta': 'cantidad',
+    },
+    MOVIMIENTOS_WS: {'cabeceras': movimientos_headers + ['operacion'], 'clave': None, 'operacion': 'operacion'},
+}
+
+# Formato anterior: datos del producto repetidos en cada lote y stock mínimo en
+# su propia pestaña. `preparar` lo convierte al catálogo la primera vez.
+STOCK_MINIMO_WS = 'stock_minimo'
+inventario_headers_v1 = ["codigo", "nombre", "marca", "cantidad", "fecha_vencimiento", "precio_costo", "precio_venta"]
+stock_minimo_headers_v1 = ['codigo', 'stock_min']
+
+
+class ConflictoVersion(Exception):
+    """Alguna fila no tenía la versión esperada; no se escribió nada de esa tabla.
+
+    `actuales` lleva, por clave en conflicto, la fila guardada hoy (None si no existe).
+    """
+
+    def __init__(self, tabla, actuales):
+        super().__init__(f"{len(actuales)} filas de '{tabla}' cambiaron desde la última lectura")
+        self.tabla = tabla
+        self.actuales = actuales
+
+
+def nuevo_sello():
+    """Sello de versión de una fila (con prefijo para que Sheets no lo tome como número)"""
+    return "v" + uuid.uuid4().hex[:12]
+
+
+def _como_texto(fila, n):
+    """Rellena/corta la fila a n celdas y la pasa a texto, como la devuelve Sheets"""
+    fila = list(fila[:n]) + [""] * (n - len(fila))
+    return ["" if celda is None else str(celda) for celda in fila]
+
+
+def catalogo_desde_v1(filas_inventario, filas_stock_minimo):
+    """Separa filas del formato anterior en (filas del catálogo, filas de lotes).
+
+    Los datos de cada producto se toman de su primer lote, como hacía la carga.
+    """
+    productos, lotes = {}, []
+    for fila in filas_inventario:
+        codigo, nombre, marca, cantidad, fv, pc, pv = _como_texto(fila, len(inventario_headers_v1))
+        if not codigo: continue
+        productos.setdefault(codigo, [codigo, nombre, marca, pc, pv, ""])
+        lotes.append([codigo, cantidad, fv])
+    for fila in filas_stock_minimo:
+        codigo, minimo = _como_texto(fila, len(stock_minimo_headers_v1))
+        if not codigo: continue
+        productos.setdefault(codigo, [codigo, "", "", "", "", ""])[5] = minimo
+    return list(productos.values()), lotes
+
+
+class Almacenamiento:
+    """Interfaz común de persistencia.
+
+    Las filas se leen y escriben sin cabecera, como listas de texto en el orden
+    de `TABLAS[tabla]['cabeceras']` (el mismo formato que `get_all_values`).
+
+    `revision()` es una consulta barata que cambia cuando cambian los datos
+    guardados. Cada escritura propia anota de qué revisión partió y a cuál
+    llevó (ver `seguir_escrituras`).
+    """
+
+    identificador = None  # identifica el origen de los datos (id de la hoja, ruta del archivo)
+    # Escrituras propias que se recuerdan: {revisión previa: revisión resultante}
+    MAX_ESCRITURAS = 100
+
+    def __init__(self):
+        self._escrituras = {}
+
+    def _registrar_escritura(self, previa, nueva):
+        """Anota que una escritura propia llevó los datos de la revisión `previa` a `nueva`"""
+        if previa is None: return
+        self._escrituras[previa] = nueva
+        if len(self._escrituras) > self.MAX_ESCRITURAS:
+            del self._escrituras[next(iter(self._escrituras))]
+
+    def seguir_escrituras(self, revision):
+        """Revisión a la que llevaron las escrituras propias hechas a partir de `revision`.
+
+        Solo se sigue mientras cada escritura haya partido exactamente de la
+        revisión anterior: si otra terminal escribió en medio, la cadena se corta
+        ahí. Sin escrituras propias devuelve la misma `revision`.
+        """
+        vistas = set()
+        while revision in self._escrituras and revision not in vistas:
+            vistas.add(revision)
+            revision = self._escrituras[revision]
+        return revision
+
+    def preparar(self):
+        """Crea las tablas que falten y convierte los datos del formato anterior"""
+        raise NotImplementedError
+
+    def leer(self, tabla):
+        raise NotImplementedError
+
+    def leer_desde(self, tabla, desde):
+        """Filas a partir de la posición `desde` (0 = primera fila de datos)"""
+        return self.leer(tabla)[desde:]
+
+    def leer_varias(self, pedidos):
+        """Lee varias tablas de una vez: `pedidos` es {tabla: desde}.
+
+        Devuelve (revisión, {tabla: filas}), con la revisión leída antes o junto
+        con los datos. Con `desde` = 0 equivale a `leer`.
+        """
+        revision = self.revision()
+        return revision, {t: self.leer(t) if desde == 0 else self.leer_desde(t, desde) for t, desde in pedidos.items()}
+
+    def sobrescribir(self, tabla, filas):
+        """Deja la tabla con exactamente estas filas"""
+        raise NotImplementedError
+
+    def actualizar(self, tabla, filas, borradas=(), esperadas=None):
+        """Inserta o reemplaza `filas` según su clave y elimina las claves `borradas`.
+
+        Con `esperadas` ({clave: versión}, None = la fila no debe existir) la
+        escritura es condicional: si alguna clave tiene hoy otra versión se
+        lanza `ConflictoVersion` sin escribir nada de la tabla.
+        """
+        raise NotImplementedError
+
+    def agregar(self, tabla, filas):
+        raise NotImplementedError
+
+    def revision(self):
+        raise NotImplementedError
+
+    def operaciones_guardadas(self, claves):
+        """Las claves de operación de `claves` que ya tienen movimientos guardados"""
+        i = TABLAS[MOVIMIENTOS_WS]['cabeceras'].index('operacion')
+        claves = set(claves)
+        return {fila[i] for fila in self.leer(MOVIMIENTOS_WS) if len(fila) > i and fila[i] in claves}
+
+    @contextmanager
+    def transaccion(self):
+        """Agrupa varias escrituras; en backends sin transacciones no hace nada"""
+        yield self
+
+
+class AlmacenamientoSheets(Almacenamiento):
+    """Backend sobre un `gspread.Spreadsheet`, una pestaña por tabla.
+
+    Para las tablas con clave recuerda en qué fila de la hoja está cada clave
+    (y qué filas quedaron vacías), de modo que `actualizar` escribe solo las
+    filas afectadas en un único `batch_update`. Ese índice solo se usa si la
+    revisión de la hoja no cambió desde que se construyó; si cambió, se
+    reconstruye leyendo la pestaña antes de escribir.
+
+    Las peticiones pasan por un `ClienteSheets` (pestañas cacheadas, límite de
+    `peticiones_por_minuto` y reintento ante un 429; None = sin límite) y
+    quedan registradas en las métricas (ver `metricas.medir_libro`).
+    """
+
+    def __init__(self, sh, peticiones_por_minuto=CUOTA_POR_MINUTO):
+        limite = LimiteTasa.por_minuto(peticiones_por_minuto) if peticiones_por_minuto else None
+        self.sh = ClienteSheets(medir_libro(sh), limite)
+        super().__init__()
+        self.identificador = sh.id
+        self._lock = threading.RLock()
+        self._profundidad = 0
+        self._cambios = False
+        self._fallida = False
+        self._tocadas = set()
+        self._revision_previa = None
+        self._indices = {}
+        self._revision_vista = None
+        self._preparada = False
+
+    def preparar(self):
+        """Ver `Almacenamiento.preparar`; se hace una sola vez por instancia"""
+        if self._preparada: return
+        titulos_actuales = [ws.title for ws in self.sh.worksheets()]
+        # Las cabeceras de todas las pestañas existentes en una sola petición
+        existentes = [tabla for tabla in TABLAS if tabla in titulos_actuales]
+        respuesta = self.sh.values_batch_get([f"{tabla}!A1:Z1" for tabla in existentes]) if existentes else {}
+        cabeceras = {
+            tabla: (rango.get('values') or [[]])[0]
+            for tabla, rango in zip(existentes, respuesta.get('valueRanges', []))
+        }
+        formato_v1 = cabeceras.get(INVENTARIO_WS, [])[:len(inventario_headers_v1)] == inventario_headers_v1
+        for tabla, spec in TABLAS.items():
+            if tabla not in titulos_actuales:
+                ws = self.sh.add_worksheet(title=tabla, rows=100, cols=max(5, len(spec['cabeceras']) + 3))
+                ws.append_row(spec['cabeceras'])
+            elif tabla != INVENTARIO_WS or not formato_v1:
+                # Columnas agregadas después (p. ej. 'version'): se completa la cabecera
+                cabecera = cabeceras.get(tabla, [])
+                if len(cabecera) < len(spec['cabeceras']) and cabecera == spec['cabeceras'][:len(cabecera)]:
+                    ultima_col = chr(ord('A') + len(spec['cabeceras']) - 1)
+                    self.sh.worksheet(tabla).batch_update([{'range': f"A1:{ultima_col}1", 'values': [spec['cabeceras']]}])
+        if CONTROL_WS not in titulos_actuales:
+            ws = self.sh.add_worksheet(title=CONTROL_WS, rows=5, cols=2)
+            ws.append_row(['revision', uuid.uuid4().hex])
+        if formato_v1:
+            self._convertir_v1(STOCK_MINIMO_WS in titulos_actuales)
+        self._preparada = True
+
+    def _convertir_v1(self, hay_stock_minimo):
+        """Pasa inventario + stock_minimo al catálogo. La pestaña stock_minimo queda sin uso.
+
+        Si se corta a mitad, el inventario sigue con la cabecera anterior y se
+        vuelve a convertir en el próximo `preparar`.
+        """
+        filas_inv = self.sh.worksheet(INVENTARIO_WS).get_all_values()[1:]
+        filas_min = self.sh.worksheet(STOCK_MINIMO_WS).get_all_values()[1:] if hay_stock_minimo else []
+        catalogo, lotes = catalogo_desde_v1(filas_inv, filas_min)
+        with self.transaccion():
+            self.sobrescribir(CATALOGO_WS, catalogo)
+            self.sobrescribir(INVENTARIO_WS, lotes)
+
+    def _indexar(self, tabla, filas, revision):
+        """Guarda la fila de la hoja de cada clave, su versión y las filas libres (sin código)"""
+        spec = TABLAS[tabla]
+        cabeceras = spec['cabeceras']
+        idx = [cabeceras.index(c) for c in spec['clave']]
+        i_version = cabeceras.index(spec['version']) if 'version' in spec else None
+        posiciones, versiones, libres = {}, {}, []
+        for nro, fila in enumerate(filas, start=2):  # la fila 1 es la cabecera
+            fila = _como_texto(fila, len(cabeceras))
+            if not fila[0]:
+                libres.append(nro)
+            else:
+                clave = tuple(fila[i] for i in idx)
+                posiciones[clave] = nro
+                if i_version is not None:
+                    versiones[clave] = fila[i_version]
+        self._indices[tabla] = {
+            'revision': revision, 'posiciones': posiciones, 'versiones': versiones,
+            'libres': libres, 'ultima': len(filas) + 1
+        }
+
+    def leer(self, tabla):
+        with self._lock:
+            filas = self.sh.worksheet(tabla).get_all_values()[1:]
+            if TABLAS[tabla]['clave']:
+                self._indexar(tabla, filas, self._revision_vista)
+            return filas
+
+    def leer_desde(self, tabla, desde):
+        """Pide solo el rango desde la fila `desde` hasta el final de la pestaña"""
+        n = len(TABLAS[tabla]['cabeceras'])
+        ultima_col = chr(ord('A') + n - 1)
+        filas = self.sh.worksheet(tabla).get(f"A{desde + 2}:{ultima_col}")
+        return [_como_texto(f, n) for f in filas]
+
+    def leer_varias(self, pedidos):
+        """Ver `Almacenamiento.leer_varias`: la revisión y todos los rangos en un solo `values_batch_get`"""
+        rangos = [f"{CONTROL_WS}!B1"] + [
+            f"{tabla}!A{desde + 2}:{chr(ord('A') + len(TABLAS[tabla]['cabeceras']) - 1)}"
+            for tabla, desde in pedidos.items()
+        ]
+        with self._lock:
+            respuesta = self.sh.values_batch_get(rangos)
+            valores = [rango.get('values') or [] for rango in respuesta.get('valueRanges', [])]
+            self._revision_vista = (valores[0] or [[""]])[0][0]
+            leidas = {}
+            for (tabla, desde), filas in zip(pedidos.items(), valores[1:]):
+                # Igual que `leer` (desde = 0) y `leer_desde` (el resto)
+                if desde:
+                    filas = [_como_texto(f, len(TABLAS[tabla]['cabeceras'])) for f in filas]
+                elif TABLAS[tabla]['clave']:
+                    self._indexar(tabla, filas, self._revision_vista)
+                leidas[tabla] = filas
+            return self._revision_vista, leidas
+
+    def revision(self):
+        """Lee solo la celda de revisión (una llamada a la API)"""
+        valores = self.sh.values_get(f"{CONTROL_WS}!B1").get('values') or [[""]]
+        self._revision_vista = valores[0][0]
+        return self._revision_vista
+
+    def operaciones_guardadas(self, claves):
+        """Ver `Almacenamiento.operaciones_guardadas`: se lee solo la columna de la clave"""
+        col = chr(ord('A') + TABLAS[MOVIMIENTOS_WS]['cabeceras'].index('operacion'))
+        valores = self.sh.values_get(f"{MOVIMIENTOS_WS}!{col}2:{col}").get('values') or []
+        claves = set(claves)
+        return {fila[0] for fila in valores if fila and fila[0] in claves}
+
+    def _leer_revision_previa(self):
+        """Revisión de la hoja antes de la primera escritura de la transacción (se lee una sola vez)"""
+        if self._revision_previa is None:
+            self._revision_previa = self.revision()
+        return self._revision_previa
+
+    @contextmanager
+    def transaccion(self):
+        """Serializa las escrituras y actualiza la celda de revisión una sola vez al final"""
+        with self._lock:
+            self._profundidad += 1
+            try:
+                yield self
+            except BaseException:
+                self._fallida = True
+                raise
+            finally:
+                self._profundidad -= 1
+                if self._profundidad == 0:
+                    self._cerrar_transaccion()
+
+    def _cerrar_transaccion(self):
+        tocadas, fallida, cambios, previa = self._tocadas, self._fallida, self._cambios, self._revision_previa
+        self._tocadas, self._fallida, self._cambios, self._revision_previa = set(), False, False, None
+        if fallida:
+            # No sabemos qué llegó a escribirse: los índices de esas pestañas ya no son fiables
+            for tabla in tocadas:
+                self._indices.pop(tabla, None)
+        if cambios:
+            token = uuid.uuid4().hex
+            self.sh.values_update(
+                f"{CONTROL_WS}!B1", params={'valueInputOption': 'RAW'}, body={'values': [[token]]}
+            )
+            self._revision_vista = token
+            self._registrar_escritura(previa, token)
+            # Los índices de lo escrito ya lo incluyen; los de las demás pestañas siguen
+            # valiendo si estaban al día con la revisión de la que partió la escritura
+            for tabla, indice in self._indices.items():
+                if tabla in tocadas or (previa is not None and indice['revision'] == previa):
+                    indice['revision'] = token
+
+    def sobrescribir(self, tabla, filas):
+        cabeceras = TABLAS[tabla]['cabeceras']
+        filas = [_como_texto(f, len(cabeceras)) for f in filas]
+        with self.transaccion():
+            self._leer_revision_previa()
+            self._cambios = True
+            self._tocadas.add(tabla)
+            ws = self.sh.worksheet(tabla)
+            ws.clear()
+            ws.append_row(cabeceras)
+            if filas:
+                ws.append_rows(filas, value_input_option='USER_ENTERED')
+            if TABLAS[tabla]['clave']:
+                self._indexar(tabla, filas, None)
+
+    def actualizar(self, tabla, filas, borradas=(), esperadas=None):
+        """Ver `Almacenamiento.actualizar`.
+
+        Las versiones se comparan con las del índice, que está al día con la
+        revisión de la hoja. Sheets no tiene escrituras condicionales, así que
+        queda una ventana (entre leer la revisión y el `batch_update`) en la que
+        otra terminal podría escribir sin que se detecte.
+        """
+        if not filas and not borradas: return
+        spec = TABLAS[tabla]
+        cabeceras = spec['cabeceras']
+        n = len(cabeceras)
+        ultima_col = chr(ord('A') + n - 1)
+        idx = [cabeceras.index(c) for c in spec['clave']]
+        i_version = cabeceras.index(spec['version']) if 'version' in spec else None
+
+        with self.transaccion():
+            ws = self.sh.worksheet(tabla)
+            indice = self._indices.get(tabla)
+            if indice is None or indice['revision'] is None or indice['revision'] != self._leer_revision_previa():
+                self._indexar(tabla, ws.get_all_values()[1:], self._revision_previa)
+                indice = self._indices[tabla]
+            posiciones, versiones, libres = indice['posiciones'], indice['versiones'], indice['libres']
+
+            if esperadas:
+                conflictos = [clave for clave, version in esperadas.items() if versiones.get(clave) != version]
+                if conflictos:
+                    raise ConflictoVersion(tabla, self._leer_filas(ws, n, posiciones, conflictos))
+
+            cambios = {}
+            for clave in borradas:
+                versiones.pop(tuple(clave), None)
+                nro = posiciones.pop(tuple(clave), None)
+                if nro is not None:
+                    cambios[nro] = [""] * n
+                    libres.append(nro)
+            libres.sort(reverse=True)  # pop() devuelve la fila libre más baja de la hoja
+
+            for fila in filas:
+                fila = _como_texto(fila, n)
+                clave = tuple(fila[i] for i in idx)
+                nro = posiciones.get(clave)
+                if nro is None:
+                    if libres:
+                        nro = libres.pop()
+                    else:
+                        indice['ultima'] += 1
+                        nro = indice['ultima']
+                    posiciones[clave] = nro
+                if i_version is not None:
+                    versiones[clave] = fila[i_version]
+                cambios[nro] = fila
+
+            self._cambios = True
+            self._tocadas.add(tabla)
+            if indice['ultima'] > ws.row_count:
+                ws.add_rows(indice['ultima'] - ws.row_count)
+            ws.batch_update(
+                [{'range': f"A{nro}:{ultima_col}{nro}", 'values': [valores]} for nro, valores in sorted(cambios.items())],
+                value_input_option='USER_ENTERED'
+            )
+
+    def _leer_filas(self, ws, n, posiciones, claves):
+        """Filas actuales de las claves pedidas (None si la clave no está en la hoja)"""
+        ultima_col = chr(ord('A') + n - 1)
+        con_fila = [c for c in claves if c in posiciones]
+        rangos = ws.batch_get([f"A{posiciones[c]}:{ultima_col}{posiciones[c]}" for c in con_fila]) if con_fila else []
+        actuales = dict.fromkeys(claves)
+        for clave, valores in zip(con_fila, rangos):
+            actuales[clave] = _como_texto(valores[0] if valores else [], n)
+        return actuales
+
+    def agregar(self, tabla, filas):
+        if not filas: return
+        n = len(TABLAS[tabla]['cabeceras'])
+        with self.transaccion():
+            self._leer_revision_previa()
+            self._cambios = True
+            self._tocadas.add(tabla)
+            self.sh.worksheet(tabla).append_rows([_como_texto(f, n) for f in filas])
+
+
+class AlmacenamientoSQLite(Almacenamiento):
+    """Backend local en un archivo SQLite (o ':memory:').
+
+    Las tablas con clave se actualizan fila a fila (solo se tocan las filas que
+    cambiaron) dentro de una transacción, y los movimientos quedan indexados
+    por código y fecha.
+    """
+
+    def __init__(self, ruta):
+        super().__init__()
+        self.ruta = ruta
+        self.identificador = ruta if ruta == ':memory:' else os.path.abspath(ruta)
+        self._conn = sqlite3.connect(ruta, check_same_thread=False, isolation_level=None)
+        self._lock = threading.RLock()
+        self._profundidad = 0
+        if ruta != ':memory:':
+            self._conn.execute("PRAGMA journal_mode=WAL")
+
+    def _existe(self, tabla):
+        return self._conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (tabla,)
+        ).fetchone() is not None
+
+    def preparar(self):
+        with self._lock:
+            columnas = [c[1] for c in self._conn.execute("PRAGMA table_info(inventario)")]
+            if 'nombre' in columnas:
+                # Formato anterior: se aparta y se convierte después de crear las tablas nuevas
+                self._conn.execute("ALTER TABLE inventario RENAME TO inventario_v1")
+            self._conn.executescript("""
+                CREATE TABLE IF NOT EXISTS catalogo (
+                    codigo TEXT PRIMARY KEY, nombre TEXT, marca TEXT,
+                    precio_costo NUMERIC, precio_venta NUMERIC, stock_min NUMERIC
+                );
+                CREATE TABLE IF NOT EXISTS inventario (
+                    codigo TEXT NOT NULL, cantidad NUMERIC, fecha_vencimiento TEXT NOT NULL DEFAULT '',
+                    version TEXT NOT NULL DEFAULT '',
+                    PRIMARY KEY (codigo, fecha_vencimiento)
+                );
+                CREATE TABLE IF NOT EXISTS movimientos (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    timestamp TEXT, tipo TEXT, codigo TEXT, nombre TEXT, cantidad NUMERIC,
+                    fecha_vencimiento TEXT, precio_costo NUMERIC, precio_venta NUMERIC,
+                    operacion TEXT NOT NULL DEFAULT ''
+                );
+                CREATE INDEX IF NOT EXISTS idx_movimientos_timestamp ON movimientos (timestamp);
+                CREATE INDEX IF NOT EXISTS idx_movimientos_codigo ON movimientos (codigo, timestamp);
+            """)
+            if 'version' not in [c[1] for c in self._conn.execute("PRAGMA table_info(inventario)")]:
+                self._conn.execute("ALTER TABLE inventario ADD COLUMN version TEXT NOT NULL DEFAULT ''")
+            if 'operacion' not in [c[1] for c in self._conn.execute("PRAGMA table_info(movimientos)")]:
+                self._conn.execute("ALTER TABLE movimientos ADD COLUMN operacion TEXT NOT NULL DEFAULT ''")
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_movimientos_operacion ON movimientos (operacion) WHERE operacion != ''"
+            )
+            if self._existe('inventario_v1'):
+                self._convertir_v1()
+
+    def _convertir_v1(self):
+        """Pasa inventario_v1 + stock_minimo al catálogo en una transacción y borra inventario_v1"""
+        with self.transaccion():
+            filas_inv = self._conn.execute(f"SELECT {', '.join(inventario_headers_v1)} FROM inventario_v1").fetchall()
+            filas_min = []
+            if self._existe(STOCK_MINIMO_WS):
+                filas_min = self._conn.execute(f"SELECT {', '.join(stock_minimo_headers_v1)} FROM {STOCK_MINIMO_WS}").fetchall()
+            catalogo, lotes = catalogo_desde_v1(filas_inv, filas_min)
+            self.sobrescribir(CATALOGO_WS, catalogo)
+            self.sobrescribir(INVENTARIO_WS, lotes)
+            self._conn.execute("DROP TABLE inventario_v1")
+
+    @contextmanager
+    def transaccion(self):
+        with self._lock:
+            if self._profundidad == 0:
+                self._conn.execute("BEGIN IMMEDIATE")
+                previa = self.revision()
+            self._profundidad += 1
+            try:
+                yield self
+            except BaseException:
+                self._profundidad -= 1
+                if self._profundidad == 0:
+                    self._conn.execute("ROLLBACK")
+                raise
+            self._profundidad -= 1
+            if self._profundidad == 0:
+                self._conn.execute("COMMIT")
+                # Las confirmaciones propias no cambian `data_version`: queda igual a la previa
+                self._registrar_escritura(previa, self.revision())
+
+    @cronometrar()
+    def revision(self):
+        """`data_version` solo cambia cuando otra conexión confirma cambios en el archivo"""
+        with self._lock:
+            return self._conn.execute("PRAGMA data_version").fetchone()[0]
+
+    @cronometrar()
+    def leer(self, tabla):
+        return self.leer_desde(tabla, 0)
+
+    def operaciones_guardadas(self, claves):
+        claves = list(claves)
+        if not claves: return set()
+        with self._lock:
+            cur = self._conn.execute(
+                f"SELECT DISTINCT operacion FROM movimientos WHERE operacion IN ({', '.join('?' * len(claves))})", claves
+            )
+            return {fila[0] for fila in cur}
+
+    @cronometrar()
+    def leer_desde(self, tabla, desde):
+        cabeceras = TABLAS[tabla]['cabeceras']
+        orden = "id" if tabla == MOVIMIENTOS_WS else "rowid"
+        with self._lock:
+            cur = self._conn.execute(
+                f"SELECT {', '.join(cabeceras)} FROM {tabla} ORDER BY {orden} LIMIT -1 OFFSET ?", (desde,)
+            )
+            return [_como_texto(f, len(cabeceras)) for f in cur]
+
+    @cronometrar()
+    def sobrescribir(self, tabla, filas):
+        spec = TABLAS[tabla]
+        cabeceras, clave = spec['cabeceras'], spec['clave']
+        n = len(cabeceras)
+        if clave is None:
+            with self.transaccion():
+                self._conn.execute(f"DELETE FROM {tabla}")
+                self.agregar(tabla, filas)
+            return
+
+        idx = [cabeceras.index(c) for c in clave]
+        nuevas = {}
+        for fila in filas:
+            fila = _como_texto(fila, n)
+            nuevas[tuple(fila[i] for i in idx)] = fila
+
+        with self.transaccion():
+            actuales = {}
+            for fila in self._conn.execute(f"SELECT {', '.join(cabeceras)} FROM {tabla}"):
+                fila = _como_texto(fila, n)
+                actuales[tuple(fila[i] for i in idx)] = fila
+
+            borradas = [k for k in actuales if k not in nuevas]
+            cambiadas = [f for k, f in nuevas.items() if actuales.get(k) != f]
+            self.actualizar(tabla, cambiadas, borradas)
+
+    @cronometrar()
+    def actualizar(self, tabla, filas, borradas=(), esperadas=None):
+        """Ver `Almacenamiento.actualizar`; la comprobación de versiones y la
+        escritura van en la misma transacción (BEGIN IMMEDIATE), así que son atómicas"""
+        spec = TABLAS[tabla]
+        cabeceras, clave = spec['cabeceras'], spec['clave']
+        n = len(cabeceras)
+        donde = " AND ".join(f"{c} = ?" for c in clave)
+        asignar = ", ".join(f"{c} = excluded.{c}" for c in cabeceras if c not in clave)
+        with self.transaccion():
+            if esperadas:
+                i_version = cabeceras.index(spec['version'])
+                actuales = {}
+                for k, version in esperadas.items():
+                    fila = self._conn.execute(f"SELECT {', '.join(cabeceras)} FROM {tabla} WHERE {donde}", k).fetchone()
+                    fila = _como_texto(fila, n) if fila else None
+                    if (fila[i_version] if fila else None) != version:
+                        actuales[k] = fila
+                if actuales:
+                    raise ConflictoVersion(tabla, actuales)
+            if borradas:
+                self._conn.executemany(f"DELETE FROM {tabla} WHERE {donde}", [tuple(k) for k in borradas])
+            if filas:
+                self._conn.executemany(
+                    f"INSERT INTO {tabla} ({', '.join(cabeceras)}) VALUES ({', '.join('?' * n)}) "
+                    f"ON CONFLICT ({', '.join(clave)}) DO UPDATE SET {asignar}",
+                    [_como_texto(f, n) for f in filas]
+                )
+
+    @cronometrar()
+    def agregar(self, tabla, filas):
+        if not filas: return
+        cabeceras = TABLAS[tabla]['cabeceras']
+        n = len(cabeceras)
+        with self.transaccion():
+            self._conn.executemany(
+                f"INSERT INTO {tabla} ({', '.join(cabeceras)}) VALUES ({', '.join('?' * n)})",
+                [_como_texto(f, n) for f in filas]
+            )
+
+
+def migrar(origen, destino):
+    """Copia todas las tablas de un backend a otro (p. ej. Sheets -> SQLite)"""
+    origen.preparar()
+    destino.preparar()
+    with destino.transaccion():
+        for tabla in TABLAS:
+            destino.sobrescribir(tabla, origen.leer(tabla))
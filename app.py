@@ -1,719 +1,666 @@
-import streamlit as st
-import pandas as pd
-import gspread
-from datetime import datetime, timedelta
-import matplotlib.pyplot as plt
-import numpy as np
-#xd
-# --- CONFIGURACIÓN DE LA PÁGINA ---
-st.set_page_config(
-    layout="wide", 
-    page_title="Inventario B&M", 
-    page_icon="📦",
-    initial_sidebar_state="collapsed"
-)
-
-# --- ESTILOS CUSTOM (CSS) ---
-st.markdown("""
-    <style>
-    .main {
-        background-color: #f8f9fa;
-    }
-    h1 {
-        color: #1f77b4;
-        text-align: center;
-        font-family: 'Helvetica', sans-serif;
-    }
-    h3 {
-        color: #4a4a4a;
-        border-bottom: 2px solid #e0e0e0;
-        padding-bottom: 10px;
-    }
-    .stButton>button {
-        width: 100%;
-        border-radius: 8px;
-        font-weight: bold;
-    }
-    div[data-testid="stMetricValue"] {
-        font-size: 1.5rem;
-    }
-    </style>
-    """, unsafe_allow_html=True)
-
-st.title("📦 Sistema de Gestión de Inventario B&M")
-st.markdown("---")
-
-# --- CONFIGURACIÓN GOOGLE SHEETS ---
-# Usamos el ID de tu hoja
-GOOGLE_SHEET_ID = "1Zu-Dq6UCYRKMTWNsxj8FsMzzpAdtvl-qb40CVEmwl44"
-
-# Nombres de las pestañas
-INVENTARIO_WS = 'inventario'
-STOCK_MINIMO_WS = 'stock_minimo'
-MOVIMIENTOS_WS = 'movimientos'
-
-# Cabeceras
-inventario_headers = ["codigo", "nombre", "marca", "cantidad", "fecha_vencimiento", "precio_costo", "precio_venta"]
-stock_minimo_headers = ['codigo', 'stock_min']
-movimientos_headers = ["timestamp", "tipo", "codigo", "nombre", "cantidad", "fecha_vencimiento", "precio_costo", "precio_venta"]
-
-# Variables globales en memoria
-inventario = {}
-stock_minimo = {}
-movimientos = []
-
-# --- CONEXIÓN Y FUNCIONES AUXILIARES ---
-
-@st.cache_resource(ttl=3600)
-def obtener_conexion():
-    """Conecta con Google Sheets usando st.secrets"""
-    try:
-        credentials = dict(st.secrets["gcp_service_account"])
-        
-        if "private_key" in credentials:
-            credentials["private_key"] = credentials["private_key"].replace("\\n", "\n")
-        
-        gc = gspread.service_account_from_dict(credentials)
-        sh = gc.open_by_key(GOOGLE_SHEET_ID)
-        return sh
-    except Exception as e:
-        st.error(f"Error de conexión: {e}. \n\nPosibles causas:\n1. El bot no tiene permiso de 'Editor' en la hoja.\n2. La API de Google Sheets no está habilitada en Google Cloud.")
-        st.stop()
-
-def check_worksheets(sh):
-    """Asegura que las pestañas existan y tengan headers"""
-    try:
-        titulos_actuales = [ws.title for ws in sh.worksheets()]
-        
-        if INVENTARIO_WS not in titulos_actuales:
-            ws = sh.add_worksheet(title=INVENTARIO_WS, rows=100, cols=10)
-            ws.append_row(inventario_headers)
-            
-        if STOCK_MINIMO_WS not in titulos_actuales:
-            ws = sh.add_worksheet(title=STOCK_MINIMO_WS, rows=100, cols=5)
-            ws.append_row(stock_minimo_headers)
-            
-        if MOVIMIENTOS_WS not in titulos_actuales:
-            ws = sh.add_worksheet(title=MOVIMIENTOS_WS, rows=100, cols=10)
-            ws.append_row(movimientos_headers)
-    except Exception as e:
-        st.error(f"Error verificando pestañas: {e}")
-
-def normalizar_fecha(fecha_obj) -> str:
-    if not fecha_obj: return ""
-    try:
-        if isinstance(fecha_obj, str):
-            fecha_obj = fecha_obj.strip()
-            if ' ' in fecha_obj: fecha_obj = fecha_obj.split(' ')[0]
-            if 'T' in fecha_obj: fecha_obj = fecha_obj.split('T')[0]
-            return fecha_obj
-        
-        if hasattr(fecha_obj, 'strftime'):
-            return fecha_obj.strftime("%Y-%m-%d")
-        
-        return str(fecha_obj).split(' ')[0]
-    except: return ""
-
-def _convertir_a_numero(valor, por_defecto=0):
-    if valor is None or valor == '': return por_defecto
-    try: return int(valor)
-    except (ValueError, TypeError):
-        try: return float(valor)
-        except (ValueError, TypeError): return por_defecto
-
-def stock_total(codigo: str) -> int:
-    return sum(l["cantidad"] for l in inventario.get(codigo, []))
-
-def ordenar_lotes_fifo(lotes):
-    def clave(l):
-        fv = l.get("fecha_vencimiento", "")
-        if not fv:
-            return (datetime.max, 1)
-        try:
-            return (datetime.fromisoformat(fv), 0)
-        except Exception:
-            return (datetime.max, 1)
-    return sorted(lotes, key=clave)
-
-def _escribir_sheet(ws_name, headers, datos):
-    """Sobreescribe una pestaña completa con nuevos datos"""
-    try:
-        sh = obtener_conexion()
-        ws = sh.worksheet(ws_name)
-        ws.clear()
-        ws.append_row(headers)
-        if datos:
-            datos_limpios = []
-            for fila in datos:
-                fila_expandida = list(fila) + ["" for _ in range(len(headers) - len(fila))]
-                fila_str = [str(celda) if celda is not None else "" for celda in fila_expandida[:len(headers)]]
-                datos_limpios.append(fila_str)
-
-            ws.append_rows(datos_limpios, value_input_option='USER_ENTERED')
-    except Exception as e:
-        st.error(f"Error guardando en {ws_name}: {e}")
-
-# --- LOGICA DE NEGOCIO ---
-
-def cargar_todo():
-    """Carga datos desde Sheets a memoria. Se ejecuta en cada run de Streamlit."""
-    inventario.clear()
-    stock_minimo.clear()
-    movimientos.clear()
-    
-    sh = obtener_conexion()
-    check_worksheets(sh)
-    
-    # 1. Cargar Inventario
-    try:
-        ws_inv = sh.worksheet(INVENTARIO_WS)
-        vals_inv = ws_inv.get_all_values()
-        if len(vals_inv) > 1:
-            for fila in vals_inv[1:]: # Saltar header
-                fila += [""] * (len(inventario_headers) - len(fila))
-                codigo, nombre, marca, cant, fv, pc, pv = fila[:len(inventario_headers)]
-                
-                if not codigo: continue
-                
-                lote = {
-                    'nombre': nombre,
-                    'marca': marca,
-                    'cantidad': _convertir_a_numero(cant),
-                    'fecha_vencimiento': normalizar_fecha(fv),
-                    'precio_costo': _convertir_a_numero(pc),
-                    'precio_venta': _convertir_a_numero(pv)
-                }
-                
-                if codigo not in inventario: inventario[codigo] = []
-                inventario[codigo].append(lote)
-    except Exception as e: st.error(f"Error leyendo inventario: {e}")
-
-    # 2. Cargar Stock Minimo
-    try:
-        ws_min = sh.worksheet(STOCK_MINIMO_WS)
-        vals_min = ws_min.get_all_values()
-        if len(vals_min) > 1:
-            for fila in vals_min[1:]:
-                if fila and fila[0]:
-                    stock_minimo[fila[0]] = _convertir_a_numero(fila[1] if len(fila)>1 else 0)
-    except Exception as e: st.error(f"Error leyendo stock minimo: {e}")
-
-    # 3. Cargar Movimientos
-    try:
-        ws_mov = sh.worksheet(MOVIMIENTOS_WS)
-        vals_mov = ws_mov.get_all_values()
-        if len(vals_mov) > 1:
-            for fila in vals_mov[1:]:
-                movimientos.append(fila[:len(movimientos_headers)])
-    except Exception as e: st.error(f"Error leyendo movimientos: {e}")
-    
-    st.session_state['data_loaded'] = True
-
-# Funciones de guardado
-def guardar_inventario():
-    filas = []
-    for codigo, lotes in inventario.items():
-        for d in lotes:
-            filas.append([
-                codigo, d.get('nombre',""), d.get('marca',""), d.get('cantidad',0),
-                d.get('fecha_vencimiento',""), d.get('precio_costo',0), d.get('precio_venta',0)
-            ])
-    _escribir_sheet(INVENTARIO_WS, inventario_headers, filas)
-
-def guardar_stock_minimo():
-    filas = [[k, v] for k, v in stock_minimo.items()]
-    _escribir_sheet(STOCK_MINIMO_WS, stock_minimo_headers, filas)
-
-def registrar_movimiento(tipo, codigo, nombre, cantidad, fecha_vencimiento, precio_costo, precio_venta):
-    nueva_fila = [
-        datetime.now().isoformat(timespec="seconds"),
-        tipo,
-        str(codigo),
-        nombre,
-        cantidad,
-        fecha_vencimiento or "",
-        precio_costo if precio_costo is not None else 0,
-        precio_venta if precio_venta is not None else 0,
-    ]
-    try:
-        sh = obtener_conexion()
-        ws = sh.worksheet(MOVIMIENTOS_WS)
-        fila_str = [str(x) for x in nueva_fila]
-        ws.append_row(fila_str)
-        movimientos.append(nueva_fila) 
-    except Exception as e:
-        st.error(f"Error registrando movimiento: {e}")
-
-# --- INICIALIZACIÓN ---
-if 'data_loaded' not in st.session_state:
-    cargar_todo()
-else:
-    cargar_todo()
-
-# --- INTERFAZ STREAMLIT ---
-# Tabs con iconos para mejor apariencia
-tab1, tab2, tab3, tab4, tab5, tab6 = st.tabs([
-    "📥 Entrada", "📤 Salida", "📋 Inventario", 
-    "📊 Historial", "📉 Stock Mínimo", "⏰ Vencimientos"
-])
-
-with tab1:
-    st.subheader("📥 Registro de Entradas")
-    
-    if 'reset_counter' not in st.session_state:
-        st.session_state.reset_counter = 0
-
-    input_key = f"entrada_input_{st.session_state.reset_counter}"
-    
-    # Diseño en columna central para búsqueda
-    col_search, _ = st.columns([1, 1])
-    with col_search:
-        entrada = st.text_input("🔍 Escanee código o escriba 'buscar': ", key=input_key)
-    
-    codigo_seleccionado = None
-    
-    if entrada:
-        if entrada.lower() == 'buscar':
-            productos_lista = []
-            for codigo, lotes in inventario.items():
-                if lotes:
-                    base = lotes[0]
-                    nombre = base.get('nombre') or 'N/A'
-                    marca = base.get('marca') or 'N/A'
-                    productos_lista.append((codigo, nombre, marca))
-                
-            productos_lista.sort(key=lambda x: x[1])
-
-            opciones = [f"{i+1}) {nombre} - {marca} (Código: {codigo})" 
-                                for i, (codigo, nombre, marca) in enumerate(productos_lista)]
-            
-            opciones.insert(0, "Cancelar")
-            seleccion = st.selectbox("Seleccione un producto", opciones)
-
-            if seleccion == 'Cancelar':
-                codigo_seleccionado = None
-            else:
-                idx = opciones.index(seleccion) - 1
-                codigo_seleccionado = productos_lista[idx][0]
-                st.success(f"✅ Seleccionado: {productos_lista[idx][1]}")
-        else:
-            codigo_seleccionado = entrada
-
-    if codigo_seleccionado:
-        es_nuevo = codigo_seleccionado not in inventario
-        no_tiene_min = codigo_seleccionado not in stock_minimo or stock_minimo[codigo_seleccionado] is None
-        
-        st.markdown("---")
-        if es_nuevo:
-            st.info(f"🆕 El código **{codigo_seleccionado}** es nuevo. Complete los datos.")
-        else:
-            base = inventario[codigo_seleccionado][0]
-            st.success(f"📦 Editando: **{base.get('nombre')}** ({base.get('marca')})")
-        
-        with st.form("form_entrada", clear_on_submit = True):
-            # Layout de formulario en columnas
-            c1, c2 = st.columns(2)
-            
-            nombre_def = '' if es_nuevo else inventario[codigo_seleccionado][0].get('nombre', '')
-            marca_def = '' if es_nuevo else inventario[codigo_seleccionado][0].get('marca', '')
-            pc_def = 0 if es_nuevo else inventario[codigo_seleccionado][0].get('precio_costo', 0)
-            pv_def = 0 if es_nuevo else inventario[codigo_seleccionado][0].get('precio_venta', 0)
-            cant_min_def = 0 if no_tiene_min else stock_minimo[codigo_seleccionado]
-            
-            with c1:
-                st.markdown("**Datos del Producto**")
-                nombre = st.text_input("Nombre", value = nombre_def, disabled = not es_nuevo)
-                marca = st.text_input("Marca", value = marca_def, disabled = not es_nuevo)
-                cantidad = st.number_input("Cantidad a ingresar", min_value = 0, value = 1, step = 1)
-                
-            with c2:
-                st.markdown("**Precios y Alertas**")
-                precio_costo = st.number_input("Precio Costo", min_value = 0, value = int(pc_def), disabled = not es_nuevo)
-                precio_venta = st.number_input("Precio Venta", min_value = 0, value = int(pv_def), disabled = not es_nuevo)
-                cant_min = st.number_input("Stock Mínimo", min_value = 0, value = int(cant_min_def))
-            
-            st.markdown("**Vencimiento**")
-            col_venc1, col_venc2 = st.columns(2)
-            with col_venc1:
-                aplica_vencimiento = st.checkbox("¿Tiene fecha de vencimiento?", value = True)
-            with col_venc2:
-                fecha_vencimiento = st.date_input("Fecha Vencimiento", value = datetime.now().date())
-
-            st.markdown("<br>", unsafe_allow_html=True)
-            submitted = st.form_submit_button("💾 Guardar Entrada", type="primary")
-
-            if submitted:
-                fv = normalizar_fecha(fecha_vencimiento) if aplica_vencimiento else ""
-
-                if es_nuevo:
-                    lote = {
-                        'nombre': nombre, 'marca': marca, 'cantidad': cantidad,
-                        'fecha_vencimiento': fv, 'precio_costo': precio_costo, 'precio_venta': precio_venta
-                    }
-                    inventario[codigo_seleccionado] = [lote]
-                    stock_minimo[codigo_seleccionado] = cant_min
-                    mensaje = f'Producto {nombre} creado con éxito'
-                else:
-                    lotes = inventario[codigo_seleccionado]
-                    lote_existente = next((l for l in lotes if l.get("fecha_vencimiento", "") == fv), None)
-
-                    if lote_existente:
-                        lote_existente['cantidad'] += cantidad
-                        mensaje = f"Se agregaron {cantidad} unidades al lote existente ({fv})"
-                    else:
-                        lotes.append({
-                            'nombre': nombre, 'marca': marca, 'cantidad': cantidad,
-                            'fecha_vencimiento': fv, 'precio_costo': precio_costo, 'precio_venta': precio_venta
-                        })
-                        stock_minimo[codigo_seleccionado] = cant_min
-                        mensaje = f"Se creó un nuevo lote con {cantidad} unidades ({fv})"
-
-                guardar_inventario()
-                guardar_stock_minimo()
-                registrar_movimiento("entrada", codigo_seleccionado, nombre, cantidad, fv, precio_costo, precio_venta)
-                st.success(mensaje) 
-                st.session_state.reset_counter += 1
-                st.rerun()
-
-with tab2:
-    st.subheader("📤 Registro de Salidas")
-    
-    if "lista" not in st.session_state:
-        st.session_state.lista = {}
-
-    def procesar_codigo_escaneado():
-        codigo_sin_procesar = st.session_state.codigo
-        if not codigo_sin_procesar: return
-
-        cantidad = 1
-        codigo_producto = ""
-
-        if "*" in codigo_sin_procesar:
-            try:
-                partes = codigo_sin_procesar.split("*", 1)
-                cantidad = _convertir_a_numero(partes[0].strip(), por_defecto=1)
-                codigo_producto = partes[1].strip()
-            except:
-                codigo_producto = codigo_sin_procesar.strip()
-        else:
-            codigo_producto = codigo_sin_procesar.strip()
-            cantidad = 1
-        
-        if codigo_producto not in inventario:
-            st.toast(f"❌ El {codigo_producto} no existe")
-            st.session_state.codigo = ""
-            return
-
-        stock_disp = stock_total(codigo_producto)
-        en_lista = st.session_state.lista.get(codigo_producto, 0)
-        
-        if (en_lista + cantidad) > stock_disp:
-            st.toast(f"⚠️ Stock insuficiente. Disponible: {stock_disp}")
-        else:
-            if codigo_producto in st.session_state.lista:
-                st.session_state.lista[codigo_producto] += cantidad
-            else:
-                st.session_state.lista[codigo_producto] = cantidad
-            st.toast(f"✅ Agregado: {codigo_producto}")
-
-        st.session_state.codigo = ""
-
-    st.text_input("🔢 Escanee código (Ej: 5*CODIGO para cantidad):", key="codigo", on_change=procesar_codigo_escaneado)
-
-    st.divider()
-    
-    c_lista, c_resumen = st.columns([2, 1])
-    
-    with c_lista:
-        st.markdown("### 🛒 Carrito de Salida")
-        if not st.session_state.lista:
-            st.info("El carrito está vacío.")
-        else:
-            for codigo, cant_lista in st.session_state.lista.items():
-                if codigo in inventario:
-                    nombre = inventario[codigo][0]['nombre']
-                    marca = inventario[codigo][0]['marca']
-                    st.markdown(f"- **{nombre}** ({marca}): `{cant_lista}` unidades")
-    
-    with c_resumen:
-        if st.session_state.lista:
-            total_items = sum(st.session_state.lista.values())
-            st.metric("Total Items", total_items)
-            
-            if st.button("🚀 Confirmar Salida", type="primary"):
-                for codigo_prod, cantidad_sacar in st.session_state.lista.items():
-                    if codigo_prod not in inventario: continue
-
-                    lotes_a_modificar = ordenar_lotes_fifo(inventario[codigo_prod])
-                    restante = cantidad_sacar
-                    nombre_prod = lotes_a_modificar[0]['nombre']
-
-                    lotes_finales = []
-                    for l in lotes_a_modificar:
-                        if restante > 0:
-                            toma = min(l['cantidad'], restante)
-                            l['cantidad'] -= toma
-                            restante -= toma
-                            registrar_movimiento("salida", codigo_prod, nombre_prod, toma, l.get('fecha_vencimiento',''), l.get('precio_costo'), l.get('precio_venta'))
-                        if l['cantidad'] > 0:
-                            lotes_finales.append(l)
-                    
-                    if not lotes_finales:
-                        if codigo_prod in inventario: del inventario[codigo_prod]
-                    else:
-                        inventario[codigo_prod] = lotes_finales
-                
-                guardar_inventario()
-                st.session_state.lista = {}
-                st.success("Salidas registradas correctamente!")
-                st.rerun() 
-
-# === TAB 3: MOSTRAR INVENTARIO ===
-with tab3:
-    st.subheader("📋 Inventario Completo")
-    
-    try:
-        sh = obtener_conexion()
-        ws_inv = sh.worksheet(INVENTARIO_WS)
-        data = ws_inv.get_all_values()
-        
-        if len(data) > 1:
-            df_inv = pd.DataFrame(data[1:], columns=data[0])
-            df_inv['cantidad'] = df_inv['cantidad'].apply(_convertir_a_numero)
-        else:
-            st.warning("Inventario vacío.")
-            df_inv = pd.DataFrame(columns=inventario_headers)
-
-        # Filtros y Estadísticas
-        c_search, c_metric1, c_metric2 = st.columns([2, 1, 1])
-        with c_search:
-            busqueda = st.text_input("🔍 Buscar en inventario:", key="search_inv", placeholder="Nombre, Marca o Código...")
-        
-        if busqueda:
-            busqueda_lower = busqueda.lower()
-            filtro = (df_inv['codigo'].astype(str).str.contains(busqueda_lower, case=False, na=False)) | \
-                     (df_inv['nombre'].astype(str).str.contains(busqueda_lower, case=False, na=False)) | \
-                     (df_inv['marca'].astype(str).str.contains(busqueda_lower, case=False, na=False))
-            df_filtrado = df_inv[filtro]
-        else:
-            df_filtrado = df_inv
-
-        with c_metric1:
-            st.metric("Total Productos", len(df_filtrado))
-        with c_metric2:
-            total_stock_view = df_filtrado['cantidad'].sum() if not df_filtrado.empty else 0
-            st.metric("Stock Total Unidades", total_stock_view)
-        
-        st.dataframe(
-            df_filtrado, 
-            use_container_width=True,
-            height=500,
-            hide_index=True,
-            column_config={
-                'codigo': st.column_config.TextColumn("Código"),
-                'nombre': st.column_config.TextColumn("Nombre"),
-                'marca': st.column_config.TextColumn("Marca"),
-                "fecha_vencimiento": st.column_config.TextColumn("Vencimiento", width="medium"),
-                "cantidad": st.column_config.NumberColumn("Stock", format="%d"),
-                "precio_costo": st.column_config.NumberColumn("Costo", format="$%d"),
-                "precio_venta": st.column_config.NumberColumn("Venta", format="$%d"),
-            }
-        )
-        
-    except Exception as e:
-        st.error(f"Error cargando inventario: {e}")
-
-# === TAB 4: REPORTE MOVIMIENTOS ===
-with tab4:
-    st.subheader("📊 Historial de Movimientos")
-    
-    # Filtros en un container expansible para limpieza visual
-    with st.expander("🛠️ Filtros de Búsqueda", expanded=True):
-        col_izq, col_der = st.columns(2)
-
-        with col_izq:
-            productos_lista = []
-            for codigo, lotes in inventario.items():
-                if lotes:
-                    base = lotes[0]
-                    productos_lista.append((codigo, base.get('nombre') or 'N/A', base.get('marca') or 'N/A'))
-            productos_lista.sort(key=lambda x: x[1])
-
-            opciones = [f"{i+1}) {nombre} - {marca} (Código: {codigo})" for i, (codigo, nombre, marca) in enumerate(productos_lista)]
-            opciones.insert(0, "Cancelar")
-            opciones.insert(1, 'Todos los productos')
-            seleccion = st.selectbox("Producto:", opciones, key="mov_prod_sel")
-
-            codigo_seleccionado = None
-            if seleccion != 'Cancelar' and seleccion != 'Todos los productos':
-                idx = opciones.index(seleccion) - 2
-                codigo_seleccionado = productos_lista[idx][0]
-            
-            tipo_movimiento = st.multiselect("Tipo:", ["entrada", "salida"], key="tipo_movimiento")
-
-        with col_der:
-            c_f1, c_f2 = st.columns(2)
-            with c_f1: fecha_inicio = st.date_input("Desde:", key="mov_f_ini")
-            with c_f2: fecha_fin = st.date_input("Hasta:", key="mov_f_fin")
-            
-            st.markdown("<br>", unsafe_allow_html=True)
-            btn_filtrar = st.button("🔎 Buscar Movimientos", type="primary")
-
-    if btn_filtrar:
-        if not movimientos:
-            st.info("No hay movimientos registrados.")
-        else:
-            try:
-                df = pd.DataFrame(movimientos, columns=movimientos_headers)
-                df['timestamp'] = pd.to_datetime(df['timestamp'], errors='coerce')
-                
-                fecha_inicio = pd.to_datetime(fecha_inicio)
-                fecha_fin = pd.to_datetime(fecha_fin) + pd.Timedelta(days=1)
-                
-                df_filtrado = df.loc[(df["timestamp"] >= fecha_inicio) & (df["timestamp"] < fecha_fin)].copy()
-                df_filtrado['cantidad'] = df_filtrado['cantidad'].apply(_convertir_a_numero)
-
-                if tipo_movimiento:
-                    df_filtrado = df_filtrado[df_filtrado['tipo'].isin(tipo_movimiento)]
-
-                if codigo_seleccionado is not None:
-                    df_filtrado = df_filtrado[df_filtrado['codigo'] == codigo_seleccionado]
-
-                # Visualización
-                c_graf, c_tabla = st.columns([1, 1])
-                
-                with c_graf:
-                    if 'entrada' in tipo_movimiento or not tipo_movimiento:
-                        df_e = df_filtrado[df_filtrado['tipo'] == 'entrada']
-                        if not df_e.empty:
-                            fig, ax = plt.subplots(figsize=(6, 4))
-                            ax.scatter(df_e["timestamp"], df_e["cantidad"], alpha=0.7, color='green')
-                            ax.set_title("Entradas")
-                            ax.tick_params(axis='x', rotation=45)
-                            st.pyplot(fig)
-                    
-                    if 'salida' in tipo_movimiento or not tipo_movimiento:
-                        df_s = df_filtrado[df_filtrado['tipo'] == 'salida']
-                        if not df_s.empty:
-                            fig2, ax2 = plt.subplots(figsize=(6, 4))
-                            ax2.scatter(df_s["timestamp"], df_s["cantidad"], alpha=0.7, color='red')
-                            ax2.set_title("Salidas")
-                            ax2.tick_params(axis='x', rotation=45)
-                            st.pyplot(fig2)
-
-                with c_tabla:
-                    df_filtrado['fecha'] = df_filtrado['timestamp'].dt.date
-                    df_filtrado['hora'] = df_filtrado['timestamp'].dt.time
-                    
-                    st.dataframe(
-                        df_filtrado[["fecha", "hora", "tipo", "nombre", "cantidad"]],
-                        hide_index=True,
-                        use_container_width=True
-                    )
-            except Exception as e:
-                st.error(f"Error procesando datos: {e}")
-
-# === TAB 5: STOCK ===
-with tab5:
-    st.subheader("📉 Niveles de Stock")
-
-    data_rows = []
-    for c, lotes in inventario.items():
-        if lotes:
-            base = lotes[0]
-            data_rows.append({
-                'codigo': c, 'nombre': base.get('nombre'), 'stock_total_calc': stock_total(c)
-            })
-    df_inv_sin_lotes = pd.DataFrame(data_rows)
-    
-    df_stock_min = pd.DataFrame(list(stock_minimo.items()), columns=['codigo', 'stock_min'])
-    df_stock_min['stock_min'] = df_stock_min['stock_min'].apply(_convertir_a_numero)
-    
-    if not df_inv_sin_lotes.empty:
-        df_reporte = pd.merge(df_stock_min, df_inv_sin_lotes, on='codigo', how='outer')
-        df_reporte['stock_total_calc'] = df_reporte['stock_total_calc'].fillna(0).astype(int)
-        df_reporte['stock_min'] = df_reporte['stock_min'].fillna(0).astype(int)
-        df_reporte['nombre'] = df_reporte['nombre'].fillna('Sin nombre')
-        df_reporte = df_reporte.dropna(subset=['codigo'])
-        df_reporte = df_reporte.drop_duplicates(subset=['codigo'])
-
-        def semaforo(fila):
-            total = fila['stock_total_calc']
-            minimo = fila['stock_min']
-            if total <= minimo: return "🔴 Crítico"
-            elif total <= 1.5*minimo: return "🟡 Advertencia"
-            else: return "🟢 Óptimo"
-
-        df_reporte['Estado'] = df_reporte.apply(semaforo, axis = 1)
-        df_reporte = df_reporte.sort_values(by=['Estado', 'stock_total_calc'])
-
-        # Métricas de resumen
-        c_crit, c_warn, c_ok = st.columns(3)
-        with c_crit: st.metric("🔴 Estado Crítico", len(df_reporte[df_reporte['Estado'] == "🔴 Crítico"]))
-        with c_warn: st.metric("🟡 Advertencia", len(df_reporte[df_reporte['Estado'] == "🟡 Advertencia"]))
-        with c_ok: st.metric("🟢 Óptimo", len(df_reporte[df_reporte['Estado'] == "🟢 Óptimo"]))
-
-        busqueda = st.text_input("🔍 Buscar código en reporte:", key="search_stock_min")
-        if busqueda:
-            df_reporte = df_reporte[df_reporte['codigo'].astype(str).str.contains(busqueda, case=False, na=False)]
-        
-        st.dataframe(
-            df_reporte, 
-            use_container_width=True,
-            hide_index=True,
-            column_config={
-                'codigo': "Código", 'nombre': "Nombre", "stock_min": "Minimo",
-                'stock_total_calc': "Actual", 'Estado': "Estado"
-            }
-        )
-    else:
-        st.warning("Sin datos de inventario.")
-
-# === TAB 6: VENCIMIENTOS ===
-with tab6:
-    st.subheader("⏰ Alertas de Vencimiento")
-    
-    with st.expander("⚙️ Configuración de Alertas", expanded=True):
-        col_v1, col_v2, col_v3 = st.columns(3)
-        alerta_critica = col_v1.slider("Días Críticos (🔴)", 0, 60, 3)
-        alerta_adv = col_v2.slider("Días Advertencia (🟡)", 0, 90, 7)
-        alerta_preventiva = col_v3.slider("Días Preventivos (🟠)", 0, 120, 12)
-
-    hoy = datetime.now().date()
-    alertas = []
-
-    for codigo, lotes in inventario.items():
-        for lote in lotes:
-            fv = lote.get("fecha_vencimiento")
-            estado = None
-            if fv:
-                try:
-                    fv_date = datetime.strptime(fv, "%Y-%m-%d").date()
-                    dias_restantes = (fv_date - hoy).days
-
-                    if dias_restantes < 0: estado = 'Vencido ❌'
-                    elif dias_restantes <= alerta_critica: estado = 'Alerta Crítica 🔴'
-                    elif  dias_restantes <= alerta_adv: estado = 'Alerta Advertencia 🟡'
-                    elif dias_restantes <= alerta_preventiva: estado = 'Alerta Preventiva 🟠'
-
-                    if estado:
-                        alertas.append({
-                            'Estado': estado, 'Fecha': fv, 'Días': dias_restantes,
-                            'Nombre': lote['nombre'], 'Cantidad': lote['cantidad'], 'Código': codigo
-                        })
-                except: pass
-
-    if alertas:
-        df_alertas = pd.DataFrame(alertas).sort_values(by='Días')
-        st.dataframe(
-            df_alertas, 
-            use_container_width=True, 
-            hide_index=True,
-            column_config={
-                "Días": st.column_config.NumberColumn("Días Restantes", format="%d"),
-                "Fecha": st.column_config.DateColumn("Vencimiento")
-            }
-        )
-    else:
-        st.success("✅ No hay productos próximos a vencer según los rangos seleccionados.")
-
+import os
+import streamlit as st
+import pandas as pd
+import gspread
+from datetime import datetime
+import matplotlib.pyplot as plt
+from almacenamiento import AlmacenamientoSheets, AlmacenamientoSQLite, INVENTARIO_WS, MOVIMIENTOS_WS
+from instantanea import Instantanea
+from escritura_diferida import ColaEscritura
+from modelo import CRITICO, ADVERTENCIA, OPTIMO
+from historial import nivel_para
+from archivos import leer_entregas
+import metricas
+from inventario import (
+    Inventario, ProductoInexistente, StockInsuficiente, interpretar_escaneo,
+    VENCIDO, VENCE_CRITICO, VENCE_ADVERTENCIA, VENCE_PREVENTIVO,
+)
+#xd
+# --- CONFIGURACIÓN DE LA PÁGINA ---
+st.set_page_config(
+    layout="wide", 
+    page_title="Inventario B&M", 
+    page_icon="📦",
+    initial_sidebar_state="collapsed"
+)
+
+# --- ESTILOS CUSTOM (CSS) ---
+st.markdown("""
+    <style>
+    .main {
+        background-color: #f8f9fa;
+    }
+    h1 {
+        color: #1f77b4;
+        text-align: center;
+        font-family: 'Helvetica', sans-serif;
+    }
+    h3 {
+        color: #4a4a4a;
+        border-bottom: 2px solid #e0e0e0;
+        padding-bottom: 10px;
+    }
+    .stButton>button {
+        width: 100%;
+        border-radius: 8px;
+        font-weight: bold;
+    }
+    div[data-testid="stMetricValue"] {
+        font-size: 1.5rem;
+    }
+    </style>
+    """, unsafe_allow_html=True)
+
+st.title("📦 Sistema de Gestión de Inventario B&M")
+st.markdown("---")
+
+# --- CONFIGURACIÓN GOOGLE SHEETS ---
+# Usamos el ID de tu hoja
+GOOGLE_SHEET_ID = "1Zu-Dq6UCYRKMTWNsxj8FsMzzpAdtvl-qb40CVEmwl44"
+
+# Backend de persistencia: 'sheets' (por defecto) o 'sqlite' para trabajar en disco local
+BACKEND = os.environ.get("INVENTARIO_BACKEND", "sheets")
+SQLITE_PATH = os.environ.get("INVENTARIO_SQLITE", "inventario.db")
+# Peticiones por minuto a la API de Sheets (la cuota de Google es 60 por usuario)
+CUOTA_SHEETS = int(os.environ.get("INVENTARIO_CUOTA_SHEETS", "60"))
+# Segundos entre comprobaciones de cambios hechos por otras terminales
+INTERVALO_REVISION = 10
+# Escritura diferida: las operaciones se confirman al instante y se guardan en segundo plano.
+# El diario local conserva lo no guardado si la app se reinicia.
+ESCRITURA_DIFERIDA = os.environ.get("INVENTARIO_ESCRITURA_DIFERIDA", "1") == "1"
+DIARIO_PATH = os.environ.get("INVENTARIO_DIARIO", "escrituras_pendientes.jsonl")
+# Copia local por columnas del log de movimientos; solo se descargan las filas nuevas
+CACHE_MOVIMIENTOS_PATH = os.environ.get("INVENTARIO_CACHE_MOVIMIENTOS", "movimientos_cache.npz")
+# Stock calculado desde el log de movimientos (la pestaña inventario queda como copia derivada),
+# con puntos de control locales para no recorrer todo el log al arrancar ni al consultar fechas pasadas
+STOCK_DESDE_MOVIMIENTOS = os.environ.get("INVENTARIO_STOCK_DESDE_MOVIMIENTOS", "0") == "1"
+PUNTOS_STOCK_PATH = os.environ.get("INVENTARIO_PUNTOS_STOCK", "stock_puntos.npz")
+# Un producto está en advertencia si su stock no supera FACTOR_ADVERTENCIA veces su mínimo
+FACTOR_ADVERTENCIA = float(os.environ.get("INVENTARIO_FACTOR_ADVERTENCIA", "1.5"))
+# Métricas de cada rerun (tiempos, llamadas y bytes de la API): una línea JSON por rerun en
+# INVENTARIO_METRICAS (si está definido) y en el log 'inventario.metricas' con nivel DEBUG.
+# El panel de rendimiento de la barra lateral se puede abrir por defecto con INVENTARIO_PANEL_RENDIMIENTO=1.
+METRICAS_PATH = os.environ.get("INVENTARIO_METRICAS", "")
+PANEL_RENDIMIENTO = os.environ.get("INVENTARIO_PANEL_RENDIMIENTO", "0") == "1"
+
+# --- MÉTRICAS ---
+
+@st.cache_resource
+def obtener_registro_metricas():
+    return metricas.RegistroMetricas(METRICAS_PATH)
+
+# Un rerun cortado por st.rerun()/st.stop() no llega al final: su ronda se escribe al empezar el siguiente
+_ronda_anterior = st.session_state.pop('ronda_metricas', None)
+if _ronda_anterior is not None:
+    obtener_registro_metricas().escribir(_ronda_anterior)
+ronda = metricas.Ronda("rerun")
+st.session_state['ronda_metricas'] = ronda
+metricas.activar(ronda)
+
+# --- CONEXIÓN ---
+
+@st.cache_resource(ttl=3600)
+def obtener_conexion():
+    """Conecta con Google Sheets usando st.secrets"""
+    try:
+        credentials = dict(st.secrets["gcp_service_account"])
+        
+        if "private_key" in credentials:
+            credentials["private_key"] = credentials["private_key"].replace("\\n", "\n")
+        
+        gc = gspread.service_account_from_dict(credentials)
+        sh = gc.open_by_key(GOOGLE_SHEET_ID)
+        return sh
+    except Exception as e:
+        st.error(f"Error de conexión: {e}. \n\nPosibles causas:\n1. El bot no tiene permiso de 'Editor' en la hoja.\n2. La API de Google Sheets no está habilitada en Google Cloud.")
+        st.stop()
+
+def obtener_almacenamiento():
+    """Devuelve el backend configurado en INVENTARIO_BACKEND"""
+    if BACKEND == "sqlite":
+        return AlmacenamientoSQLite(SQLITE_PATH)
+    return AlmacenamientoSheets(obtener_conexion(), peticiones_por_minuto=CUOTA_SHEETS)
+
+# La lógica vive en inventario.py; aquí solo se arma con la configuración de la app.
+# El inventario (datos en memoria, backend y cola de escritura) se comparte entre sesiones y reruns.
+@st.cache_resource
+def obtener_inventario():
+    alm = obtener_almacenamiento()
+    instantanea = Instantanea(
+        intervalo_revision=INTERVALO_REVISION, ruta_cache_movimientos=CACHE_MOVIMIENTOS_PATH,
+        ruta_puntos_stock=PUNTOS_STOCK_PATH
+    )
+    cola = ColaEscritura(alm, DIARIO_PATH) if ESCRITURA_DIFERIDA else None
+    return Inventario(alm, instantanea, cola, stock_desde_movimientos=STOCK_DESDE_MOVIMIENTOS)
+
+inventario = obtener_inventario()
+catalogo = inventario.catalogo
+
+ETIQUETAS_ESTADO = {CRITICO: "🔴 Crítico", ADVERTENCIA: "🟡 Advertencia", OPTIMO: "🟢 Óptimo"}
+ETIQUETAS_VENCIMIENTO = {
+    VENCIDO: 'Vencido ❌', VENCE_CRITICO: 'Alerta Crítica 🔴',
+    VENCE_ADVERTENCIA: 'Alerta Advertencia 🟡', VENCE_PREVENTIVO: 'Alerta Preventiva 🟠',
+}
+
+# --- INICIALIZACIÓN ---
+if st.sidebar.button("🔄 Recargar datos"):
+    inventario.invalidar()
+
+for aviso in inventario.sincronizar():
+    st.error(aviso)
+
+_cola = inventario.cola
+if _cola is not None:
+    estado_cola = _cola.estado()
+    if estado_cola['ultimo_error']:
+        st.warning(
+            f"⚠️ {estado_cola['pendientes']} operaciones sin guardar en el almacenamiento "
+            f"(intento {estado_cola['intentos']}): {estado_cola['ultimo_error']}"
+        )
+        if st.button("🔁 Reintentar guardado"):
+            _cola.reintentar()
+    elif estado_cola['pendientes']:
+        st.sidebar.info(f"⏳ {estado_cola['pendientes']} operaciones guardándose...")
+
+    if estado_cola['descartadas']:
+        with st.expander(f"❌ {estado_cola['descartadas']} operaciones no se pudieron guardar", expanded=True):
+            st.caption(
+                "Se quitaron del inventario en pantalla. Puede volver a intentar guardarlas "
+                "(se validan otra vez contra el stock actual) o descartarlas."
+            )
+            st.dataframe(pd.DataFrame(_cola.descartadas()), hide_index=True, use_container_width=True)
+            col_reenviar, col_borrar = st.columns(2)
+            if col_reenviar.button("🔁 Volver a intentar", key="reenviar_descartadas"):
+                _cola.reenviar_descartadas()
+                st.rerun()
+            if col_borrar.button("🗑️ Descartar", key="borrar_descartadas"):
+                _cola.borrar_descartadas()
+                st.rerun()
+
+_informe_carga = inventario.informe_carga
+if _informe_carga is not None and len(_informe_carga):
+    with st.sidebar.expander(f"⚠️ {len(_informe_carga)} datos inválidos"):
+        st.caption("Celdas que no se pudieron interpretar al cargar. Los lotes con cantidad inválida no se cargaron.")
+        st.dataframe(_informe_carga, hide_index=True)
+
+# --- INTERFAZ STREAMLIT ---
+# Tabs con iconos para mejor apariencia
+tab1, tab2, tab3, tab4, tab5, tab6 = st.tabs([
+    "📥 Entrada", "📤 Salida", "📋 Inventario", 
+    "📊 Historial", "📉 Stock Mínimo", "⏰ Vencimientos"
+])
+
+with tab1:
+    st.subheader("📥 Registro de Entradas")
+    
+    if 'reset_counter' not in st.session_state:
+        st.session_state.reset_counter = 0
+
+    input_key = f"entrada_input_{st.session_state.reset_counter}"
+    
+    # Diseño en columna central para búsqueda
+    col_search, _ = st.columns([1, 1])
+    with col_search:
+        entrada = st.text_input("🔍 Escanee código o escriba 'buscar': ", key=input_key)
+    
+    codigo_seleccionado = None
+    
+    if entrada:
+        if entrada.lower() == 'buscar':
+            productos_lista = inventario.productos_con_stock()
+
+            opciones = [f"{i+1}) {nombre} - {marca} (Código: {codigo})" 
+                                for i, (codigo, nombre, marca) in enumerate(productos_lista)]
+            
+            opciones.insert(0, "Cancelar")
+            seleccion = st.selectbox("Seleccione un producto", opciones)
+
+            if seleccion == 'Cancelar':
+                codigo_seleccionado = None
+            else:
+                idx = opciones.index(seleccion) - 1
+                codigo_seleccionado = productos_lista[idx][0]
+                st.success(f"✅ Seleccionado: {productos_lista[idx][1]}")
+        else:
+            codigo_seleccionado = entrada
+
+    if codigo_seleccionado:
+        base = catalogo.get(codigo_seleccionado)
+        es_nuevo = base is None
+        # Productos del catálogo sin nombre (p. ej. solo tenían stock mínimo) se completan aquí
+        editar_datos = es_nuevo or not base.nombre
+        
+        st.markdown("---")
+        if es_nuevo:
+            st.info(f"🆕 El código **{codigo_seleccionado}** es nuevo. Complete los datos.")
+        else:
+            st.success(f"📦 Editando: **{base.nombre}** ({base.marca})")
+        
+        with st.form("form_entrada", clear_on_submit = True):
+            # Layout de formulario en columnas
+            c1, c2 = st.columns(2)
+            
+            nombre_def = '' if es_nuevo else base.nombre
+            marca_def = '' if es_nuevo else base.marca
+            pc_def = 0 if es_nuevo else base.precio_costo
+            pv_def = 0 if es_nuevo else base.precio_venta
+            cant_min_def = 0 if es_nuevo or base.stock_minimo is None else base.stock_minimo
+            
+            with c1:
+                st.markdown("**Datos del Producto**")
+                nombre = st.text_input("Nombre", value = nombre_def, disabled = not editar_datos)
+                marca = st.text_input("Marca", value = marca_def, disabled = not editar_datos)
+                cantidad = st.number_input("Cantidad a ingresar", min_value = 0, value = 1, step = 1)
+                
+            with c2:
+                st.markdown("**Precios y Alertas**")
+                precio_costo = st.number_input("Precio Costo", min_value = 0, value = int(pc_def), disabled = not editar_datos)
+                precio_venta = st.number_input("Precio Venta", min_value = 0, value = int(pv_def), disabled = not editar_datos)
+                cant_min = st.number_input("Stock Mínimo", min_value = 0, value = int(cant_min_def))
+            
+            st.markdown("**Vencimiento**")
+            col_venc1, col_venc2 = st.columns(2)
+            with col_venc1:
+                aplica_vencimiento = st.checkbox("¿Tiene fecha de vencimiento?", value = True)
+            with col_venc2:
+                fecha_vencimiento = st.date_input("Fecha Vencimiento", value = datetime.now().date())
+
+            st.markdown("<br>", unsafe_allow_html=True)
+            submitted = st.form_submit_button("💾 Guardar Entrada", type="primary")
+
+            if submitted:
+                try:
+                    mensaje = inventario.registrar_entrada(
+                        codigo_seleccionado, cantidad, fecha_vencimiento if aplica_vencimiento else "",
+                        nombre, marca, precio_costo, precio_venta, stock_minimo=cant_min
+                    )
+                except Exception as e:
+                    st.error(f"Error guardando la operación: {e}")
+                else:
+                    st.success(mensaje) 
+                    st.session_state.reset_counter += 1
+                    st.rerun()
+
+    st.markdown("---")
+    with st.expander("📂 Carga masiva desde archivo (CSV / Excel)"):
+        st.caption(
+            "Columnas: codigo, cantidad y opcionalmente fecha_vencimiento, nombre, marca, "
+            "precio_costo, precio_venta, stock_min. Los códigos nuevos necesitan nombre."
+        )
+        if 'mensaje_importacion' in st.session_state:
+            st.success(st.session_state.pop('mensaje_importacion'))
+        archivo = st.file_uploader(
+            "Archivo de entrega", type=["csv", "xlsx"], key=f"archivo_entrega_{st.session_state.reset_counter}"
+        )
+        if archivo is not None:
+            try:
+                # Se lee y valida una vez por archivo subido, no en cada rerun
+                if st.session_state.get('entrega', (None,))[0] != archivo.file_id:
+                    with inventario.lock:
+                        existentes = set(catalogo)
+                    st.session_state.entrega = (archivo.file_id, *leer_entregas(archivo, archivo.name, existentes))
+                _, lotes_archivo, errores_archivo = st.session_state.entrega
+            except Exception as e:
+                st.error(f"No se pudo leer el archivo: {e}")
+            else:
+                c_ok, c_err = st.columns(2)
+                c_ok.metric("Lotes a ingresar", len(lotes_archivo))
+                c_err.metric("Filas con errores", len(errores_archivo))
+                if not errores_archivo.empty:
+                    st.dataframe(errores_archivo, hide_index=True, use_container_width=True)
+                if not lotes_archivo.empty and st.button("💾 Importar entradas", type="primary"):
+                    try:
+                        inventario.importar_lotes(lotes_archivo)
+                    except Exception as e:
+                        st.error(f"Error guardando la operación: {e}")
+                    else:
+                        st.session_state.mensaje_importacion = (
+                            f"Se ingresaron {int(lotes_archivo['cantidad'].sum())} unidades en {len(lotes_archivo)} lotes"
+                        )
+                        # Nuevo uploader vacío: el mismo archivo no se puede importar dos veces por error
+                        st.session_state.reset_counter += 1
+                        del st.session_state.entrega
+                        st.rerun()
+
+with tab2:
+    st.subheader("📤 Registro de Salidas")
+    
+    if "lista" not in st.session_state:
+        st.session_state.lista = {}
+
+    def procesar_codigo_escaneado():
+        codigo_sin_procesar = st.session_state.codigo
+        if not codigo_sin_procesar: return
+
+        codigo_producto, cantidad = interpretar_escaneo(codigo_sin_procesar)
+        st.session_state.codigo = ""
+        if not isinstance(cantidad, int) or cantidad <= 0:
+            st.toast(f"❌ Cantidad inválida: {codigo_sin_procesar}")
+            return
+        try:
+            inventario.agregar_a_salida(st.session_state.lista, codigo_producto, cantidad)
+        except ProductoInexistente:
+            st.toast(f"❌ El {codigo_producto} no existe")
+        except StockInsuficiente as e:
+            st.toast(f"⚠️ Stock insuficiente. Disponible: {e.disponible}")
+        else:
+            st.toast(f"✅ Agregado: {codigo_producto}")
+
+    # En modo ráfaga los escaneos se juntan en un formulario (sin rerun por cada uno)
+    # y se validan todos juntos al enviarlo
+    if st.toggle("⚡ Modo ráfaga", help="Escanee o pegue varios códigos seguidos, uno por línea, y agréguelos de una vez"):
+        with st.form("rafaga_salida", clear_on_submit=True):
+            texto_rafaga = st.text_area("🔢 Escaneos, uno por línea (Ej: 5*CODIGO para cantidad):", height=200)
+            enviar_rafaga = st.form_submit_button("➕ Agregar al carrito")
+        if enviar_rafaga and texto_rafaga:
+            agregados, rechazados = inventario.agregar_escaneos(st.session_state.lista, texto_rafaga)
+            if agregados:
+                st.toast(f"✅ Agregadas {sum(agregados.values())} unidades de {len(agregados)} productos")
+            if rechazados:
+                st.warning(f"⚠️ {len(rechazados)} escaneos no se agregaron:")
+                st.dataframe(pd.DataFrame(rechazados, columns=["Escaneo", "Motivo"]), hide_index=True)
+    else:
+        st.text_input("🔢 Escanee código (Ej: 5*CODIGO para cantidad):", key="codigo", on_change=procesar_codigo_escaneado)
+
+    st.divider()
+    
+    c_lista, c_resumen = st.columns([2, 1])
+    
+    with c_lista:
+        st.markdown("### 🛒 Carrito de Salida")
+        if not st.session_state.lista:
+            st.info("El carrito está vacío.")
+        else:
+            for codigo, cant_lista in st.session_state.lista.items():
+                if codigo in catalogo:
+                    nombre = catalogo[codigo].nombre
+                    marca = catalogo[codigo].marca
+                    st.markdown(f"- **{nombre}** ({marca}): `{cant_lista}` unidades")
+    
+    with c_resumen:
+        if st.session_state.lista:
+            total_items = sum(st.session_state.lista.values())
+            st.metric("Total Items", total_items)
+            
+            if st.button("🚀 Confirmar Salida", type="primary"):
+                try:
+                    inventario.confirmar_salida(st.session_state.lista)
+                except Exception as e:
+                    st.error(f"Error guardando la operación: {e}")
+                else:
+                    st.session_state.lista = {}
+                    st.success("Salidas registradas correctamente!")
+                    st.rerun() 
+
+# === TAB 3: MOSTRAR INVENTARIO ===
+with tab3, metricas.medir("pestaña.inventario"):
+    st.subheader("📋 Inventario Completo")
+    
+    try:
+        # Vista en memoria: no se vuelve a descargar ni a convertir la hoja en cada rerun
+        df_inv = inventario.df_inventario()
+        if df_inv.empty:
+            st.warning("Inventario vacío.")
+
+        # Filtros y Estadísticas
+        c_search, c_metric1, c_metric2 = st.columns([2, 1, 1])
+        with c_search:
+            busqueda = st.text_input("🔍 Buscar en inventario:", key="search_inv", placeholder="Nombre, Marca o Código...")
+        
+        if busqueda:
+            # El índice devuelve los códigos ordenados por relevancia (sin distinguir tildes)
+            orden = {codigo: i for i, codigo in enumerate(inventario.buscar(busqueda))}
+            df_filtrado = df_inv[df_inv['codigo'].isin(orden)]
+            df_filtrado = df_filtrado.sort_values('codigo', key=lambda s: s.map(orden), kind='stable')
+        else:
+            df_filtrado = df_inv
+
+        with c_metric1:
+            st.metric("Total Productos", len(df_filtrado))
+        with c_metric2:
+            total_stock_view = df_filtrado['cantidad'].sum() if not df_filtrado.empty else 0
+            st.metric("Stock Total Unidades", total_stock_view)
+        
+        st.dataframe(
+            df_filtrado, 
+            use_container_width=True,
+            height=500,
+            hide_index=True,
+            column_config={
+                'codigo': st.column_config.TextColumn("Código"),
+                'nombre': st.column_config.TextColumn("Nombre"),
+                'marca': st.column_config.TextColumn("Marca"),
+                "fecha_vencimiento": st.column_config.TextColumn("Vencimiento", width="medium"),
+                "cantidad": st.column_config.NumberColumn("Stock", format="%d"),
+                "precio_costo": st.column_config.NumberColumn("Costo", format="$%d"),
+                "precio_venta": st.column_config.NumberColumn("Venta", format="$%d"),
+            }
+        )
+        
+    except Exception as e:
+        st.error(f"Error cargando inventario: {e}")
+
+    with st.expander("⬇️ Exportar"):
+        formato = st.radio("Formato", ["csv", "xlsx"], horizontal=True, key="formato_exportar")
+        mime = "text/csv" if formato == "csv" else "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+        c_inv, c_mov = st.columns(2)
+        # Los archivos se generan recién al hacer clic
+        c_inv.download_button(
+            "📋 Inventario", data=lambda: inventario.exportar(INVENTARIO_WS, formato),
+            file_name=f"inventario.{formato}", mime=mime, on_click="ignore",
+        )
+        c_mov.download_button(
+            "📊 Movimientos", data=lambda: inventario.exportar(MOVIMIENTOS_WS, formato),
+            file_name=f"movimientos.{formato}", mime=mime, on_click="ignore",
+        )
+
+    with st.expander("🕰️ Stock a una fecha"):
+        # Se calcula solo al consultar (desde el log de movimientos, partiendo del punto de
+        # control más cercano) y el resultado queda en la sesión hasta la próxima consulta
+        with st.form("form_stock_al"):
+            fecha_stock = st.date_input("Stock al cierre del día", datetime.now().date(), key="fecha_stock")
+            if st.form_submit_button("Consultar"):
+                st.session_state.stock_al = (
+                    fecha_stock, inventario.stock_al(pd.Timestamp(fecha_stock) + pd.Timedelta(days=1))
+                )
+        if "stock_al" in st.session_state:
+            fecha_al, df_al = st.session_state.stock_al
+            if df_al.empty:
+                st.info(f"Sin stock registrado al {fecha_al:%d/%m/%Y}.")
+            else:
+                st.caption(f"Stock al cierre del {fecha_al:%d/%m/%Y}")
+                st.metric("Stock Total Unidades", int(df_al['cantidad'].sum()))
+                st.dataframe(
+                    df_al, use_container_width=True, hide_index=True,
+                    column_config={
+                        'codigo': "Código", 'nombre': "Nombre", 'fecha_vencimiento': "Vencimiento",
+                        'cantidad': st.column_config.NumberColumn("Stock", format="%d"),
+                    }
+                )
+
+# === TAB 4: REPORTE MOVIMIENTOS ===
+with tab4, metricas.medir("pestaña.historial"):
+    st.subheader("📊 Historial de Movimientos")
+    
+    # Filtros en un container expansible para limpieza visual
+    with st.expander("🛠️ Filtros de Búsqueda", expanded=True):
+        col_izq, col_der = st.columns(2)
+
+        with col_izq:
+            productos_lista = inventario.productos_con_stock()
+
+            opciones = [f"{i+1}) {nombre} - {marca} (Código: {codigo})" for i, (codigo, nombre, marca) in enumerate(productos_lista)]
+            opciones.insert(0, "Cancelar")
+            opciones.insert(1, 'Todos los productos')
+            seleccion = st.selectbox("Producto:", opciones, key="mov_prod_sel")
+
+            codigo_seleccionado = None
+            if seleccion != 'Cancelar' and seleccion != 'Todos los productos':
+                idx = opciones.index(seleccion) - 2
+                codigo_seleccionado = productos_lista[idx][0]
+            
+            tipo_movimiento = st.multiselect("Tipo:", ["entrada", "salida"], key="tipo_movimiento")
+            modo_grafico = st.radio("Gráfico:", ["Agregado", "Detalle"], horizontal=True, key="modo_grafico")
+
+        with col_der:
+            c_f1, c_f2 = st.columns(2)
+            with c_f1: fecha_inicio = st.date_input("Desde:", key="mov_f_ini")
+            with c_f2: fecha_fin = st.date_input("Hasta:", key="mov_f_fin")
+            
+            st.markdown("<br>", unsafe_allow_html=True)
+            btn_filtrar = st.button("🔎 Buscar Movimientos", type="primary")
+
+    if btn_filtrar:
+        if not len(inventario.movimientos):
+            st.info("No hay movimientos registrados.")
+        else:
+            try:
+                fecha_inicio = pd.to_datetime(fecha_inicio)
+                fecha_fin = pd.to_datetime(fecha_fin) + pd.Timedelta(days=1)
+                
+                # El historial está indexado por fecha, código y tipo: solo se leen las filas que coinciden
+                df_filtrado = inventario.consultar_movimientos(fecha_inicio, fecha_fin, tipo_movimiento, codigo_seleccionado)
+
+                # Visualización
+                c_graf, c_tabla = st.columns([1, 1])
+                
+                with c_graf:
+                    if modo_grafico == "Agregado":
+                        # Totales por hora/día/semana ya acumulados; la serie se reutiliza mientras no cambien los datos
+                        nivel = nivel_para(fecha_inicio, fecha_fin)
+                        df_serie = inventario.serie_movimientos(
+                            fecha_inicio, fecha_fin, nivel, tipo_movimiento, codigo_seleccionado
+                        )
+                        titulos = {'entrada': "Entradas", 'salida': "Salidas"}
+                        colores = {'entrada': "#2ca02c", 'salida': "#d62728"}
+                        por_nivel = {'hora': "por hora", 'dia': "por día", 'semana': "por semana"}
+                        for tipo in df_serie.columns:
+                            st.markdown(f"**{titulos.get(tipo, tipo)} {por_nivel[nivel]}**")
+                            st.bar_chart(df_serie[tipo], color=colores.get(tipo), height=250)
+
+                    else:
+                        if 'entrada' in tipo_movimiento or not tipo_movimiento:
+                            df_e = df_filtrado[df_filtrado['tipo'] == 'entrada']
+                            if not df_e.empty:
+                                fig, ax = plt.subplots(figsize=(6, 4))
+                                ax.scatter(df_e["timestamp"], df_e["cantidad"], alpha=0.7, color='green')
+                                ax.set_title("Entradas")
+                                ax.tick_params(axis='x', rotation=45)
+                                st.pyplot(fig)
+                    
+                        if 'salida' in tipo_movimiento or not tipo_movimiento:
+                            df_s = df_filtrado[df_filtrado['tipo'] == 'salida']
+                            if not df_s.empty:
+                                fig2, ax2 = plt.subplots(figsize=(6, 4))
+                                ax2.scatter(df_s["timestamp"], df_s["cantidad"], alpha=0.7, color='red')
+                                ax2.set_title("Salidas")
+                                ax2.tick_params(axis='x', rotation=45)
+                                st.pyplot(fig2)
+
+                with c_tabla:
+                    df_filtrado['fecha'] = df_filtrado['timestamp'].dt.date
+                    df_filtrado['hora'] = df_filtrado['timestamp'].dt.time
+                    
+                    st.dataframe(
+                        df_filtrado[["fecha", "hora", "tipo", "nombre", "cantidad"]],
+                        hide_index=True,
+                        use_container_width=True
+                    )
+            except Exception as e:
+                st.error(f"Error procesando datos: {e}")
+
+# === TAB 5: STOCK ===
+with tab5, metricas.medir("pestaña.stock"):
+    st.subheader("📉 Niveles de Stock")
+
+    factor = st.slider(
+        "Umbral de advertencia (veces el mínimo)", 1.0, 3.0, FACTOR_ADVERTENCIA, 0.1, key="factor_advertencia"
+    )
+    # Tabla y conteos calculados en bloque con NumPy; se reutilizan hasta que cambien los datos
+    df_reporte, conteo = inventario.reporte_niveles_stock(factor)
+    
+    if not df_reporte.empty:
+        df_reporte = df_reporte.assign(Estado=df_reporte['Estado'].map(ETIQUETAS_ESTADO))
+        c_crit, c_warn, c_ok = st.columns(3)
+        with c_crit: st.metric("🔴 Estado Crítico", conteo[CRITICO])
+        with c_warn: st.metric("🟡 Advertencia", conteo[ADVERTENCIA])
+        with c_ok: st.metric("🟢 Óptimo", conteo[OPTIMO])
+
+        busqueda = st.text_input("🔍 Buscar código en reporte:", key="search_stock_min")
+        if busqueda:
+            df_reporte = df_reporte[df_reporte['codigo'].astype(str).str.contains(busqueda, case=False, na=False)]
+        
+        st.dataframe(
+            df_reporte, 
+            use_container_width=True,
+            hide_index=True,
+            column_config={
+                'codigo': "Código", 'nombre': "Nombre", "stock_min": "Minimo",
+                'stock_total_calc': "Actual", 'Estado': "Estado"
+            }
+        )
+    else:
+        st.warning("Sin datos de inventario.")
+
+# === TAB 6: VENCIMIENTOS ===
+with tab6, metricas.medir("pestaña.vencimientos"):
+    st.subheader("⏰ Alertas de Vencimiento")
+    
+    with st.expander("⚙️ Configuración de Alertas", expanded=True):
+        col_v1, col_v2, col_v3 = st.columns(3)
+        alerta_critica = col_v1.slider("Días Críticos (🔴)", 0, 60, 3)
+        alerta_adv = col_v2.slider("Días Advertencia (🟡)", 0, 90, 7)
+        alerta_preventiva = col_v3.slider("Días Preventivos (🟠)", 0, 120, 12)
+
+    hoy = datetime.now().date().toordinal()
+    alertas = inventario.alertas_vencimiento(hoy, alerta_critica, alerta_adv, alerta_preventiva)
+
+    if alertas:
+        df_alertas = pd.DataFrame(alertas).rename(columns={
+            'estado': 'Estado', 'fecha_vencimiento': 'Fecha', 'dias': 'Días',
+            'nombre': 'Nombre', 'cantidad': 'Cantidad', 'codigo': 'Código',
+        })
+        df_alertas['Estado'] = df_alertas['Estado'].map(ETIQUETAS_VENCIMIENTO)
+        st.dataframe(
+            df_alertas, 
+            use_container_width=True, 
+            hide_index=True,
+            column_config={
+                "Días": st.column_config.NumberColumn("Días Restantes", format="%d"),
+                "Fecha": st.column_config.DateColumn("Vencimiento")
+            }
+        )
+    else:
+        st.success("✅ No hay productos próximos a vencer según los rangos seleccionados.")
+
+# --- PANEL DE RENDIMIENTO ---
+def _kb(n):
+    return f"{n / 1024:,.1f} KB"
+
+if st.sidebar.toggle("🐞 Rendimiento", value=PANEL_RENDIMIENTO, key="panel_rendimiento"):
+    resumen = ronda.resumen()
+    st.sidebar.caption(
+        f"Este rerun: {resumen['segundos'] * 1000:.0f} ms · {resumen['total_llamadas_api']} llamadas a la API "
+        f"({resumen['segundos_api'] * 1000:.0f} ms) · ↑ {_kb(resumen['bytes_enviados'])} ↓ {_kb(resumen['bytes_recibidos'])}"
+    )
+    st.sidebar.dataframe(
+        pd.DataFrame(
+            [(nombre, t['veces'], t['segundos'] * 1000) for nombre, t in resumen['tiempos'].items()],
+            columns=["Función", "Veces", "ms"]
+        ),
+        hide_index=True, column_config={"ms": st.column_config.NumberColumn(format="%.1f")}
+    )
+    if resumen['llamadas_api']:
+        st.sidebar.dataframe(
+            pd.DataFrame(sorted(resumen['llamadas_api'].items()), columns=["Llamada", "Veces"]), hide_index=True
+        )
+    # Acumulado desde que arrancó el proceso, incluido el guardado en segundo plano
+    total = metricas.TOTALES.resumen()
+    st.sidebar.caption(
+        f"Proceso: {total['total_llamadas_api']} llamadas a la API · ↑ {_kb(total['bytes_enviados'])} "
+        f"↓ {_kb(total['bytes_recibidos'])}"
+    )
+
+metricas.activar(None)
+st.session_state.pop('ronda_metricas', None)
+obtener_registro_metricas().escribir(ronda)
@@ -0,0 +1,218 @@
+import csv
+import io
+from datetime import date, datetime
+
+import numpy as np
+import pandas as pd
+from openpyxl import Workbook, load_workbook
+
+from busqueda import normalizar
+
+# Filas que se leen, validan o exportan por bloque
+TAMANO_BLOQUE = 5000
+
+# Columnas de un archivo de entregas; solo codigo y cantidad son obligatorias
+columnas_entrega = [
+    "codigo", "cantidad", "fecha_vencimiento", "nombre", "marca", "precio_costo", "precio_venta", "stock_min",
+]
+_OBLIGATORIAS = ("codigo", "cantidad")
+# Otros nombres de cabecera aceptados (ya normalizados)
+_ALIAS = {
+    "cod": "codigo", "cant": "cantidad", "unidades": "cantidad",
+    "vencimiento": "fecha_vencimiento", "fecha": "fecha_vencimiento",
+    "costo": "precio_costo", "venta": "precio_venta", "precio": "precio_venta",
+    "stock_minimo": "stock_min", "minimo": "stock_min",
+}
+
+
+def _nombre_columna(cabecera):
+    nombre = normalizar(cabecera).strip().replace(" ", "_")
+    return _ALIAS.get(nombre, nombre)
+
+
+def _texto_celda(valor):
+    """Celda de Excel como texto ('' si está vacía); las fechas quedan 'AAAA-MM-DD'"""
+    if valor is None: return ""
+    if isinstance(valor, (datetime, date)): return valor.strftime("%Y-%m-%d")
+    if isinstance(valor, float) and valor.is_integer(): return str(int(valor))
+    return str(valor)
+
+
+def _separador(archivo):
+    """',' o ';' según la primera línea (Excel en español exporta CSV con ';')"""
+    inicio = archivo.tell()
+    linea = archivo.readline()
+    archivo.seek(inicio)
+    if isinstance(linea, bytes):
+        linea = linea.decode("utf-8", errors="ignore")
+    return ";" if linea.count(";") > linea.count(",") else ","
+
+
+def leer_bloques(archivo, nombre_archivo, tamano=TAMANO_BLOQUE):
+    """Recorre un CSV o Excel de entregas en DataFrames de hasta `tamano` filas.
+
+    Todas las columnas vienen como texto y con los nombres de `columnas_entrega`
+    (las que falten, vacías). El archivo nunca se convierte entero en memoria.
+    """
+    if nombre_archivo.lower().endswith((".xlsx", ".xlsm")):
+        bloques = _bloques_excel(archivo, tamano)
+    else:
+        bloques = pd.read_csv(
+            archivo, sep=_separador(archivo), dtype=str, keep_default_na=False,
+            chunksize=tamano, encoding="utf-8-sig", skipinitialspace=True,
+        )
+    faltantes = None
+    for df in bloques:
+        df = df.rename(columns=_nombre_columna)
+        if faltantes is None:
+            faltantes = [c for c in _OBLIGATORIAS if c not in df.columns]
+            if faltantes:
+                raise ValueError(f"Faltan columnas obligatorias: {', '.join(faltantes)}")
+        yield df.reindex(columns=columnas_entrega, fill_value="")
+
+
+def _bloques_excel(archivo, tamano):
+    libro = load_workbook(archivo, read_only=True, data_only=True)
+    try:
+        filas = libro.active.iter_rows(values_only=True)
+        cabeceras = [_texto_celda(c) for c in next(filas, ())]
+        bloque = []
+        for fila in filas:
+            bloque.append([_texto_celda(c) for c in fila[:len(cabeceras)]])
+            if len(bloque) == tamano:
+                yield pd.DataFrame(bloque, columns=cabeceras)
+                bloque = []
+        if bloque:
+            yield pd.DataFrame(bloque, columns=cabeceras)
+    finally:
+        libro.close()
+
+
+def _fechas(textos):
+    """Texto -> 'AAAA-MM-DD' en bloque; acepta ISO (con o sin hora) y DD/MM/AAAA. NaN si es inválida"""
+    iso = pd.to_datetime(textos.str.slice(0, 10), format="%Y-%m-%d", errors="coerce")
+    local = pd.to_datetime(textos, format="%d/%m/%Y", errors="coerce")
+    return iso.fillna(local).dt.strftime("%Y-%m-%d")
+
+
+def validar_bloque(df, primera_fila=2):
+    """Valida un bloque de `leer_bloques` columna a columna.
+
+    `primera_fila` es el número de fila del archivo de la primera fila del
+    bloque. Devuelve (filas válidas con cantidad entera y fecha normalizada,
+    DataFrame de errores con fila, codigo y motivo).
+    """
+    codigo = df["codigo"].str.strip()
+    cantidad = pd.to_numeric(df["cantidad"].str.strip(), errors="coerce")
+    texto_fecha = df["fecha_vencimiento"].str.strip()
+    fecha = _fechas(texto_fecha)
+    # Vacío = el archivo no trae el dato; un texto que no es número (p. ej. "1,5") es un error
+    numeros, ilegibles = {}, {}
+    for col in ("precio_costo", "precio_venta", "stock_min"):
+        texto = df[col].str.strip()
+        numeros[col] = pd.to_numeric(texto, errors="coerce")
+        ilegibles[col] = (texto.ne("") & numeros[col].isna()).to_numpy()
+
+    motivo = np.select(
+        [
+            codigo.eq("").to_numpy(),
+            cantidad.isna().to_numpy(),
+            (cantidad <= 0).to_numpy() | (cantidad % 1 != 0).to_numpy(),
+            (texto_fecha.ne("") & fecha.isna()).to_numpy(),
+            ilegibles["precio_costo"] | ilegibles["precio_venta"],
+            ilegibles["stock_min"],
+        ],
+        [
+            "Código vacío", "Cantidad no numérica", "La cantidad debe ser un entero positivo",
+            "Fecha de vencimiento inválida", "Precio no numérico", "Stock mínimo no numérico",
+        ],
+        default="",
+    )
+    malas = motivo != ""
+    errores = pd.DataFrame({
+        "fila": np.flatnonzero(malas) + primera_fila,
+        "codigo": codigo[malas].to_numpy(),
+        "motivo": motivo[malas],
+    })
+
+    buenas = ~malas
+    validas = pd.DataFrame({
+        "fila": np.flatnonzero(buenas) + primera_fila,
+        "codigo": codigo[buenas].to_numpy(),
+        "cantidad": cantidad[buenas].astype("int64").to_numpy(),
+        "fecha_vencimiento": fecha[buenas].fillna("").to_numpy(),
+        "nombre": df["nombre"].str.strip()[buenas].to_numpy(),
+        "marca": df["marca"].str.strip()[buenas].to_numpy(),
+        "precio_costo": numeros["precio_costo"][buenas].fillna(0).to_numpy(),
+        "precio_venta": numeros["precio_venta"][buenas].fillna(0).to_numpy(),
+        # NaN = el archivo no trae stock mínimo para ese código
+        "stock_min": numeros["stock_min"][buenas].to_numpy(),
+    })
+    return validas, errores
+
+
+def leer_entregas(archivo, nombre_archivo, existentes, tamano=TAMANO_BLOQUE):
+    """Lee y valida un archivo completo por bloques.
+
+    `existentes` son los códigos que ya están en el catálogo: un código nuevo
+    necesita nombre en alguna de sus filas. Devuelve (lotes, errores). En
+    `lotes` las filas con el mismo código y vencimiento se suman en una sola
+    (es el mismo lote, igual que en una entrada manual); nombre y marca son los
+    primeros no vacíos del código y precios el primero del lote.
+    """
+    validas, errores = [], []
+    primera_fila = 2  # la fila 1 es la cabecera
+    for df in leer_bloques(archivo, nombre_archivo, tamano):
+        buenas, malas = validar_bloque(df, primera_fila)
+        validas.append(buenas)
+        errores.append(malas)
+        primera_fila += len(df)
+
+    vacio = pd.DataFrame(columns=columnas_entrega, dtype=str)
+    lotes = pd.concat(validas, ignore_index=True) if validas else validar_bloque(vacio)[0]
+    errores = pd.concat(errores, ignore_index=True) if errores else validar_bloque(vacio)[1]
+
+    for col in ("nombre", "marca"):
+        lotes[col] = lotes[col].replace("", np.nan).groupby(lotes["codigo"]).transform("first")
+    sin_nombre = (lotes["nombre"].isna() & ~lotes["codigo"].isin(existentes)).to_numpy()
+    if sin_nombre.any():
+        errores = pd.concat([errores, pd.DataFrame({
+            "fila": lotes["fila"][sin_nombre], "codigo": lotes["codigo"][sin_nombre],
+            "motivo": "Producto nuevo sin nombre",
+        })], ignore_index=True).sort_values("fila", ignore_index=True)
+        lotes = lotes[~sin_nombre]
+
+    lotes = lotes.groupby(["codigo", "fecha_vencimiento"], sort=False, as_index=False).agg({
+        "cantidad": "sum", "nombre": "first", "marca": "first",
+        "precio_costo": "first", "precio_venta": "first", "stock_min": "last",
+    })
+    for col in ("nombre", "marca"):
+        lotes[col] = lotes[col].fillna("")
+    return lotes, errores
+
+
+def exportar_csv(cabeceras, filas, tamano=TAMANO_BLOQUE):
+    """Genera el CSV (UTF-8 con BOM, para que Excel respete las tildes) en trozos de bytes"""
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer)
+    buffer.write("﻿")
+    escritor.writerow(cabeceras)
+    for i, fila in enumerate(filas, start=1):
+        escritor.writerow(fila)
+        if i % tamano == 0:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode("utf-8")
+
+
+def exportar_excel(cabeceras, filas, titulo="datos"):
+    """Libro .xlsx escrito fila a fila (modo write_only de openpyxl); devuelve los bytes"""
+    libro = Workbook(write_only=True)
+    hoja = libro.create_sheet(titulo)
+    hoja.append(cabeceras)
+    for fila in filas:
+        hoja.append(list(fila))
+    salida = io.BytesIO()
+    libro.save(salida)
+    return salida.getvalue()
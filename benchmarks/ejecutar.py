@@ -0,0 +1,171 @@
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from datetime import date
+
+import pandas as pd
+
+from almacenamiento import AlmacenamientoSheets
+from benchmarks.generador import generar, libro_con_datos
+from instantanea import Instantanea
+from inventario import Inventario
+
+# Productos por tamaño (cada producto trae ~3 lotes y ~9 movimientos)
+TAMANOS = [1000, 10000, 100000]
+REFERENCIA_PATH = os.path.join(os.path.dirname(__file__), "referencia.json")
+# Una operación es una regresión si tarda más que (1 + TOLERANCIA) veces la
+# referencia y al menos MARGEN_MINIMO segundos más, o si hace más llamadas
+TOLERANCIA = 0.5
+MARGEN_MINIMO = 0.005
+
+
+def _nuevo_inventario(libro):
+    # Sin límite de tasa: se mide el trabajo, no las esperas por cuota
+    return Inventario(AlmacenamientoSheets(libro, peticiones_por_minuto=None), Instantanea(intervalo_revision=0))
+
+
+def _medir(libro, funcion, repeticiones, preparar=None):
+    """Mediana de segundos y llamadas a la API (de la última repetición) de `funcion`.
+
+    Si hay `preparar`, se llama fuera de la medición y su resultado se pasa a `funcion`.
+    Antes de medir se hace una vuelta sin cronometrar, para que lo que se arma
+    en el primer uso (p. ej. el índice de consultas del historial) no cuente
+    como parte de la operación aunque haya pocas repeticiones.
+    """
+    argumento = preparar() if preparar else None
+    funcion(argumento) if preparar else funcion()
+    tiempos = []
+    for _ in range(repeticiones):
+        argumento = preparar() if preparar else None
+        libro.llamadas.clear()
+        inicio = time.perf_counter()
+        funcion(argumento) if preparar else funcion()
+        tiempos.append(time.perf_counter() - inicio)
+    return {'segundos': statistics.median(tiempos), 'llamadas': dict(sorted(libro.llamadas.items()))}
+
+
+def medir_tamano(n_productos, repeticiones=5, semilla=0):
+    """Resultados {operación: {'segundos', 'llamadas'}} para un catálogo de `n_productos`"""
+    datos = generar(n_productos, semilla=semilla)
+    libro = libro_con_datos(datos)
+    codigos = [fila[0] for fila in datos['catalogo']]
+    hoy = date.today().toordinal()
+    resultados = {}
+
+    # Carga completa en frío (cada repetición con una instantánea vacía)
+    resultados['cargar'] = _medir(
+        libro, lambda inv: inv.cargar(), repeticiones, lambda: _nuevo_inventario(libro)
+    )
+
+    inv = _nuevo_inventario(libro)
+    inv.cargar()
+    # Comprobación de cambios de otra terminal (lo que paga cada rerun pasado el intervalo)
+    resultados['sincronizar_sin_cambios'] = _medir(libro, inv.sincronizar, repeticiones)
+
+    contador = iter(range(10**9))
+    resultados['entrada'] = _medir(
+        libro, lambda: inv.registrar_entrada(codigos[0], 5, f"2031-01-{next(contador) % 28 + 1:02d}"), repeticiones
+    )
+    resultados['salida_20_productos'] = _medir(
+        libro, lambda carrito: inv.confirmar_salida(carrito), repeticiones,
+        lambda: {c: 1 for c in codigos[1:21]}
+    )
+    resultados['importar_100_lotes'] = _medir(
+        libro, inv.importar_lotes, repeticiones, lambda: _lotes_importacion(codigos, 100, next(contador))
+    )
+
+    # Reportes sin caché: se fuerza una versión nueva antes de cada repetición
+    resultados['reporte_stock'] = _medir(
+        libro, lambda _: inv.reporte_niveles_stock(1.5), repeticiones, inv.instantanea.marcar_escritura
+    )
+    resultados['df_inventario'] = _medir(
+        libro, lambda _: inv.df_inventario(), repeticiones, inv.instantanea.marcar_escritura
+    )
+    resultados['alertas_vencimiento'] = _medir(
+        libro, lambda: inv.alertas_vencimiento(hoy, 3, 7, 12), repeticiones
+    )
+    resultados['consulta_historial_30_dias'] = _medir(
+        libro, lambda: inv.consultar_movimientos(pd.Timestamp.today().normalize() - pd.Timedelta(days=30)),
+        repeticiones
+    )
+    return resultados
+
+
+def _lotes_importacion(codigos, n, ronda):
+    return pd.DataFrame({
+        'codigo': codigos[:n], 'fecha_vencimiento': f"2032-{ronda % 12 + 1:02d}-01", 'cantidad': 10,
+        'nombre': "", 'marca': "", 'precio_costo': 0.0, 'precio_venta': 0.0, 'stock_min': float('nan'),
+    })
+
+
+def comparar(resultados, referencia, tolerancia=TOLERANCIA):
+    """Lista de textos con las regresiones de `resultados` frente a `referencia`"""
+    regresiones = []
+    for tamano, operaciones in resultados.items():
+        for nombre, actual in operaciones.items():
+            base = referencia.get(tamano, {}).get(nombre)
+            if base is None: continue
+            if actual['segundos'] > base['segundos'] * (1 + tolerancia) + MARGEN_MINIMO:
+                regresiones.append(
+                    f"{tamano} {nombre}: {actual['segundos'] * 1000:.1f} ms (referencia {base['segundos'] * 1000:.1f} ms)"
+                )
+            llamadas, llamadas_base = sum(actual['llamadas'].values()), sum(base['llamadas'].values())
+            if llamadas > llamadas_base:
+                regresiones.append(f"{tamano} {nombre}: {llamadas} llamadas (referencia {llamadas_base})")
+    return regresiones
+
+
+def _imprimir(tamano, resultados):
+    print(f"\n== {tamano} productos")
+    for nombre, r in resultados.items():
+        detalle = ", ".join(f"{k}={v}" for k, v in r['llamadas'].items())
+        print(f"  {nombre:<28} {r['segundos'] * 1000:>10.2f} ms  {sum(r['llamadas'].values()):>4} llamadas  {detalle}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Mide tiempos y llamadas a la API de las operaciones del inventario sobre una hoja falsa."
+    )
+    parser.add_argument("--tamanos", type=int, nargs="+", default=TAMANOS, help="productos del catálogo generado")
+    parser.add_argument("--repeticiones", type=int, default=5)
+    parser.add_argument("--semilla", type=int, default=0)
+    parser.add_argument("--referencia", default=REFERENCIA_PATH)
+    parser.add_argument("--tolerancia", type=float, default=TOLERANCIA)
+    parser.add_argument("--guardar-referencia", action="store_true", help="guarda estos resultados como referencia")
+    args = parser.parse_args(argv)
+
+    resultados = {}
+    for tamano in args.tamanos:
+        resultados[str(tamano)] = medir_tamano(tamano, args.repeticiones, args.semilla)
+        _imprimir(tamano, resultados[str(tamano)])
+
+    if args.guardar_referencia:
+        referencia = {}
+        if os.path.exists(args.referencia):
+            with open(args.referencia, encoding="utf-8") as f:
+                referencia = json.load(f)
+        referencia.update(resultados)
+        with open(args.referencia, "w", encoding="utf-8") as f:
+            json.dump(referencia, f, indent=2, sort_keys=True)
+        print(f"\nReferencia guardada en {args.referencia}")
+        return 0
+
+    if not os.path.exists(args.referencia):
+        print("\nSin referencia guardada: use --guardar-referencia para crearla")
+        return 0
+    with open(args.referencia, encoding="utf-8") as f:
+        regresiones = comparar(resultados, json.load(f), args.tolerancia)
+    if regresiones:
+        print("\nRegresiones:")
+        for r in regresiones:
+            print("  " + r)
+        return 1
+    print("\nSin regresiones frente a la referencia")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,73 @@
+from datetime import date
+
+import numpy as np
+
+from almacenamiento import CATALOGO_WS, CONTROL_WS, INVENTARIO_WS, MOVIMIENTOS_WS, TABLAS
+from benchmarks.hoja_falsa import LibroFalso
+
+_MARCAS = ["Colun", "Soprole", "Nestlé", "Carozzi", "Lucchetti", "Ideal", "Watts", "Ariel", "Omo", "Bilz"]
+_NOMBRES = ["Leche", "Yogurt", "Queso", "Fideos", "Arroz", "Pan", "Jugo", "Detergente", "Galletas", "Café"]
+
+
+def generar(n_productos, lotes_por_producto=3, n_movimientos=None, semilla=0, hoy=None):
+    """Datos sintéticos reproducibles con el formato de las tablas del almacenamiento.
+
+    Devuelve {tabla: filas de texto sin cabecera}. Cada producto tiene entre 1
+    y 2 * `lotes_por_producto` - 1 lotes con vencimientos distintos desde 30
+    días atrás (el último, en uno de cada diez productos, sin fecha); el log
+    de movimientos (por defecto 3 por lote) abarca el último año, en orden.
+    """
+    rng = np.random.default_rng(semilla)
+    hoy = hoy or date.today()
+
+    codigos = [f"P{i:07d}" for i in range(n_productos)]
+    nombres = rng.choice(_NOMBRES, n_productos)
+    marcas = rng.choice(_MARCAS, n_productos)
+    costos = rng.integers(100, 5000, n_productos)
+    ventas = (costos * rng.uniform(1.1, 1.8, n_productos)).astype(np.int64)
+    minimos = rng.integers(0, 30, n_productos)
+    catalogo = [
+        [c, f"{n} {i}", m, str(pc), str(pv), str(mn)]
+        for i, (c, n, m, pc, pv, mn) in enumerate(zip(
+            codigos, nombres.tolist(), marcas.tolist(), costos.tolist(), ventas.tolist(), minimos.tolist()
+        ))
+    ]
+
+    n_lotes = rng.integers(1, 2 * lotes_por_producto, n_productos)
+    producto = np.repeat(np.arange(n_productos), n_lotes)
+    inicios = np.cumsum(n_lotes) - n_lotes
+    # Vencimientos distintos dentro de cada producto: suma acumulada de saltos de 1 a 39 días
+    saltos = rng.integers(1, 40, len(producto))
+    acumulado = np.cumsum(saltos)
+    dias = acumulado - np.repeat(acumulado[inicios] - saltos[inicios], n_lotes) - 30
+    ultimo = np.arange(len(producto)) == np.repeat(inicios + n_lotes - 1, n_lotes)
+    sin_fecha = ultimo & (rng.random(len(producto)) < 0.1)
+    fechas = np.where(sin_fecha, "", np.datetime_as_string(np.datetime64(hoy, 'D') + dias, unit='D'))
+    inventario = [
+        [codigos[p], str(cant), fv, f"v{i:012x}"]
+        for i, (p, cant, fv) in enumerate(zip(
+            producto.tolist(), rng.integers(1, 200, len(producto)).tolist(), fechas.tolist()
+        ))
+    ]
+
+    n_movimientos = 3 * len(inventario) if n_movimientos is None else n_movimientos
+    segundos = np.sort(rng.integers(0, 365 * 86400, n_movimientos))
+    inicio_log = np.datetime64(hoy, 's') - np.timedelta64(365, 'D')
+    timestamps = np.datetime_as_string(inicio_log + segundos, unit='s')
+    tipos = np.where(rng.random(n_movimientos) < 0.4, "entrada", "salida")
+    mov_producto = rng.integers(0, n_productos, n_movimientos)
+    cantidades = rng.integers(1, 20, n_movimientos)
+    movimientos = [
+        [ts, t, codigos[p], catalogo[p][1], str(c), "", catalogo[p][3], catalogo[p][4]]
+        for ts, t, p, c in zip(timestamps.tolist(), tipos.tolist(), mov_producto.tolist(), cantidades.tolist())
+    ]
+    return {CATALOGO_WS: catalogo, INVENTARIO_WS: inventario, MOVIMIENTOS_WS: movimientos}
+
+
+def libro_con_datos(datos, latencia=0.0):
+    """`LibroFalso` con las pestañas (y la celda de revisión) ya cargadas con `datos`"""
+    libro = LibroFalso(latencia)
+    for tabla, filas in datos.items():
+        libro.cargar_filas(tabla, [TABLAS[tabla]['cabeceras']] + filas)
+    libro.cargar_filas(CONTROL_WS, [["revision", "inicial"]])
+    return libro
@@ -0,0 +1,200 @@
+import re
+import time
+from collections import Counter, deque
+
+_CELDA = re.compile(r"([A-Z]+)(\d*)")
+
+
+def _columna(letras):
+    n = 0
+    for c in letras:
+        n = n * 26 + ord(c) - ord('A') + 1
+    return n
+
+
+def _rango(a1):
+    """'A2:H' -> (fila_ini, col_ini, fila_fin o None, col_fin), todo en base 1"""
+    ini, _, fin = a1.partition(":")
+    letras, fila = _CELDA.fullmatch(ini).groups()
+    fila_ini, col_ini = int(fila or 1), _columna(letras)
+    if not fin:
+        return fila_ini, col_ini, fila_ini, col_ini
+    letras, fila = _CELDA.fullmatch(fin).groups()
+    return fila_ini, col_ini, int(fila) if fila else None, _columna(letras)
+
+
+class HojaFalsa:
+    def __init__(self, libro, title, rows=100, cols=26):
+        self._libro = libro
+        self.title = title
+        self.row_count = rows
+        self.col_count = cols
+        self._filas = []
+
+    def _llamada(self, nombre):
+        self._libro._llamada(nombre)
+
+    def _fijar(self, nro, col, valores):
+        while len(self._filas) < nro:
+            self._filas.append([])
+        fila = self._filas[nro - 1]
+        if len(fila) < col - 1 + len(valores):
+            fila.extend([""] * (col - 1 + len(valores) - len(fila)))
+        fila[col - 1:col - 1 + len(valores)] = ["" if v is None else str(v) for v in valores]
+
+    def _leer(self, fila_ini, col_ini, fila_fin, col_fin):
+        fin = len(self._filas) if fila_fin is None else min(fila_fin, len(self._filas))
+        filas = [self._filas[i][col_ini - 1:col_fin] for i in range(fila_ini - 1, fin)]
+        while filas and not any(filas[-1]):
+            filas.pop()
+        return filas
+
+    # --- API ---
+
+    def row_values(self, nro):
+        self._llamada('row_values')
+        return list(self._filas[nro - 1]) if nro <= len(self._filas) else []
+
+    def get_all_values(self):
+        self._llamada('get_all_values')
+        ancho = max((len(f) for f in self._filas), default=0)
+        filas = [f + [""] * (ancho - len(f)) for f in self._filas]
+        while filas and not any(filas[-1]):
+            filas.pop()
+        return filas
+
+    def get(self, rango):
+        self._llamada('get')
+        return self._leer(*_rango(rango))
+
+    def batch_get(self, rangos):
+        self._llamada('batch_get')
+        return [self._leer(*_rango(r)) for r in rangos]
+
+    def batch_update(self, datos, value_input_option=None):
+        self._llamada('batch_update')
+        for dato in datos:
+            fila_ini, col_ini, _, _ = _rango(dato['range'])
+            if fila_ini + len(dato['values']) - 1 > self.row_count:
+                raise ValueError("El rango excede el tamaño de la hoja")
+            for i, valores in enumerate(dato['values']):
+                self._fijar(fila_ini + i, col_ini, valores)
+
+    def append_row(self, valores, value_input_option=None):
+        self._llamada('append_row')
+        self._agregar([valores])
+
+    def append_rows(self, filas, value_input_option=None):
+        self._llamada('append_rows')
+        self._agregar(filas)
+
+    def _agregar(self, filas):
+        ultima = len(self._filas)
+        while ultima and not any(self._filas[ultima - 1]):
+            ultima -= 1
+        del self._filas[ultima:]
+        for valores in filas:
+            self._filas.append(["" if v is None else str(v) for v in valores])
+        self.row_count = max(self.row_count, len(self._filas))
+
+    def clear(self):
+        self._llamada('clear')
+        self._filas = []
+
+    def add_rows(self, n):
+        self._llamada('add_rows')
+        self.row_count += n
+
+
+class ErrorCuota(Exception):
+    """Como el `APIError` de gspread con una respuesta 429 (cuota excedida)"""
+
+    code = 429
+
+    def __init__(self):
+        super().__init__("Quota exceeded for quota metric 'Read requests'")
+        self.response = type("Respuesta", (), {'status_code': 429, 'headers': {}})()
+
+
+class LibroFalso:
+    """Imitación en memoria de `gspread.Spreadsheet` (y sus `Worksheet`) que cuenta las llamadas.
+
+    Implementa solo lo que usa `AlmacenamientoSheets`. Cada método de la API
+    equivale a una petición a Google, así que `llamadas` (un Counter por nombre
+    de método) dice cuántas peticiones hace cada operación. Con `latencia` se
+    suma una espera fija por petición. Con `cuota`, una petición que supera
+    esa cantidad en los últimos `ventana` segundos falla con `ErrorCuota`
+    (y se cuenta en `rechazadas`), como la cuota por minuto de Google.
+    """
+
+    def __init__(self, latencia=0.0, cuota=None, ventana=60.0):
+        self.id = "libro-falso"
+        self.latencia = latencia
+        self.cuota = cuota
+        self.ventana = ventana
+        self.llamadas = Counter()
+        self.rechazadas = 0
+        self._recientes = deque()
+        self._hojas = {}
+
+    def _llamada(self, nombre):
+        if self.cuota is not None:
+            ahora = time.monotonic()
+            while self._recientes and self._recientes[0] <= ahora - self.ventana:
+                self._recientes.popleft()
+            if len(self._recientes) >= self.cuota:
+                self.rechazadas += 1
+                raise ErrorCuota()
+            self._recientes.append(ahora)
+        self.llamadas[nombre] += 1
+        if self.latencia:
+            time.sleep(self.latencia)
+
+    def hoja(self, titulo):
+        """Acceso directo a una pestaña, sin contar una llamada (para preparar datos)"""
+        return self._hojas[titulo]
+
+    def cargar_filas(self, titulo, filas):
+        """Crea o reemplaza una pestaña con `filas` (cabecera incluida) sin contar llamadas"""
+        hoja = self._hojas.get(titulo) or HojaFalsa(self, titulo)
+        hoja._filas = [[str(v) for v in f] for f in filas]
+        hoja.row_count = max(100, len(filas))
+        self._hojas[titulo] = hoja
+        return hoja
+
+    # --- API ---
+
+    def worksheets(self):
+        self._llamada('worksheets')
+        return list(self._hojas.values())
+
+    def worksheet(self, titulo):
+        self._llamada('worksheet')
+        return self._hojas[titulo]
+
+    def add_worksheet(self, title, rows, cols):
+        self._llamada('add_worksheet')
+        self._hojas[title] = HojaFalsa(self, title, rows, cols)
+        return self._hojas[title]
+
+    def values_get(self, rango):
+        self._llamada('values_get')
+        titulo, _, celdas = rango.partition("!")
+        filas = self._hojas[titulo]._leer(*_rango(celdas))
+        return {'values': filas} if filas else {}
+
+    def values_batch_get(self, rangos, params=None):
+        self._llamada('values_batch_get')
+        respuesta = []
+        for rango in rangos:
+            titulo, _, celdas = rango.partition("!")
+            filas = self._hojas[titulo]._leer(*_rango(celdas))
+            respuesta.append({'range': rango, 'values': filas} if filas else {'range': rango})
+        return {'valueRanges': respuesta}
+
+    def values_update(self, rango, params=None, body=None):
+        self._llamada('values_update')
+        titulo, _, celdas = rango.partition("!")
+        fila_ini, col_ini, _, _ = _rango(celdas)
+        for i, valores in enumerate(body['values']):
+            self._hojas[titulo]._fijar(fila_ini + i, col_ini, valores)
@@ -0,0 +1,142 @@
+import unicodedata
+from collections import defaultdict
+
+# Largo máximo de los fragmentos indexados; consultas más largas se filtran
+# con sus fragmentos de este largo y se verifican contra el texto
+_LARGO_NGRAMA = 3
+# Consultas recientes que se recuerdan (un rerun repite la misma búsqueda)
+_MAX_CONSULTAS = 32
+
+
+def normalizar(texto) -> str:
+    """Minúsculas y sin tildes: 'Pañal ÁCIDO' -> 'panal acido'"""
+    texto = unicodedata.normalize("NFKD", str(texto or "")).lower()
+    return "".join(c for c in texto if not unicodedata.combining(c))
+
+
+def _ngramas(texto, largo):
+    return {texto[i:i + largo] for i in range(len(texto) - largo + 1)}
+
+
+class IndiceBusqueda:
+    """Búsqueda por código, nombre y marca sin distinguir mayúsculas ni tildes.
+
+    Cada producto aporta los fragmentos de 1 a 3 caracteres de sus campos
+    normalizados; una palabra buscada se resuelve intersectando los conjuntos
+    de sus fragmentos y verificando la subcadena solo en esos candidatos. Si la
+    consulta tiene varias palabras, todas deben aparecer (en cualquier campo).
+    Los resultados se ordenan por relevancia: código exacto, código que empieza
+    igual, palabra del nombre que empieza igual, resto. Las últimas consultas
+    se recuerdan hasta el próximo cambio del índice.
+
+    `reconstruir` no indexa nada: el índice se arma recién en la primera
+    búsqueda, así una recarga que nadie usa para buscar no lo paga.
+    """
+
+    def __init__(self):
+        self._campos = {}
+        self._palabras = {}
+        self._fragmentos = defaultdict(set)
+        self._consultas = {}
+        self._por_indexar = None  # catálogo pendiente de indexar (ver `reconstruir`)
+
+    def __len__(self):
+        self._indexar_pendiente()
+        return len(self._campos)
+
+    def clear(self):
+        self._por_indexar = None
+        self._campos.clear()
+        self._palabras.clear()
+        self._fragmentos.clear()
+        self._consultas.clear()
+
+    def _fragmentos_de(self, campos):
+        fragmentos = set()
+        for campo in campos:
+            for largo in range(1, _LARGO_NGRAMA + 1):
+                fragmentos |= _ngramas(campo, largo)
+        return fragmentos
+
+    def registrar(self, producto):
+        """Agrega (o reindexa) un producto"""
+        if self._por_indexar is not None:
+            return  # se indexa con el resto en la primera búsqueda
+        self.quitar(producto.codigo)
+        campos = (normalizar(producto.codigo), normalizar(producto.nombre), normalizar(producto.marca))
+        self._campos[producto.codigo] = campos
+        self._palabras[producto.codigo] = (campos[1].split(), campos[2].split())
+        for fragmento in self._fragmentos_de(campos):
+            self._fragmentos[fragmento].add(producto.codigo)
+
+    def quitar(self, codigo):
+        self._consultas.clear()
+        if self._por_indexar is not None:
+            return
+        campos = self._campos.pop(codigo, None)
+        if campos is None: return
+        del self._palabras[codigo]
+        for fragmento in self._fragmentos_de(campos):
+            codigos = self._fragmentos[fragmento]
+            codigos.discard(codigo)
+            if not codigos:
+                del self._fragmentos[fragmento]
+
+    def reconstruir(self, catalogo):
+        """Indexa `catalogo` ({codigo: producto}) en la próxima búsqueda, con lo que tenga entonces"""
+        self.clear()
+        self._por_indexar = catalogo
+
+    def _indexar_pendiente(self):
+        catalogo, self._por_indexar = self._por_indexar, None
+        if catalogo is not None:
+            for producto in catalogo.values():
+                self.registrar(producto)
+
+    def _candidatos(self, palabra):
+        largo = min(len(palabra), _LARGO_NGRAMA)
+        conjuntos = sorted((self._fragmentos.get(f, set()) for f in _ngramas(palabra, largo)), key=len)
+        if not conjuntos or not conjuntos[0]:
+            return set()
+        candidatos = set(conjuntos[0])
+        for conjunto in conjuntos[1:]:
+            candidatos &= conjunto
+            if not candidatos: break
+        if len(palabra) > _LARGO_NGRAMA:
+            candidatos = {c for c in candidatos if any(palabra in campo for campo in self._campos[c])}
+        return candidatos
+
+    def _puntaje(self, palabra, codigo):
+        cod, nombre, _ = self._campos[codigo]
+        palabras_nombre, palabras_marca = self._palabras[codigo]
+        if cod == palabra: return 0
+        if cod.startswith(palabra): return 1
+        if any(p.startswith(palabra) for p in palabras_nombre): return 2
+        if palabra in nombre: return 3
+        if any(p.startswith(palabra) for p in palabras_marca): return 4
+        return 5
+
+    def buscar(self, texto):
+        """Códigos que coinciden con `texto`, del más al menos relevante"""
+        self._indexar_pendiente()
+        palabras = normalizar(texto).split()
+        consulta = " ".join(palabras)
+        if consulta in self._consultas:
+            return self._consultas[consulta]
+
+        encontrados = set()
+        for i, palabra in enumerate(sorted(palabras, key=len, reverse=True)):
+            candidatos = self._candidatos(palabra)
+            encontrados = candidatos if i == 0 else encontrados & candidatos
+            if not encontrados: break
+
+        if len(palabras) == 1:
+            puntaje = lambda c: self._puntaje(palabras[0], c)
+        else:
+            puntaje = lambda c: sum(self._puntaje(p, c) for p in palabras)
+        resultado = sorted(encontrados, key=lambda c: (puntaje(c), self._campos[c][1], c))
+
+        if len(self._consultas) >= _MAX_CONSULTAS:
+            del self._consultas[next(iter(self._consultas))]
+        self._consultas[consulta] = resultado
+        return resultado
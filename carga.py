@@ -0,0 +1,166 @@
+from itertools import zip_longest
+
+import numpy as np
+import pandas as pd
+
+from almacenamiento import CATALOGO_WS, INVENTARIO_WS, catalogo_headers, inventario_headers
+from modelo import SIN_VENCIMIENTO, fecha_a_ordinal
+
+# date.toordinal() del 1970-01-01, origen de datetime64
+_ORDINAL_EPOCA = 719163
+# Columnas del informe de validación
+columnas_informe = ["tabla", "fila", "codigo", "columna", "valor", "motivo"]
+
+
+def informe_vacio():
+    return pd.DataFrame(columns=columnas_informe)
+
+
+def _columnas(filas, cabeceras):
+    """Filas de texto de largo variable (como las de `get_all_values`) -> {cabecera: arreglo}.
+
+    Las celdas que faltan quedan en "" y las columnas de más se descartan.
+    Se descartan también las filas sin código (las que quedan vacías al borrar
+    un lote); `fila` es el número de fila en la hoja de cada una que queda.
+    """
+    columnas = list(zip_longest(*filas, fillvalue=""))[:len(cabeceras)]
+    columnas += [("",) * len(filas)] * (len(cabeceras) - len(columnas))
+    datos = {c: np.array(col, dtype=object) for c, col in zip(cabeceras, columnas)}
+    con_codigo = datos["codigo"] != ""
+    if not con_codigo.all():
+        datos = {c: col[con_codigo] for c, col in datos.items()}
+    # La fila 1 de la hoja son las cabeceras
+    datos["fila"] = np.flatnonzero(con_codigo) + 2
+    return datos
+
+
+def _por_valor(columna, convertir, dtype):
+    """Aplica `convertir` una vez por valor distinto de la columna y reparte el resultado.
+
+    Cantidades, precios y vencimientos se repiten mucho: convertir los valores
+    distintos y repartirlos con un índice es mucho más barato que fila por fila.
+    """
+    indices, distintos = pd.factorize(columna)
+    return np.array([convertir(v) for v in distintos], dtype=dtype)[indices]
+
+
+def _a_numero(texto):
+    """'12' -> 12.0; vacío o no numérico -> NaN"""
+    try:
+        return float(texto)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def _sin_hora(texto):
+    """'AAAA-MM-DD HH:MM' o 'AAAA-MM-DDTHH:MM' -> 'AAAA-MM-DD' (como `inventario.normalizar_fecha`)"""
+    return texto.strip().split(' ')[0].split('T')[0]
+
+
+def _como_python(valores, faltante):
+    """float64 -> lista de int (si es entero) o float, con `faltante` en lugar de NaN"""
+    numeros = valores.astype(object)
+    enteros = valores % 1 == 0
+    numeros[enteros] = valores[enteros].astype(np.int64).astype(object)
+    numeros[np.isnan(valores)] = faltante
+    return numeros.tolist()
+
+
+def _problemas(tabla, datos, columna, malas, motivo):
+    """Filas del informe para las celdas `malas` de una columna (con el texto leído)"""
+    return pd.DataFrame({
+        "tabla": tabla,
+        "fila": datos["fila"][malas],
+        "codigo": datos["codigo"][malas],
+        "columna": columna,
+        "valor": datos[columna][malas],
+        "motivo": motivo,
+    })
+
+
+def _informe(partes):
+    partes = [p for p in partes if len(p)]
+    return pd.concat(partes, ignore_index=True) if partes else informe_vacio()
+
+
+def tipar_catalogo(filas):
+    """Filas del catálogo -> (columnas tipadas, informe de validación).
+
+    Las columnas son arreglos: los precios y `stock_min` en float64 (precio
+    vacío = 0, stock mínimo vacío = NaN). Un precio o stock mínimo ilegible
+    se informa y queda en 0 / NaN.
+    """
+    datos = _columnas(filas, catalogo_headers)
+    tipadas, partes = dict(datos), []
+    for columna, vacio, motivo in (
+        ("precio_costo", 0, "Precio no numérico"), ("precio_venta", 0, "Precio no numérico"),
+        ("stock_min", np.nan, "Stock mínimo no numérico"),
+    ):
+        valores = _por_valor(datos[columna], _a_numero, float)
+        invalidos = np.isnan(valores) & (datos[columna] != "")
+        partes.append(_problemas(CATALOGO_WS, datos, columna, invalidos, motivo))
+        valores[np.isnan(valores)] = vacio
+        tipadas[columna] = valores
+    return tipadas, _informe(partes)
+
+
+def tipar_inventario(filas):
+    """Filas del inventario -> (columnas tipadas, informe de validación).
+
+    `cantidad` es int64, `fecha_vencimiento` el texto sin hora (la clave del
+    lote), `fecha_guardada` el texto tal como está en la fila (la clave para
+    escribirla) y `vencimiento` la fecha en datetime64 (NaT si está vacía o no
+    es AAAA-MM-DD). Las filas con una cantidad que no es un entero se informan y
+    se descartan; una fecha ilegible se informa pero el lote queda, sin
+    vencimiento.
+    """
+    datos = _columnas(filas, inventario_headers)
+    cantidad = _por_valor(datos["cantidad"], _a_numero, float)
+    no_numericas = np.isnan(cantidad)
+    no_enteras = ~no_numericas & (cantidad % 1 != 0)
+
+    fecha = _por_valor(datos["fecha_vencimiento"], _sin_hora, object)
+    ordinal = _por_valor(fecha, fecha_a_ordinal, np.int64)
+    sin_fecha = ordinal == SIN_VENCIMIENTO
+    vencimiento = (ordinal - _ORDINAL_EPOCA).astype("datetime64[D]")
+    vencimiento[sin_fecha] = np.datetime64("NaT")
+
+    informe = _informe([
+        _problemas(INVENTARIO_WS, datos, "cantidad", no_numericas, "Cantidad no numérica"),
+        _problemas(INVENTARIO_WS, datos, "cantidad", no_enteras, "La cantidad debe ser un entero"),
+        _problemas(INVENTARIO_WS, datos, "fecha_vencimiento", sin_fecha & (fecha != ""),
+                   "Fecha de vencimiento inválida"),
+    ])
+    buenas = ~(no_numericas | no_enteras)
+    tipadas = {
+        "codigo": datos["codigo"], "cantidad": cantidad, "fecha_vencimiento": fecha,
+        "fecha_guardada": datos["fecha_vencimiento"], "vencimiento": vencimiento, "version": datos["version"], "fila": datos["fila"],
+    }
+    if not buenas.all():
+        tipadas = {c: col[buenas] for c, col in tipadas.items()}
+    tipadas["cantidad"] = tipadas["cantidad"].astype(np.int64)
+    return tipadas, informe
+
+
+def valores_catalogo(datos):
+    """(codigo, nombre, marca, precio_costo, precio_venta, stock_min) por producto de `tipar_catalogo`.
+
+    Los números vuelven como int si son enteros (se escriben así en la hoja) y
+    el stock mínimo vacío como None.
+    """
+    return zip(
+        datos["codigo"].tolist(), datos["nombre"].tolist(), datos["marca"].tolist(),
+        _como_python(datos["precio_costo"], 0), _como_python(datos["precio_venta"], 0),
+        _como_python(datos["stock_min"], None),
+    )
+
+
+def valores_inventario(datos):
+    """(codigo, cantidad, fecha_vencimiento, vencimiento, version, fecha_guardada) por lote de
+    `tipar_inventario`, con el vencimiento como ordinal (`date.toordinal`, SIN_VENCIMIENTO si no tiene)"""
+    vencimiento = datos["vencimiento"]
+    ordinal = np.where(np.isnat(vencimiento), SIN_VENCIMIENTO, vencimiento.astype(np.int64) + _ORDINAL_EPOCA)
+    return zip(
+        datos["codigo"].tolist(), datos["cantidad"].tolist(), datos["fecha_vencimiento"].tolist(),
+        ordinal.tolist(), datos["version"].tolist(), datos["fecha_guardada"].tolist(),
+    )
@@ -0,0 +1,130 @@
+import random
+import threading
+import time
+
+from metricas import medir
+
+# Cuota de la API de Sheets por usuario y minuto (lecturas y escrituras por separado)
+CUOTA_POR_MINUTO = 60
+# Peticiones seguidas que se permiten antes de empezar a espaciar
+RAFAGA = 10
+# Reintentos ante un 429 y espera (segundos) del primero; cada uno dobla la anterior
+REINTENTOS = 5
+ESPERA_BASE = 1.0
+ESPERA_MAXIMA = 32.0
+
+
+class LimiteTasa:
+    """Cubeta de fichas: hasta `capacidad` peticiones seguidas y luego `por_segundo`.
+
+    `tomar` bloquea el hilo hasta que haya ficha. Es seguro entre hilos y el
+    orden de llegada se respeta (cada espera reserva su ficha).
+    """
+
+    def __init__(self, por_segundo, capacidad=1):
+        self.por_segundo = por_segundo
+        self.capacidad = capacidad
+        self._fichas = float(capacidad)
+        self._ultima = time.monotonic()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def por_minuto(cls, cuota, rafaga=RAFAGA):
+        """Límite que en ningún minuto supera `cuota` peticiones, contando la ráfaga inicial"""
+        rafaga = min(rafaga, cuota - 1)
+        return cls((cuota - rafaga) / 60, rafaga)
+
+    def tomar(self):
+        with self._lock:
+            ahora = time.monotonic()
+            self._fichas = min(self.capacidad, self._fichas + (ahora - self._ultima) * self.por_segundo)
+            self._ultima = ahora
+            self._fichas -= 1
+            espera = -self._fichas / self.por_segundo if self._fichas < 0 else 0
+        if espera:
+            with medir("sheets.espera_cuota"):
+                time.sleep(espera)
+
+
+def codigo_http(error):
+    """Código HTTP de un error de la API (`gspread.exceptions.APIError` o uno con `response`)"""
+    codigo = getattr(error, 'code', None)
+    if codigo is None:
+        codigo = getattr(getattr(error, 'response', None), 'status_code', None)
+    return codigo
+
+
+def _espera_reintento(error, intento):
+    """Retry-After si la respuesta lo trae; si no, espera exponencial con jitter"""
+    cabeceras = getattr(getattr(error, 'response', None), 'headers', None) or {}
+    try:
+        return min(ESPERA_MAXIMA, float(cabeceras['Retry-After']))
+    except (KeyError, TypeError, ValueError):
+        return min(ESPERA_MAXIMA, ESPERA_BASE * 2 ** intento) * random.uniform(0.5, 1.0)
+
+
+class _Limitado:
+    """Objeto de gspread cuyos métodos públicos pasan por `ClienteSheets.llamar`"""
+
+    def __init__(self, objeto, cliente):
+        self._objeto = objeto
+        self._cliente = cliente
+
+    def __getattr__(self, nombre):
+        valor = getattr(self._objeto, nombre)
+        if nombre.startswith("_") or not callable(valor):
+            return valor
+        return lambda *args, **kwargs: self._cliente.llamar(valor, *args, **kwargs)
+
+
+class ClienteSheets(_Limitado):
+    """`gspread.Spreadsheet` que cuida la cuota de la API.
+
+    - Las pestañas se listan una vez y sus objetos se reutilizan: `worksheet`
+      no vuelve a pedir los metadatos de la hoja.
+    - Cada petición (del libro o de sus pestañas) toma antes una ficha del
+      `limite` (sin límite si es None).
+    - Un 429 (cuota excedida) se reintenta hasta `reintentos` veces con espera
+      exponencial y jitter. Los demás errores se propagan sin reintentar: una
+      escritura que falló con 5xx pudo haberse aplicado.
+    """
+
+    def __init__(self, sh, limite=None, reintentos=REINTENTOS):
+        super().__init__(sh, self)
+        self.limite = limite
+        self.reintentos = reintentos
+        self._pestanas = None
+        self._lock_pestanas = threading.Lock()
+
+    def llamar(self, funcion, *args, **kwargs):
+        for intento in range(self.reintentos + 1):
+            if self.limite is not None:
+                self.limite.tomar()
+            try:
+                return funcion(*args, **kwargs)
+            except Exception as e:
+                if codigo_http(e) != 429 or intento == self.reintentos:
+                    raise
+                with medir("sheets.espera_reintento"):
+                    time.sleep(_espera_reintento(e, intento))
+
+    def worksheets(self):
+        with self._lock_pestanas:
+            if self._pestanas is None:
+                self._pestanas = {ws.title: _Limitado(ws, self) for ws in self.llamar(self._objeto.worksheets)}
+            return list(self._pestanas.values())
+
+    def worksheet(self, titulo):
+        self.worksheets()
+        with self._lock_pestanas:
+            if titulo not in self._pestanas:
+                # Creada por otra terminal después de listar las pestañas
+                self._pestanas[titulo] = _Limitado(self.llamar(self._objeto.worksheet, titulo), self)
+            return self._pestanas[titulo]
+
+    def add_worksheet(self, title, rows, cols):
+        self.worksheets()
+        ws = _Limitado(self.llamar(self._objeto.add_worksheet, title=title, rows=rows, cols=cols), self)
+        with self._lock_pestanas:
+            self._pestanas[title] = ws
+        return ws
@@ -0,0 +1,471 @@
+import json
+import os
+import threading
+import time
+import uuid
+from datetime import datetime
+
+from almacenamiento import MOVIMIENTOS_WS, TABLAS, ConflictoVersion, nuevo_sello
+from metricas import cronometrar
+from modelo import StockInsuficiente
+
+# Veces que se rebasa una operación sobre los valores actuales antes de darla por fallida
+MAX_REBASES = 5
+# Intentos fallidos seguidos de la cola antes de apartar lo pendiente como descartado
+MAX_INTENTOS = 10
+# Sufijo del sello propio en una fila rebasada: su cantidad ya no es la que tiene la memoria
+_REBASADO = "r"
+
+
+def _es_definitivo(error):
+    """Errores de los datos (p. ej. `StockInsuficiente` al rebasar o un cambio con formato
+    desconocido): reintentar no los arregla"""
+    return isinstance(error, ValueError)
+
+
+def _con_operacion(cambio, clave):
+    """Copia del cambio con `clave` en la columna 'operacion' de sus filas (si la tabla la tiene)"""
+    spec = TABLAS[cambio['tabla']]
+    if 'operacion' not in spec:
+        return cambio
+    n, i = len(spec['cabeceras']), spec['cabeceras'].index(spec['operacion'])
+    filas = []
+    for fila in cambio['filas']:
+        fila = list(fila) + [""] * (n - len(fila))
+        fila[i] = clave
+        filas.append(fila)
+    return dict(cambio, filas=filas)
+
+
+def _validar(cambio):
+    """Rechaza cambios que no encajan en las tablas actuales (p. ej. un diario del formato anterior)"""
+    spec = TABLAS.get(cambio['tabla'])
+    if spec is None or any(len(fila) > len(spec['cabeceras']) for fila in cambio['filas']):
+        raise ValueError(f"Cambio con formato desconocido para la tabla '{cambio['tabla']}'")
+
+
+@cronometrar()
+def aplicar_cambios(alm, cambios, reintento=False):
+    """Aplica una lista de cambios en una sola transacción del almacenamiento.
+
+    Cada cambio es un dict {'tabla', 'filas', 'borradas'}: en tablas con clave
+    se hace `actualizar`, en las de solo agregado (movimientos) `agregar`.
+    Opcionalmente lleva 'esperadas', una lista de [clave, versión, cantidad
+    anterior]: la escritura solo se hace si cada clave sigue en esa versión.
+    Si otra terminal la cambió, el cambio se rebasa sobre los valores actuales
+    (ver `_rebasar`) y se reintenta. Devuelve cuántas filas se rebasaron.
+
+    `reintento` indica que un intento anterior de estos mismos cambios pudo
+    quedar guardado a medias (falló a mitad o se recuperó del diario).
+    """
+    for cambio in cambios:
+        _validar(cambio)
+    # Primero las tablas condicionales: un conflicto corta antes de escribir las demás
+    cambios = sorted(cambios, key=lambda c: not c.get('esperadas'))
+    rebasadas = 0
+    for intento in range(MAX_REBASES + 1):
+        try:
+            with alm.transaccion():
+                for cambio in cambios:
+                    if TABLAS[cambio['tabla']]['clave'] is None:
+                        alm.agregar(cambio['tabla'], cambio['filas'])
+                    else:
+                        esperadas = {tuple(k): version for k, version, _ in cambio.get('esperadas', ())}
+                        alm.actualizar(cambio['tabla'], cambio['filas'], cambio.get('borradas', ()), esperadas)
+            return rebasadas
+        except ConflictoVersion as conflicto:
+            if intento == MAX_REBASES:
+                raise
+            cambio = next(c for c in cambios if c['tabla'] == conflicto.tabla)
+            rebasadas += _rebasar(cambio, conflicto.actuales, reintento)
+
+
+def _rebasar(cambio, actuales, reintento=False):
+    """Reescribe `cambio` sobre las filas `actuales` ({clave: fila o None}).
+
+    Se conserva la diferencia que quería aplicar la operación: cantidad nueva =
+    actual + (deseada - anterior). Si no queda nada el lote se borra; si
+    queda menos que nada (otra terminal ya vendió ese stock) se lanza
+    `StockInsuficiente` sin escribir. Las esperadas pasan a ser las actuales.
+
+    'propias' lleva cada [clave, sello, cantidad] que escribe el cambio. Una
+    fila guardada hoy con uno de esos sellos (o con el mismo más `_REBASADO`)
+    la escribió un intento anterior del mismo cambio: su cantidad ya incluye la
+    operación hasta ese sello, así que solo se suma lo que falte desde ahí.
+    Una fila que queda con otra cantidad que la deseada lleva el sello con
+    `_REBASADO`, para que las operaciones hechas en memoria sobre el sello
+    original choquen con ella en vez de pisarla. Con `reintento`, una clave que el
+    cambio borra y que ya no existe se da por borrada por ese intento (no se
+    distingue de un borrado de otra terminal en ese mismo lapso).
+    Devuelve cuántas filas quedan con otra cantidad que la del cambio (las
+    rebasadas sobre otra terminal, ahora o en un intento anterior).
+    """
+    spec = TABLAS[cambio['tabla']]
+    cabeceras = spec['cabeceras']
+    idx = [cabeceras.index(c) for c in spec['clave']]
+    i_cant, i_version = cabeceras.index(spec['delta']), cabeceras.index(spec['version'])
+
+    filas = {tuple(str(f[i]) for i in idx): list(f) for f in cambio['filas']}
+    borradas = {tuple(k) for k in cambio.get('borradas', ())}
+    propias, sellos = {}, {}
+    for k, sello, cantidad in cambio.get('propias', ()):
+        propias[tuple(k), sello] = cantidad
+        sellos[tuple(k)] = sello  # el último es el que queda en la fila
+    esperadas, rebasadas = [], 0
+    for k, version, anterior in cambio['esperadas']:
+        k = tuple(k)
+        if k not in actuales:
+            esperadas.append([list(k), version, anterior])
+            continue
+        actual = actuales[k]
+        if actual is None and reintento and k in borradas:
+            esperadas.append([list(k), None, 0])
+            continue
+        cantidad_actual = _a_entero(actual[i_cant]) if actual else 0
+        deseada = _a_entero(filas[k][i_cant]) if k in filas else 0
+        sello_actual = actual[i_version].removesuffix(_REBASADO) if actual else None
+        propia = (k, sello_actual) in propias
+        base = propias[k, sello_actual] if propia else _a_entero(anterior)
+        rebasadas += not propia or cantidad_actual != base
+        nueva = cantidad_actual + deseada - base
+        if nueva < 0:
+            raise StockInsuficiente(k[0], cantidad_actual)
+        if nueva > 0:
+            sello = sellos.get(k) or nuevo_sello()
+            fila = filas.get(k) or list(actual)
+            fila += [""] * (len(cabeceras) - len(fila))
+            fila[i_cant], fila[i_version] = str(nueva), sello if nueva == deseada else sello + _REBASADO
+            filas[k] = fila
+            borradas.discard(k)
+        else:
+            filas.pop(k, None)
+            borradas.add(k)
+        esperadas.append([list(k), actual[i_version] if actual else None, cantidad_actual])
+
+    cambio['filas'] = list(filas.values())
+    cambio['borradas'] = [list(k) for k in borradas]
+    cambio['esperadas'] = esperadas
+    return rebasadas
+
+
+def _a_entero(valor):
+    try:
+        return int(float(valor or 0))
+    except (TypeError, ValueError):
+        return 0
+
+
+def combinar_cambios(cambios):
+    """Junta cambios sucesivos en uno por tabla.
+
+    Para una misma clave gana el último cambio (fila nueva o borrado) y se
+    conserva la primera versión esperada; las 'propias' se juntan todas y las
+    filas de tablas sin clave se concatenan en orden.
+    """
+    por_tabla = {}
+    esperadas = {}
+    propias = {}
+    for cambio in cambios:
+        _validar(cambio)
+        tabla = cambio['tabla']
+        clave = TABLAS[tabla]['clave']
+        if clave is None:
+            por_tabla.setdefault(tabla, []).extend(cambio['filas'])
+            continue
+        idx = [TABLAS[tabla]['cabeceras'].index(c) for c in clave]
+        filas = por_tabla.setdefault(tabla, {})
+        for k, version, anterior in cambio.get('esperadas', ()):
+            esperadas.setdefault(tabla, {}).setdefault(tuple(k), [list(k), version, anterior])
+        propias.setdefault(tabla, []).extend(cambio.get('propias', ()))
+        for k in cambio.get('borradas', ()):
+            filas[tuple(k)] = None
+        for fila in cambio['filas']:
+            filas[tuple(str(fila[i]) for i in idx)] = fila
+
+    combinados = []
+    for tabla, filas in por_tabla.items():
+        if isinstance(filas, list):
+            combinados.append({'tabla': tabla, 'filas': filas, 'borradas': []})
+        else:
+            combinado = {
+                'tabla': tabla,
+                'filas': [f for f in filas.values() if f is not None],
+                'borradas': [k for k, f in filas.items() if f is None],
+            }
+            if tabla in esperadas:
+                combinado['esperadas'] = list(esperadas[tabla].values())
+            if propias.get(tabla):
+                combinado['propias'] = propias[tabla]
+            combinados.append(combinado)
+    return combinados
+
+
+class ColaEscritura:
+    """Escritura diferida: confirma al instante y persiste en un hilo aparte.
+
+    Cada operación encolada se anota primero en un diario local (una línea JSON
+    por operación, con fsync) y luego la aplica el hilo trabajador, que junta
+    todo lo pendiente en un único lote por tabla. Si falla, reintenta con
+    espera exponencial; lo no confirmado sigue en el diario y se vuelve a
+    encolar al crear la cola (p. ej. tras reiniciar la app).
+
+    Cada entrada lleva una clave que se guarda con sus movimientos. Antes de
+    un reintento se buscan esas claves en el almacenamiento: las entradas que
+    ya están (se guardaron pero no llegó la confirmación) se dan por hechas y
+    no repiten sus movimientos.
+
+    Un error definitivo (ver `_es_definitivo`) o MAX_INTENTOS fallos seguidos
+    apartan lo pendiente a un archivo de descartadas (`ruta_diario` +
+    '.descartadas') para revisarlo desde la app; ante un error definitivo en
+    un lote de varias entradas se prueban de a una, para apartar solo la que
+    falla.
+
+    `al_desincronizar`, si se asigna, se llama desde el hilo trabajador cuando
+    lo guardado ya no coincide con lo que se confirmó en memoria (un lote se
+    rebasó sobre cambios de otra terminal o se descartó).
+    """
+
+    def __init__(self, alm, ruta_diario, espera_inicial=1.0, espera_maxima=60.0):
+        self.alm = alm
+        self.ruta_diario = ruta_diario
+        self.ruta_descartadas = ruta_diario + ".descartadas"
+        self.espera_inicial = espera_inicial
+        self.espera_maxima = espera_maxima
+        self._cond = threading.Condition()
+        self._pendientes = []
+        self._descartadas = []
+        self._siguiente_id = 1
+        self._en_curso = False
+        self._reintentar_en = 0.0
+        self.intentos = 0
+        self.ultimo_error = None
+        self.rebasadas = 0
+        self.al_desincronizar = None
+        # Lo pendiente pudo quedar guardado a medias por un intento anterior
+        self._reintento = False
+        # Tras un error definitivo se aplica de a una entrada
+        self._aislar = False
+
+        self._recuperar_diario()
+        self._hilo = threading.Thread(target=self._trabajar, name="cola-escritura", daemon=True)
+        self._hilo.start()
+
+    # --- Diario ---
+
+    @staticmethod
+    def _leer_entradas(ruta):
+        if not os.path.exists(ruta):
+            return []
+        entradas = []
+        with open(ruta, encoding="utf-8") as f:
+            for linea in f:
+                linea = linea.strip()
+                if not linea: continue
+                try:
+                    entradas.append(json.loads(linea))
+                except ValueError:
+                    break  # línea cortada por una caída a mitad de escritura
+        return entradas
+
+    @staticmethod
+    def _escribir_entradas(ruta, entradas):
+        tmp = ruta + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            for entrada in entradas:
+                f.write(json.dumps(entrada, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, ruta)
+
+    def _recuperar_diario(self):
+        self._pendientes = self._leer_entradas(self.ruta_diario)
+        self._descartadas = self._leer_entradas(self.ruta_descartadas)
+        for entrada in self._pendientes + self._descartadas:
+            self._siguiente_id = max(self._siguiente_id, entrada['id'] + 1)
+        self._reintento = bool(self._pendientes)
+
+    def _reescribir_diario(self):
+        self._escribir_entradas(self.ruta_diario, self._pendientes)
+
+    def _anotar(self, entrada):
+        with open(self.ruta_diario, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entrada, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self._pendientes.append(entrada)
+
+    # --- API ---
+
+    def encolar(self, cambios):
+        """Anota los cambios en el diario y vuelve de inmediato.
+
+        Las filas de movimientos se marcan con la clave de la entrada.
+        """
+        cambios = [c for c in cambios if c['filas'] or c.get('borradas')]
+        if not cambios: return
+        clave = uuid.uuid4().hex
+        with self._cond:
+            self._anotar({'id': self._siguiente_id, 'clave': clave, 'cambios': [_con_operacion(c, clave) for c in cambios]})
+            self._siguiente_id += 1
+            self._cond.notify()
+
+    def ocupada(self):
+        """True mientras haya operaciones sin confirmar en el almacenamiento"""
+        with self._cond:
+            return bool(self._pendientes) or self._en_curso
+
+    def estado(self):
+        with self._cond:
+            return {
+                'pendientes': len(self._pendientes),
+                'intentos': self.intentos,
+                'ultimo_error': self.ultimo_error,
+                'rebasadas': self.rebasadas,
+                'descartadas': len(self._descartadas),
+            }
+
+    def reintentar(self):
+        """Reintenta ya, sin esperar a que termine la espera actual"""
+        with self._cond:
+            self._reintentar_en = 0.0
+            self._cond.notify()
+
+    def vaciar(self, timeout=None):
+        """Espera a que no quede nada pendiente; devuelve False si se agotó el tiempo"""
+        limite = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self._pendientes or self._en_curso:
+                restante = None if limite is None else limite - time.monotonic()
+                if restante is not None and restante <= 0:
+                    return False
+                self._cond.wait(restante)
+            return True
+
+    # --- Descartadas ---
+
+    def descartadas(self):
+        """Resumen de las operaciones apartadas: [{'fecha', 'movimientos', 'error'}]"""
+        cabeceras = TABLAS[MOVIMIENTOS_WS]['cabeceras']
+        i_tipo, i_codigo, i_cant = (cabeceras.index(c) for c in ('tipo', 'codigo', 'cantidad'))
+        with self._cond:
+            return [
+                {
+                    'fecha': entrada['fecha'],
+                    'movimientos': ", ".join(
+                        f"{fila[i_tipo]} {fila[i_cant]} × {fila[i_codigo]}"
+                        for cambio in entrada['cambios'] if cambio['tabla'] == MOVIMIENTOS_WS
+                        for fila in cambio['filas']
+                    ),
+                    'error': entrada['error'],
+                }
+                for entrada in self._descartadas
+            ]
+
+    def reenviar_descartadas(self):
+        """Vuelve a encolar las operaciones apartadas (con su misma clave)"""
+        with self._cond:
+            for descartada in self._descartadas:
+                self._anotar({
+                    'id': self._siguiente_id, 'clave': descartada.get('clave'),
+                    'cambios': descartada['cambios'], 'reenviada': True,
+                })
+                self._siguiente_id += 1
+            self._descartadas = []
+            self._escribir_entradas(self.ruta_descartadas, [])
+            self._reintento = True
+            self._reintentar_en = 0.0
+            self._cond.notify()
+
+    def borrar_descartadas(self):
+        """Olvida las operaciones apartadas; no se guardarán"""
+        with self._cond:
+            self._descartadas = []
+            self._escribir_entradas(self.ruta_descartadas, [])
+
+    def _descartar(self, lote, error):
+        ids = {e['id'] for e in lote}
+        self._pendientes = [e for e in self._pendientes if e['id'] not in ids]
+        fecha = datetime.now().isoformat(sep=" ", timespec="seconds")
+        for entrada in lote:
+            self._descartadas.append({
+                'id': entrada['id'], 'clave': entrada.get('clave'), 'cambios': entrada['cambios'],
+                'fecha': fecha, 'error': str(error),
+            })
+        try:
+            # Primero las descartadas: si se corta en medio, la entrada sigue también en el diario
+            self._escribir_entradas(self.ruta_descartadas, self._descartadas)
+            self._reescribir_diario()
+        except OSError:
+            pass  # quedan en el diario y se vuelven a intentar al reiniciar
+        if self.al_desincronizar is not None:
+            self.al_desincronizar()
+
+    # --- Hilo trabajador ---
+
+    def _ya_guardadas(self, lote):
+        """Claves de las entradas del lote cuyos movimientos ya están en el almacenamiento"""
+        claves = [e['clave'] for e in lote if e.get('clave')]
+        return self.alm.operaciones_guardadas(claves) if claves else set()
+
+    def _trabajar(self):
+        while True:
+            with self._cond:
+                while not self._pendientes or time.monotonic() < self._reintentar_en:
+                    espera = None if not self._pendientes else self._reintentar_en - time.monotonic()
+                    self._cond.wait(espera)
+                lote = self._pendientes[:1] if self._aislar else list(self._pendientes)
+                reintento = self._reintento
+                self._en_curso = True
+
+            try:
+                guardadas = self._ya_guardadas(lote) if reintento else set()
+                por_aplicar = [e for e in lote if e.get('clave') not in guardadas]
+                rebasadas = 0
+                if por_aplicar:
+                    cambios = combinar_cambios([c for e in por_aplicar for c in e['cambios']])
+                    rebasadas = aplicar_cambios(self.alm, cambios, reintento)
+            except Exception as e:
+                with self._cond:
+                    self._fallo(lote, e)
+                continue
+
+            with self._cond:
+                confirmados = {e['id'] for e in lote}
+                self._pendientes = [e for e in self._pendientes if e['id'] not in confirmados]
+                self.intentos = 0
+                self.ultimo_error = None
+                self.rebasadas += rebasadas
+                if not self._pendientes:
+                    self._reintento = self._aislar = False
+                try:
+                    self._reescribir_diario()
+                except OSError:
+                    pass  # se reintenta al confirmar el próximo lote
+                # Un intento anterior pudo guardar entradas rebasadas sin que se supiera, y las
+                # reenviadas se habían quitado de la memoria al descartarlas
+                desincronizada = rebasadas or guardadas or any(e.get('reenviada') for e in lote)
+                if desincronizada and self.al_desincronizar is not None:
+                    self.al_desincronizar()
+                self._en_curso = False
+                self._cond.notify_all()
+
+    def _fallo(self, lote, error):
+        """Intento fallido: reintenta con espera, pasa a aplicar de a una o aparta el lote"""
+        self._reintento = True
+        self.intentos += 1
+        self.ultimo_error = str(error)
+        definitivo = _es_definitivo(error)
+        if definitivo and len(lote) > 1:
+            self._aislar = True
+            self._reintentar_en = 0.0
+        elif definitivo or self.intentos >= MAX_INTENTOS:
+            self._descartar(lote, error)
+            self.intentos = 0
+            self.ultimo_error = None
+            self._aislar = False
+            self._reintentar_en = 0.0
+        else:
+            espera = min(self.espera_inicial * 2 ** (self.intentos - 1), self.espera_maxima)
+            self._reintentar_en = time.monotonic() + espera
+        self._en_curso = False
+        self._cond.notify_all()
@@ -0,0 +1,361 @@
+import glob
+import os
+import threading
+from bisect import bisect_left
+
+import numpy as np
+import pandas as pd
+
+from almacenamiento import MOVIMIENTOS_WS, movimientos_headers
+
+# Columnas con las que se comprueba que la última fila ingerida sigue en su sitio
+_COLUMNAS_HUELLA = 3  # timestamp, tipo, codigo
+
+# Tamaños de cubeta de los totales pre-agregados para gráficos
+NIVELES = ('hora', 'dia', 'semana')
+
+# Segmentos de la caché local que se acumulan antes de compactarlos en el archivo base
+MAX_SEGMENTOS = 32
+
+
+def _cubetas(fechas, nivel):
+    """Inicio de la cubeta de cada fecha, en segundos desde 1970 (las semanas empiezan el lunes)"""
+    if nivel == 'hora':
+        return fechas.astype('datetime64[h]').astype('datetime64[s]').astype(np.int64)
+    dias = fechas.astype('datetime64[D]').astype(np.int64)
+    if nivel == 'semana':
+        dias = dias - (dias + 3) % 7  # el 1970-01-01 fue jueves
+    return dias * 86400
+
+
+def nivel_para(desde, hasta):
+    """Cubeta que deja un gráfico legible para el rango: horas, días o semanas"""
+    dias = (pd.Timestamp(hasta) - pd.Timestamp(desde)).days
+    if dias <= 3: return 'hora'
+    if dias <= 120: return 'dia'
+    return 'semana'
+
+
+def _tramo(posiciones, ini, fin):
+    """Elementos de una lista creciente de posiciones que caen en [ini, fin)"""
+    return posiciones[bisect_left(posiciones, ini):bisect_left(posiciones, fin)]
+
+
+class HistorialMovimientos:
+    """Log de movimientos guardado por columnas y cargado de forma incremental.
+
+    Como `movimientos` es de solo agregado, `sincronizar` pide al almacenamiento
+    únicamente las filas posteriores a la última ingerida (más esa última, para
+    comprobar que la hoja no fue reescrita). Lo acumulado se guarda en un
+    `.npz` local, así que un arranque en frío tampoco descarga todo el log:
+    cada sincronización agrega solo sus filas en un segmento aparte
+    (`ruta_cache`.N.npz) y cada MAX_SEGMENTOS segmentos un hilo en segundo
+    plano los junta en el archivo base.
+
+    Para `consultar` se mantiene un índice: fechas ya convertidas y ordenadas
+    (un rango se resuelve con `searchsorted`) y, por código y por tipo, las
+    posiciones de sus filas en ese orden. Junto con él se acumulan, por hora,
+    día y semana, las cantidades de cada tipo (en total y por código) que usa
+    `serie` para los gráficos. Todo se actualiza al consultar y solo procesa
+    las filas agregadas desde la consulta anterior.
+    """
+
+    def __init__(self, ruta_cache=None):
+        self.ruta_cache = ruta_cache
+        self.origen = None
+        self._columnas = {c: [] for c in movimientos_headers}
+        self._reiniciar_indice()
+        self._lock_cache = threading.Lock()
+        self._generacion = 0  # aumenta cuando el log se reescribe: lo que había en disco no sirve
+        self._siguiente_segmento = 1
+        self._segmentos_sin_compactar = 0
+        self._hilo_compactacion = None
+        self._cargar_cache()
+
+    def __len__(self):
+        return len(self._columnas[movimientos_headers[0]])
+
+    def columnas(self):
+        """Columnas como dict nombre -> lista, para armar un DataFrame"""
+        return self._columnas
+
+    def clear(self):
+        for valores in self._columnas.values():
+            valores.clear()
+        self._reiniciar_indice()
+
+    def extend(self, filas):
+        for fila in filas:
+            fila = list(fila[:len(movimientos_headers)]) + [""] * (len(movimientos_headers) - len(fila))
+            for nombre, valor in zip(movimientos_headers, fila):
+                self._columnas[nombre].append("" if valor is None else str(valor))
+
+    def append(self, fila):
+        self.extend([fila])
+
+    def _huella(self, fila):
+        return [str(x) for x in fila[:_COLUMNAS_HUELLA]]
+
+    def huella_en(self, posicion):
+        """Huella de la fila `posicion` (en orden de llegada), para comprobar que sigue en su sitio"""
+        return [self._columnas[c][posicion] for c in movimientos_headers[:_COLUMNAS_HUELLA]]
+
+    def _ultima_huella(self):
+        return self.huella_en(-1)
+
+    def desde_sincronizar(self, alm):
+        """Posición desde la que `sincronizar` lee el log: la última fila conocida (o 0)"""
+        if self.origen != alm.identificador:
+            self.clear()
+            self.origen = alm.identificador
+        return max(len(self) - 1, 0)
+
+    def sincronizar(self, alm, leidas=None):
+        """Trae del almacenamiento solo las filas nuevas; devuelve cuántas se agregaron.
+
+        `leidas` son las filas ya leídas desde `desde_sincronizar(alm)` (por
+        ejemplo junto con otras tablas en `leer_varias`); si no, se leen aquí.
+        """
+        desde = self.desde_sincronizar(alm)
+        cola = alm.leer_desde(MOVIMIENTOS_WS, desde) if leidas is None else leidas
+        if not len(self):
+            nuevas, reescrito = cola, True
+        elif cola and self._huella(cola[0]) == self._ultima_huella():
+            nuevas, reescrito = cola[1:], False
+        else:
+            # El log fue reescrito o la caché es de otra hoja: carga completa
+            self.clear()
+            nuevas, reescrito = alm.leer(MOVIMIENTOS_WS), True
+
+        self.extend(nuevas)
+        if reescrito:
+            self._guardar_cache(0)
+        elif nuevas:
+            self._guardar_cache(len(self) - len(nuevas))
+        return len(nuevas)
+
+    # --- Índice de consultas ---
+
+    def _reiniciar_indice(self):
+        self._indexadas = 0
+        self._fechas = np.array([], dtype='datetime64[s]')       # fecha de cada fila, en orden de llegada
+        self._cantidades = np.array([], dtype=np.float64)
+        self._fechas_ordenadas = np.array([], dtype='datetime64[s]')
+        self._filas_ordenadas = np.array([], dtype=np.int64)    # fila original de cada posición del orden
+        self._por_codigo = {}  # código -> posiciones (crecientes) en el orden por fecha
+        self._por_tipo = {}
+        # nivel -> (tipo, código o None para el total) -> {inicio de cubeta: cantidad}
+        self._agregados = {nivel: {} for nivel in NIVELES}
+
+    def _indexar_posiciones(self, desde):
+        tipos, codigos = self._columnas['tipo'], self._columnas['codigo']
+        for pos in range(desde, len(self._filas_ordenadas)):
+            fila = self._filas_ordenadas[pos]
+            self._por_codigo.setdefault(codigos[fila], []).append(pos)
+            self._por_tipo.setdefault(tipos[fila], []).append(pos)
+
+    def fechas_y_cantidades(self):
+        """(fechas, cantidades) de cada fila en orden de llegada, ya convertidas (NaT si la fecha es ilegible)"""
+        self._actualizar_indice()
+        return self._fechas, self._cantidades
+
+    def _actualizar_indice(self):
+        n = len(self)
+        if self._indexadas == n:
+            return
+        ini = self._indexadas
+        fechas = pd.to_datetime(self._columnas['timestamp'][ini:], errors='coerce').values.astype('datetime64[s]')
+        cantidades = pd.to_numeric(pd.Series(self._columnas['cantidad'][ini:]), errors='coerce').fillna(0)
+        self._fechas = np.concatenate([self._fechas, fechas])
+        self._cantidades = np.concatenate([self._cantidades, cantidades.to_numpy(np.float64)])
+        self._indexadas = n
+        self._acumular(ini, fechas, self._cantidades[ini:])
+
+        # Las filas con fecha ilegible no entran al orden (ningún rango las incluye)
+        validas = np.flatnonzero(~np.isnat(fechas))
+        nuevas = validas[np.argsort(fechas[validas], kind='stable')]
+        if len(self._fechas_ordenadas) and len(nuevas) and fechas[nuevas[0]] < self._fechas_ordenadas[-1]:
+            return self._reordenar()
+        # Lo habitual: las filas nuevas son posteriores a todo lo indexado y se agregan al final
+        inicio = len(self._filas_ordenadas)
+        self._fechas_ordenadas = np.concatenate([self._fechas_ordenadas, fechas[nuevas]])
+        self._filas_ordenadas = np.concatenate([self._filas_ordenadas, nuevas + ini])
+        self._indexar_posiciones(inicio)
+
+    def _acumular(self, ini, fechas, cantidades):
+        """Suma las filas nuevas a los totales por cubeta"""
+        validas = ~np.isnat(fechas)
+        if not validas.any():
+            return
+        df = pd.DataFrame({
+            'tipo': np.array(self._columnas['tipo'][ini:], dtype=object)[validas],
+            'codigo': np.array(self._columnas['codigo'][ini:], dtype=object)[validas],
+            'cantidad': cantidades[validas],
+        })
+        for nivel in NIVELES:
+            df['cubeta'] = _cubetas(fechas[validas], nivel)
+            agregados = self._agregados[nivel]
+            sumas = df.groupby(['tipo', 'codigo', 'cubeta'], sort=False)['cantidad'].sum()
+            for (tipo, codigo, cubeta), suma in sumas.items():
+                for clave in ((tipo, codigo), (tipo, None)):
+                    serie = agregados.setdefault(clave, {})
+                    serie[cubeta] = serie.get(cubeta, 0) + suma
+
+    def _reordenar(self):
+        """Ordena de nuevo todo el log (llegaron filas anteriores a lo ya indexado)"""
+        validas = np.flatnonzero(~np.isnat(self._fechas))
+        self._filas_ordenadas = validas[np.argsort(self._fechas[validas], kind='stable')]
+        self._fechas_ordenadas = self._fechas[self._filas_ordenadas]
+        self._por_codigo, self._por_tipo = {}, {}
+        self._indexar_posiciones(0)
+
+    def consultar(self, desde=None, hasta=None, tipos=None, codigo=None):
+        """Movimientos con desde <= timestamp < hasta, filtrados por tipo y código.
+
+        Devuelve un DataFrame en orden cronológico con `timestamp` como fecha y
+        `cantidad` numérica; solo se leen las filas que cumplen los filtros.
+        """
+        self._actualizar_indice()
+        if tipos and set(tipos) >= self._por_tipo.keys():
+            tipos = None  # incluye todos los tipos presentes: no hace falta filtrar
+        fechas = self._fechas_ordenadas
+        ini = 0 if desde is None else int(np.searchsorted(fechas, np.datetime64(desde, 's'), side='left'))
+        fin = len(fechas) if hasta is None else int(np.searchsorted(fechas, np.datetime64(hasta, 's'), side='left'))
+
+        if codigo is not None:
+            posiciones = _tramo(self._por_codigo.get(codigo, []), ini, fin)
+            if tipos:
+                tipos_ok = set(tipos)
+                posiciones = [p for p in posiciones if self._columnas['tipo'][self._filas_ordenadas[p]] in tipos_ok]
+        elif tipos:
+            posiciones = sorted(p for t in tipos for p in _tramo(self._por_tipo.get(t, []), ini, fin))
+        else:
+            posiciones = range(ini, fin)
+
+        filas = self._filas_ordenadas[np.asarray(posiciones, dtype=np.int64)]
+        datos = {c: [self._columnas[c][f] for f in filas] for c in movimientos_headers}
+        datos['timestamp'] = self._fechas[filas]
+        cantidades = self._cantidades[filas]
+        if np.all(cantidades == np.floor(cantidades)):
+            cantidades = cantidades.astype(np.int64)
+        datos['cantidad'] = cantidades
+        return pd.DataFrame(datos, columns=movimientos_headers)
+
+    def serie(self, desde, hasta, nivel='dia', tipos=None, codigo=None):
+        """Cantidad por cubeta y tipo entre desde y hasta, de los totales pre-agregados.
+
+        DataFrame con una fila por cubeta (índice = inicio) y una columna por
+        tipo. Sin `codigo` suma todos los productos.
+        """
+        self._actualizar_indice()
+        ini = _cubetas(np.array([np.datetime64(desde, 's')]), nivel)[0]
+        fin = np.datetime64(hasta, 's').astype(np.int64)
+        filas = [
+            (cubeta, tipo, suma)
+            for (tipo, cod), serie in self._agregados[nivel].items()
+            if cod == codigo and (not tipos or tipo in tipos)
+            for cubeta, suma in serie.items() if ini <= cubeta < fin
+        ]
+        df = pd.DataFrame(filas, columns=['cubeta', 'tipo', 'cantidad'])
+        df['cubeta'] = pd.to_datetime(df['cubeta'], unit='s')
+        return df.pivot_table(index='cubeta', columns='tipo', values='cantidad', aggfunc='sum', fill_value=0)
+
+    # --- Caché local ---
+
+    def _segmentos(self):
+        """{número: ruta} de los segmentos de la caché que hay en disco"""
+        segmentos = {}
+        for ruta in glob.glob(glob.escape(self.ruta_cache) + ".*.npz"):
+            numero = ruta[len(self.ruta_cache) + 1:-len(".npz")]
+            if numero.isdigit():
+                segmentos[int(numero)] = ruta
+        return segmentos
+
+    def _borrar_segmentos(self, hasta=None):
+        """Borra los segmentos con número menor que `hasta` (todos si es None)"""
+        for numero, ruta in self._segmentos().items():
+            if hasta is None or numero < hasta:
+                try:
+                    os.remove(ruta)
+                except OSError:
+                    pass
+
+    @staticmethod
+    def _escribir_npz(ruta, origen, columnas, **extra):
+        tmp = ruta + ".tmp.npz"
+        np.savez_compressed(
+            tmp, origen=np.array(origen or ""), **extra,
+            **{nombre: np.array(valores, dtype=str) for nombre, valores in columnas.items()}
+        )
+        os.replace(tmp, ruta)
+
+    def _cargar_cache(self):
+        """Lee el archivo base y le agrega, en orden, los segmentos que siguen"""
+        if not self.ruta_cache or not os.path.exists(self.ruta_cache):
+            return
+        try:
+            with np.load(self.ruta_cache) as datos:
+                self.origen = str(datos['origen'])
+                for nombre in movimientos_headers:
+                    self._columnas[nombre] = datos[nombre].tolist()
+            segmentos = self._segmentos()
+            for numero in sorted(segmentos):
+                with np.load(segmentos[numero]) as datos:
+                    desde = int(datos['desde'])
+                    if str(datos['origen']) != self.origen or desde > len(self):
+                        break  # de un log anterior o falta uno en medio: lo que sigue no sirve
+                    # Las primeras filas pueden estar ya en la base (compactada mientras se escribía)
+                    ya_cargadas = len(self) - desde
+                    for nombre in movimientos_headers:
+                        self._columnas[nombre].extend(datos[nombre][ya_cargadas:].tolist())
+            self._siguiente_segmento = max(segmentos, default=0) + 1
+            self._segmentos_sin_compactar = len(segmentos)
+        except Exception:
+            # Caché corrupta o de otra versión: se ignora y se hace una carga completa
+            self.origen = None
+            self._columnas = {c: [] for c in movimientos_headers}
+
+    def _guardar_cache(self, desde):
+        """Guarda en disco las filas desde la posición `desde` (0 = el log entero es nuevo)"""
+        if not self.ruta_cache:
+            return
+        if desde == 0:
+            # Log nuevo o reescrito: los segmentos no sirven y la base se rehace en segundo plano
+            with self._lock_cache:
+                self._generacion += 1
+                self._borrar_segmentos()
+            self._compactar_en_segundo_plano()
+            return
+        self._escribir_npz(
+            f"{self.ruta_cache}.{self._siguiente_segmento}.npz", self.origen,
+            {nombre: valores[desde:] for nombre, valores in self._columnas.items()}, desde=np.array(desde)
+        )
+        self._siguiente_segmento += 1
+        self._segmentos_sin_compactar += 1
+        if self._segmentos_sin_compactar >= MAX_SEGMENTOS:
+            self._compactar_en_segundo_plano()
+
+    def _compactar_en_segundo_plano(self):
+        if self._hilo_compactacion is not None and self._hilo_compactacion.is_alive():
+            return  # el hilo en curso vuelve a empezar si cambió la generación
+        self._segmentos_sin_compactar = 0
+        self._hilo_compactacion = threading.Thread(target=self._compactar, name="compactar-historial", daemon=True)
+        self._hilo_compactacion.start()
+
+    def _compactar(self):
+        """Escribe todo lo cargado como archivo base y borra los segmentos que ya incluye"""
+        while True:
+            generacion, limite = self._generacion, self._siguiente_segmento
+            # Copia de lo que hay ahora: las listas solo crecen, salvo si se reescribe el log
+            n = len(self)
+            columnas = {nombre: valores[:n] for nombre, valores in self._columnas.items()}
+            tmp = self.ruta_cache + ".base.npz"
+            try:
+                self._escribir_npz(tmp, self.origen, columnas)
+            except OSError:
+                return
+            with self._lock_cache:
+                if generacion == self._generacion:
+                    os.replace(tmp, self.ruta_cache)
+                    self._borrar_segmentos(hasta=limite)
+                    return
@@ -0,0 +1,102 @@
+import threading
+import time
+from collections import defaultdict
+
+from busqueda import IndiceBusqueda
+from historial import HistorialMovimientos
+from modelo import IndiceVencimientos, ResumenStock
+from proyeccion import ProyeccionStock
+
+
+class Instantanea:
+    """Copia en memoria de las tablas, compartida por todas las sesiones del proceso.
+
+    `version` aumenta con cada carga o escritura propia, así que sirve de clave
+    para cachear cualquier vista derivada de los datos (ver `vista`). `revision` es el token
+    del backend correspondiente a lo que hay en memoria; solo se vuelve a leer
+    el almacenamiento si ese token cambia (escrituras de otro proceso/terminal)
+    o si se invalida explícitamente.
+
+    `sucios` guarda, por tabla, las claves de fila modificadas en memoria que
+    aún no se enviaron al almacenamiento, cada una con el objeto que tenía al
+    marcarse por primera vez (de ahí sale la versión esperada al escribir).
+    """
+
+    def __init__(self, intervalo_revision=10.0, ruta_cache_movimientos=None, ruta_puntos_stock=None):
+        self.lock = threading.RLock()
+        self.catalogo = {}
+        self.movimientos = HistorialMovimientos(ruta_cache_movimientos)
+        self.proyeccion = ProyeccionStock(ruta_puntos_stock)
+        self.resumen = ResumenStock()
+        self.vencimientos = IndiceVencimientos()
+        self.busqueda = IndiceBusqueda()
+        self.sucios = defaultdict(dict)
+        self.version = 0
+        self.revision = None
+        # Celdas ilegibles de la última carga (DataFrame de `carga.columnas_informe`)
+        self.informe_carga = None
+        self._vistas = {}
+        self._version_vistas = None
+        self.intervalo_revision = intervalo_revision
+        self._cargada = False
+        self._ultima_comprobacion = 0.0
+
+    @property
+    def cargada(self):
+        return self._cargada
+
+    def necesita_recarga(self, alm):
+        """True si nunca se cargó, se invalidó o el backend informa otra revisión.
+
+        La comprobación remota se hace como mucho una vez cada `intervalo_revision` segundos.
+        """
+        if not self._cargada:
+            return True
+        ahora = time.monotonic()
+        if ahora - self._ultima_comprobacion < self.intervalo_revision:
+            return False
+        self._ultima_comprobacion = ahora
+        try:
+            remota = alm.revision()
+        except Exception:
+            return False
+        # Las escrituras propias hechas sobre lo que hay en memoria ya están en ella;
+        # si otra terminal escribió antes que alguna, la cadena se corta y se recarga
+        self.revision = alm.seguir_escrituras(self.revision)
+        return remota != self.revision
+
+    def vista(self, nombre, construir):
+        """Vista derivada (p. ej. un DataFrame) que se construye una sola vez por versión.
+
+        La vista se comparte entre sesiones: quien la use no debe modificarla.
+        """
+        with self.lock:
+            if self._version_vistas != self.version:
+                # Cambiaron los datos: se descartan todas las vistas anteriores
+                self._vistas.clear()
+                self._version_vistas = self.version
+            if nombre not in self._vistas:
+                self._vistas[nombre] = construir()
+            return self._vistas[nombre]
+
+    def marcar_sucio(self, tabla, clave, objeto=None):
+        self.sucios[tabla].setdefault(clave, objeto)
+
+    def tomar_sucios(self, tabla):
+        """Devuelve {clave: objeto} de las filas pendientes de la tabla y las da por enviadas"""
+        return self.sucios.pop(tabla, {})
+
+    def marcar_cargada(self, revision):
+        self.sucios.clear()
+        self.revision = revision
+        self.version += 1
+        self._cargada = True
+        self._ultima_comprobacion = time.monotonic()
+
+    def marcar_escritura(self):
+        """Registra una escritura propia: la memoria ya está al día, solo cambia la versión"""
+        self.version += 1
+
+    def invalidar(self):
+        """Fuerza una recarga completa en el próximo run"""
+        self._cargada = False
@@ -0,0 +1,615 @@
+from contextlib import contextmanager
+from datetime import datetime
+
+import pandas as pd
+
+from almacenamiento import (
+    CATALOGO_WS, INVENTARIO_WS, MOVIMIENTOS_WS, movimientos_headers, nuevo_sello,
+)
+from archivos import exportar_csv, exportar_excel
+from carga import informe_vacio, tipar_catalogo, tipar_inventario, valores_catalogo, valores_inventario
+from escritura_diferida import aplicar_cambios
+from instantanea import Instantanea
+from metricas import cronometrar, medir
+from modelo import Producto, StockInsuficiente
+from reportes import columnas_stock, reporte_stock
+
+# Columnas de la vista de inventario: cada lote con los datos de su producto
+columnas_inventario = ["codigo", "nombre", "marca", "cantidad", "fecha_vencimiento", "precio_costo", "precio_venta"]
+
+# Estados de una alerta de vencimiento, del más al menos urgente
+VENCIDO = 'vencido'
+VENCE_CRITICO = 'critico'
+VENCE_ADVERTENCIA = 'advertencia'
+VENCE_PREVENTIVO = 'preventivo'
+
+
+class ProductoInexistente(LookupError):
+    """El código no está en el catálogo"""
+
+
+def normalizar_fecha(fecha_obj) -> str:
+    if not fecha_obj: return ""
+    try:
+        if isinstance(fecha_obj, str):
+            fecha_obj = fecha_obj.strip()
+            if ' ' in fecha_obj: fecha_obj = fecha_obj.split(' ')[0]
+            if 'T' in fecha_obj: fecha_obj = fecha_obj.split('T')[0]
+            return fecha_obj
+
+        if hasattr(fecha_obj, 'strftime'):
+            return fecha_obj.strftime("%Y-%m-%d")
+
+        return str(fecha_obj).split(' ')[0]
+    except: return ""
+
+def convertir_a_numero(valor, por_defecto=0):
+    if valor is None or valor == '': return por_defecto
+    try: return int(valor)
+    except (ValueError, TypeError):
+        try: return float(valor)
+        except (ValueError, TypeError): return por_defecto
+
+def interpretar_escaneo(texto):
+    """'5*CODIGO' -> ('CODIGO', 5); un código solo cuenta como 1 unidad.
+
+    Si lo que va antes del '*' no es un número la cantidad es None (escaneo inválido).
+    """
+    if "*" in texto:
+        cantidad, codigo = texto.split("*", 1)
+        return codigo.strip(), convertir_a_numero(cantidad.strip(), por_defecto=None)
+    return texto.strip(), 1
+
+
+class Inventario:
+    """Lógica del inventario sin interfaz: carga, entradas, salidas y reportes.
+
+    Trabaja sobre una `Instantanea` (los datos en memoria, que puede compartirse
+    entre sesiones) y un backend de `almacenamiento`. Con una `ColaEscritura`
+    las operaciones se guardan en segundo plano; sin ella, al terminar cada una.
+    No depende de Streamlit: los errores de guardado se propagan como
+    excepciones y los de lectura se devuelven como avisos.
+
+    Con `stock_desde_movimientos` el stock de los lotes se calcula del log de
+    movimientos (ver `proyeccion.ProyeccionStock`) y la pestaña inventario pasa
+    a ser una copia derivada: se escribe sin comprobar versiones y, si difiere
+    del log (p. ej. tras un guardado cortado), al cargar se avisa y manda el log.
+    """
+
+    def __init__(self, alm, instantanea=None, cola=None, stock_desde_movimientos=False):
+        self.alm = alm
+        self.instantanea = instantanea if instantanea is not None else Instantanea()
+        self.cola = cola
+        if cola is not None:
+            # Si el guardado en segundo plano tuvo que rebasar, la memoria ya no coincide
+            cola.al_desincronizar = self.invalidar
+        self.stock_desde_movimientos = stock_desde_movimientos
+        # Movimientos acumulados por la operación en curso (None si no hay ninguna abierta)
+        self._movimientos_pendientes = None
+
+    @property
+    def lock(self):
+        return self.instantanea.lock
+
+    @property
+    def catalogo(self):
+        return self.instantanea.catalogo
+
+    @property
+    def movimientos(self):
+        return self.instantanea.movimientos
+
+    @property
+    def informe_carga(self):
+        """Celdas que no se pudieron interpretar en la última carga (ver `carga.columnas_informe`)"""
+        return self.instantanea.informe_carga
+
+    def stock_total(self, codigo) -> int:
+        return self.instantanea.resumen.stock(codigo)
+
+    # --- Carga ---
+
+    @cronometrar()
+    def cargar(self):
+        """Carga los datos del almacenamiento en la instantánea.
+
+        Devuelve la lista de avisos (tablas que no se pudieron leer, celdas
+        inválidas); lo que sí se leyó queda cargado igual. Las celdas inválidas
+        se detallan en `informe_carga`.
+        """
+        inst, alm = self.instantanea, self.alm
+        catalogo = inst.catalogo
+        avisos, informes = [], []
+        catalogo.clear()
+
+        try:
+            alm.preparar()
+        except Exception as e:
+            avisos.append(f"Error verificando pestañas: {e}")
+        # La revisión y las tres tablas en una sola lectura (del log de movimientos,
+        # solo desde la última fila conocida: es de solo agregado)
+        try:
+            with medir("cargar.lectura"):
+                revision, leidas = alm.leer_varias({
+                    CATALOGO_WS: 0, INVENTARIO_WS: 0, MOVIMIENTOS_WS: inst.movimientos.desde_sincronizar(alm),
+                })
+        except Exception as e:
+            avisos.append(f"Error leyendo datos: {e}")
+            revision, leidas = None, {}
+
+        # 1. Catálogo (datos del producto y stock mínimo)
+        try:
+            with medir("cargar.catalogo"):
+                productos, problemas = tipar_catalogo(leidas.get(CATALOGO_WS, []))
+                informes.append(problemas)
+                for codigo, nombre, marca, pc, pv, smin in valores_catalogo(productos):
+                    catalogo[codigo] = Producto(codigo, nombre, marca, pc, pv, smin)
+        except Exception as e: avisos.append(f"Error leyendo catálogo: {e}")
+
+        # 2. Movimientos (solo las filas nuevas)
+        try:
+            if MOVIMIENTOS_WS in leidas:
+                with medir("cargar.movimientos"):
+                    inst.movimientos.sincronizar(alm, leidas[MOVIMIENTOS_WS])
+        except Exception as e: avisos.append(f"Error leyendo movimientos: {e}")
+
+        # 3. Inventario (lotes)
+        try:
+            with medir("cargar.inventario"):
+                if self.stock_desde_movimientos:
+                    if MOVIMIENTOS_WS in leidas:
+                        lotes, problemas = tipar_inventario(leidas.get(INVENTARIO_WS, []))
+                        informes.append(problemas)
+                        avisos += self._lotes_desde_movimientos(lotes)
+                else:
+                    lotes, problemas = tipar_inventario(leidas.get(INVENTARIO_WS, []))
+                    informes.append(problemas)
+                    for codigo, cant, fv, vencimiento, version, guardada in valores_inventario(lotes):
+                        if codigo not in catalogo:
+                            # Lote sin fila en el catálogo: el producto queda sin datos hasta que se edite
+                            catalogo[codigo] = Producto(codigo)
+                        catalogo[codigo].agregar_lote(cant, fv, version, vencimiento, guardada)
+        except Exception as e: avisos.append(f"Error leyendo inventario: {e}")
+
+        # Celdas ilegibles: no se cargan como 0, se informan
+        informes = [i for i in informes if len(i)]
+        inst.informe_carga = pd.concat(informes, ignore_index=True) if informes else informe_vacio()
+        if len(inst.informe_carga):
+            avisos.append(
+                f"{len(inst.informe_carga)} celdas con valores inválidos; "
+                "se detallan en el informe de validación de la carga"
+            )
+
+        with medir("cargar.indices"):
+            inst.resumen.reconstruir(catalogo)
+            inst.vencimientos.reconstruir(catalogo)
+            inst.busqueda.reconstruir(catalogo)
+
+        inst.marcar_cargada(revision)
+        return avisos
+
+    def _lotes_desde_movimientos(self, lotes):
+        """Arma los lotes con el stock calculado del log; de la pestaña inventario (`lotes`,
+        de `tipar_inventario`) solo se toman los sellos de versión y se avisa si sus
+        cantidades no coinciden"""
+        catalogo = self.catalogo
+        tabla = {
+            (codigo, fv): (cant, version, guardada)
+            for codigo, cant, fv, _, version, guardada in valores_inventario(lotes)
+        }
+
+        self.instantanea.proyeccion.sincronizar(self.movimientos)
+        for (codigo, fv), cantidad in self.instantanea.proyeccion.stock.items():
+            if cantidad <= 0: continue
+            fv = normalizar_fecha(fv)
+            if codigo not in catalogo:
+                catalogo[codigo] = Producto(codigo)
+            _, version, guardada = tabla.get((codigo, fv), (0, None, None))
+            catalogo[codigo].agregar_lote(cantidad, fv, version, fecha_guardada=guardada)
+
+        calculado = {(p.codigo, l.fecha_vencimiento): l.cantidad for p in catalogo.values() for l in p.lotes}
+        guardado = {clave: cantidad for clave, (cantidad, _, _) in tabla.items() if cantidad > 0}
+        distintos = sum(calculado.get(k) != guardado.get(k) for k in calculado.keys() | guardado.keys())
+        if distintos:
+            return [
+                f"{distintos} lotes de la pestaña inventario no coinciden con el log de movimientos; "
+                "se usa el stock calculado desde los movimientos"
+            ]
+        return []
+
+    @cronometrar()
+    def sincronizar(self, espera_cola=30):
+        """Carga los datos si hace falta (primera vez, invalidados o cambiados por otra terminal).
+
+        Con escrituras sin confirmar la memoria va por delante del almacenamiento:
+        no se recarga hasta que la cola se vacíe (salvo la primera carga, que
+        espera hasta `espera_cola` segundos). Devuelve los avisos de la carga.
+        """
+        with self.lock:
+            ocupada = self.cola is not None and self.cola.ocupada()
+            if not self.instantanea.cargada:
+                if ocupada:
+                    self.cola.vaciar(timeout=espera_cola)
+                return self.cargar()
+            if not ocupada and self.instantanea.necesita_recarga(self.alm):
+                return self.cargar()
+            return []
+
+    def invalidar(self):
+        self.instantanea.invalidar()
+
+    # --- Guardado ---
+    # Los cambios en memoria se marcan con marcar_lote / marcar_producto y solo esas
+    # filas se envían al guardar (un lote que ya no está en memoria se borra).
+    # Los lotes se escriben de forma condicional a la versión con que se leyeron,
+    # así dos terminales que venden lo mismo a la vez no se pisan las cantidades.
+
+    def marcar_lote(self, lote):
+        self.instantanea.marcar_sucio(INVENTARIO_WS, (lote.producto.codigo, lote.fecha_vencimiento), lote)
+
+    def marcar_producto(self, codigo):
+        self.instantanea.marcar_sucio(CATALOGO_WS, (codigo,))
+
+    def fijar_stock_minimo(self, codigo, valor):
+        self.catalogo[codigo].stock_minimo = valor
+        self.marcar_producto(codigo)
+
+    def _cambios_inventario(self):
+        """Filas, claves borradas, versiones esperadas y sellos propios de los lotes marcados;
+        los da por enviados.
+
+        La versión esperada y la cantidad anterior son las del lote al marcarse;
+        cada lote escrito recibe un sello nuevo (ver 'propias' en
+        `escritura_diferida._rebasar`). Un lote borrado también lleva uno, por
+        si al rebasar vuelve a quedar con stock. Las filas se identifican por la
+        fecha tal como está guardada (`Lote.fecha_guardada`), que puede tener hora.
+        """
+        filas, borradas, esperadas, propias = [], [], [], []
+        for (codigo, fv), marcado in self.instantanea.tomar_sucios(INVENTARIO_WS).items():
+            clave = [codigo, marcado.fecha_guardada]
+            esperadas.append([clave, marcado.version, marcado.guardada])
+            producto = self.catalogo.get(codigo)
+            lote = producto.buscar_lote(fv) if producto else None
+            if lote is None:
+                borradas.append(tuple(clave))
+                propias.append([clave, nuevo_sello(), 0])
+            else:
+                lote.version, lote.guardada = nuevo_sello(), lote.cantidad
+                filas.append(lote.fila())
+                propias.append([clave, lote.version, lote.cantidad])
+        return filas, borradas, esperadas, propias
+
+    def _cambios_catalogo(self):
+        filas, borradas = [], []
+        for (codigo,) in self.instantanea.tomar_sucios(CATALOGO_WS):
+            if codigo in self.catalogo:
+                filas.append(self.catalogo[codigo].fila())
+            else:
+                borradas.append((codigo,))
+        return filas, borradas
+
+    @contextmanager
+    def operacion(self):
+        """Unidad de trabajo para una entrada o salida completa.
+
+        Dentro del bloque (y con `lock` tomado), registrar_movimiento solo
+        acumula las filas. Al salir se guardan los productos y lotes marcados y
+        todos los movimientos en un solo agregar, dentro de una misma
+        transacción del almacenamiento. Con escritura diferida la operación
+        solo se encola y el guardado ocurre en segundo plano. Si algo falla la
+        instantánea se invalida y la excepción se propaga.
+        """
+        self._movimientos_pendientes = []
+        try:
+            yield
+            pendientes = self._movimientos_pendientes
+        except Exception:
+            # La memoria pudo quedar a medio modificar: se descarta y se recarga
+            self.invalidar()
+            raise
+        finally:
+            self._movimientos_pendientes = None
+
+        filas_cat, borradas_cat = self._cambios_catalogo()
+        filas_inv, borradas_inv, esperadas_inv, propias_inv = self._cambios_inventario()
+        inventario = {'tabla': INVENTARIO_WS, 'filas': filas_inv, 'borradas': borradas_inv}
+        if not self.stock_desde_movimientos:
+            inventario['esperadas'] = esperadas_inv
+            inventario['propias'] = propias_inv
+        # Los movimientos van al final. Si el guardado se corta antes de ellos y la
+        # cola lo reintenta, los lotes que ya se escribieron se reconocen por su
+        # sello y no se descuentan dos veces (ver `escritura_diferida._rebasar`);
+        # si se cortó después, la clave de la operación guardada con los
+        # movimientos evita repetirla (ver `ColaEscritura`).
+        cambios = [
+            {'tabla': CATALOGO_WS, 'filas': filas_cat, 'borradas': borradas_cat},
+            inventario,
+            {'tabla': MOVIMIENTOS_WS, 'filas': [[str(x) for x in fila] for fila in pendientes]},
+        ]
+        try:
+            if self.cola is not None:
+                self.cola.encolar(cambios)
+            elif aplicar_cambios(self.alm, cambios):
+                # Otra terminal tocó los mismos lotes: se guardó la diferencia y se recarga
+                self.invalidar()
+            self.movimientos.extend(pendientes)
+            self.instantanea.marcar_escritura()
+        except Exception:
+            self.invalidar()
+            raise
+
+    @cronometrar()
+    def registrar_movimiento(self, tipo, codigo, nombre, cantidad, fecha_vencimiento, precio_costo, precio_venta):
+        nueva_fila = [
+            datetime.now().isoformat(timespec="seconds"),
+            tipo,
+            str(codigo),
+            nombre,
+            cantidad,
+            fecha_vencimiento or "",
+            precio_costo if precio_costo is not None else 0,
+            precio_venta if precio_venta is not None else 0,
+        ]
+        if self._movimientos_pendientes is not None:
+            self._movimientos_pendientes.append(nueva_fila)
+            return
+        try:
+            self.alm.agregar(MOVIMIENTOS_WS, [[str(x) for x in nueva_fila]])
+            self.movimientos.append(nueva_fila)
+            self.instantanea.marcar_escritura()
+        except Exception:
+            self.invalidar()
+            raise
+
+    # --- Entradas y salidas ---
+
+    def _nuevo_producto(self, codigo, nombre, marca, precio_costo, precio_venta):
+        inst = self.instantanea
+        producto = Producto(codigo, nombre, marca, precio_costo, precio_venta)
+        self.catalogo[codigo] = producto
+        inst.resumen.registrar(producto)
+        inst.vencimientos.registrar(producto)
+        inst.busqueda.registrar(producto)
+        self.marcar_producto(codigo)
+        return producto
+
+    def _completar_producto(self, producto, nombre, marca, precio_costo, precio_venta):
+        """Productos del catálogo sin nombre (p. ej. solo tenían stock mínimo) se completan al ingresar"""
+        producto.nombre, producto.marca = nombre, marca
+        producto.precio_costo, producto.precio_venta = precio_costo, precio_venta
+        self.instantanea.busqueda.registrar(producto)
+        self.marcar_producto(producto.codigo)
+
+    @cronometrar()
+    def registrar_entrada(self, codigo, cantidad, fecha_vencimiento="", nombre="", marca="",
+                          precio_costo=0, precio_venta=0, stock_minimo=None):
+        """Ingresa `cantidad` unidades de `codigo`; devuelve un mensaje para mostrar.
+
+        Un código nuevo crea el producto con los datos dados; si ya existe pero
+        no tiene nombre, se completan. Si hay un lote con la misma fecha se le
+        suma la cantidad; si no, se crea el lote. El stock mínimo se fija al
+        crear el producto o un lote nuevo.
+        """
+        fv = normalizar_fecha(fecha_vencimiento)
+        with self.lock, self.operacion():
+            producto = self.catalogo.get(codigo)
+            lote_nuevo = True
+            if producto is None:
+                producto = self._nuevo_producto(codigo, nombre, marca, precio_costo, precio_venta)
+                lote = producto.agregar_lote(cantidad, fv)
+                mensaje = f'Producto {nombre} creado con éxito'
+            else:
+                if not producto.nombre:
+                    self._completar_producto(producto, nombre, marca, precio_costo, precio_venta)
+                lote = producto.buscar_lote(fv)
+                if lote is not None:
+                    lote_nuevo = False
+                    lote.cantidad += cantidad
+                    mensaje = f"Se agregaron {cantidad} unidades al lote existente ({fv})"
+                else:
+                    lote = producto.agregar_lote(cantidad, fv)
+                    mensaje = f"Se creó un nuevo lote con {cantidad} unidades ({fv})"
+            if lote_nuevo and stock_minimo is not None:
+                self.fijar_stock_minimo(codigo, stock_minimo)
+
+            self.marcar_lote(lote)
+            self.registrar_movimiento(
+                "entrada", codigo, producto.nombre, cantidad, fv, producto.precio_costo, producto.precio_venta
+            )
+        return mensaje
+
+    @cronometrar()
+    def importar_lotes(self, lotes):
+        """Registra como entradas los lotes de un archivo (ver `archivos.leer_entregas`).
+
+        Sigue las mismas reglas que `registrar_entrada`, pero todo va en una sola
+        operación: un guardado de lotes y productos y un solo agregar de movimientos.
+        """
+        with self.lock, self.operacion():
+            for codigo, fv, cantidad, nombre, marca, pc, pv, smin in lotes[[
+                "codigo", "fecha_vencimiento", "cantidad", "nombre", "marca", "precio_costo", "precio_venta", "stock_min"
+            ]].itertuples(index=False, name=None):
+                pc, pv = (int(x) if float(x).is_integer() else float(x) for x in (pc, pv))
+                producto = self.catalogo.get(codigo)
+                if producto is None:
+                    producto = self._nuevo_producto(codigo, nombre, marca, pc, pv)
+                elif not producto.nombre and nombre:
+                    self._completar_producto(producto, nombre, marca, pc, pv)
+                if producto.buscar_lote(fv) is None and not pd.isna(smin):
+                    self.fijar_stock_minimo(codigo, int(smin))
+
+                self.marcar_lote(producto.agregar_lote(int(cantidad), fv))
+                self.registrar_movimiento(
+                    "entrada", codigo, producto.nombre, int(cantidad), fv, producto.precio_costo, producto.precio_venta
+                )
+
+    def agregar_a_salida(self, carrito, codigo, cantidad=1):
+        """Suma `cantidad` de `codigo` al carrito ({codigo: cantidad}) si hay stock para todo lo pedido"""
+        if codigo not in self.catalogo:
+            raise ProductoInexistente(codigo)
+        disponible = self.stock_total(codigo)
+        if carrito.get(codigo, 0) + cantidad > disponible:
+            raise StockInsuficiente(codigo, disponible)
+        carrito[codigo] = carrito.get(codigo, 0) + cantidad
+
+    @cronometrar()
+    def agregar_escaneos(self, carrito, texto):
+        """Agrega al carrito una ráfaga de escaneos (uno por línea, 'CODIGO' o 'N*CODIGO') en una pasada.
+
+        Cada escaneo se valida en orden contra el stock en memoria, como con
+        `agregar_a_salida`: uno que no entra no impide los siguientes. Devuelve
+        ({codigo: unidades agregadas}, [(escaneo, motivo)] de los rechazados).
+        """
+        agregados, rechazados = {}, []
+        with self.lock:
+            for linea in texto.splitlines():
+                if not linea.strip(): continue
+                codigo, cantidad = interpretar_escaneo(linea)
+                if not isinstance(cantidad, int) or cantidad <= 0:
+                    rechazados.append((linea.strip(), "Cantidad inválida"))
+                    continue
+                try:
+                    self.agregar_a_salida(carrito, codigo, cantidad)
+                except ProductoInexistente:
+                    rechazados.append((linea.strip(), "El código no existe"))
+                except StockInsuficiente as e:
+                    rechazados.append((linea.strip(), f"Stock insuficiente (disponible: {e.disponible})"))
+                else:
+                    agregados[codigo] = agregados.get(codigo, 0) + cantidad
+        return agregados, rechazados
+
+    @cronometrar()
+    def confirmar_salida(self, carrito):
+        """Descuenta cada producto del carrito en orden FIFO (los lotes que vencen antes primero)"""
+        with self.lock, self.operacion():
+            for codigo, cantidad in carrito.items():
+                producto = self.catalogo.get(codigo)
+                if producto is None: continue
+
+                for lote, toma in producto.consumir(cantidad):
+                    self.marcar_lote(lote)
+                    if toma:
+                        self.registrar_movimiento(
+                            "salida", codigo, producto.nombre, toma, lote.fecha_vencimiento,
+                            producto.precio_costo, producto.precio_venta
+                        )
+
+                # Sin lotes el producto sigue en el catálogo, pero ya no cuenta como stock
+                if not producto.lotes:
+                    self.instantanea.resumen.quitar(codigo)
+
+    # --- Consultas y reportes ---
+
+    @cronometrar()
+    def productos_con_stock(self):
+        """[(codigo, nombre, marca)] de los productos con lotes, por nombre"""
+        with self.lock:
+            productos = [
+                (codigo, p.nombre or 'N/A', p.marca or 'N/A') for codigo, p in self.catalogo.items() if p.lotes
+            ]
+        return sorted(productos, key=lambda x: x[1])
+
+    def buscar(self, texto):
+        """Códigos que coinciden con `texto`, del más al menos relevante"""
+        with self.lock:
+            return self.instantanea.busqueda.buscar(texto)
+
+    def _construir_df_inventario(self):
+        filas = [
+            [p.codigo, p.nombre, p.marca, l.cantidad, l.fecha_vencimiento, p.precio_costo, p.precio_venta]
+            for p in self.catalogo.values() for l in p.lotes
+        ]
+        df = pd.DataFrame(filas, columns=columnas_inventario)
+        df['cantidad'] = df['cantidad'].astype('int64')
+        for col in ('precio_costo', 'precio_venta'):
+            df[col] = pd.to_numeric(df[col])
+        return df
+
+    @cronometrar()
+    def df_inventario(self):
+        """Inventario (un lote por fila) ya tipado; se arma una vez por versión de los datos"""
+        return self.instantanea.vista(INVENTARIO_WS, self._construir_df_inventario)
+
+    @cronometrar()
+    def reporte_niveles_stock(self, factor_advertencia):
+        """(tabla de niveles, conteo por estado), cacheado por versión y umbral; ver `reportes.reporte_stock`"""
+        inst = self.instantanea
+        def construir():
+            columnas = inst.vista('columnas_stock', lambda: columnas_stock(self.catalogo))
+            return reporte_stock(columnas, factor_advertencia)
+        return inst.vista(f'reporte_stock:{factor_advertencia}', construir)
+
+    @cronometrar()
+    def consultar_movimientos(self, desde=None, hasta=None, tipos=None, codigo=None):
+        with self.lock:
+            return self.movimientos.consultar(desde, hasta, tipos, codigo)
+
+    @cronometrar()
+    def serie_movimientos(self, desde, hasta, nivel, tipos=None, codigo=None):
+        """Totales por hora/día/semana; la serie se reutiliza mientras no cambien los datos"""
+        clave = f"serie:{desde}:{hasta}:{nivel}:{sorted(tipos or [])}:{codigo}"
+        with self.lock:
+            return self.instantanea.vista(clave, lambda: self.movimientos.serie(desde, hasta, nivel, tipos, codigo))
+
+    @cronometrar()
+    def stock_al(self, hasta):
+        """Stock de cada lote según los movimientos anteriores a `hasta`, calculado desde el log.
+
+        DataFrame (codigo, nombre, fecha_vencimiento, cantidad) ordenado por
+        código y vencimiento; solo los lotes que tenían stock. Se reutiliza
+        mientras no cambien los datos.
+        """
+        def construir():
+            stock = self.instantanea.proyeccion.stock_al(self.movimientos, hasta)
+            filas = [
+                [codigo, self.catalogo[codigo].nombre if codigo in self.catalogo else "", fv, cantidad]
+                for (codigo, fv), cantidad in stock.items()
+            ]
+            df = pd.DataFrame(filas, columns=["codigo", "nombre", "fecha_vencimiento", "cantidad"])
+            return df.sort_values(["codigo", "fecha_vencimiento"], ignore_index=True)
+        with self.lock:
+            return self.instantanea.vista(f"stock_al:{hasta}", construir)
+
+    @cronometrar()
+    def alertas_vencimiento(self, hoy, dias_critico, dias_advertencia, dias_preventivo):
+        """Lotes vencidos o que vencen dentro del mayor plazo, en orden de vencimiento.
+
+        `hoy` es un ordinal de fecha. Devuelve [{estado, fecha_vencimiento,
+        dias, nombre, cantidad, codigo}] con estado VENCIDO, VENCE_CRITICO,
+        VENCE_ADVERTENCIA o VENCE_PREVENTIVO.
+        """
+        alertas = []
+        with self.lock:
+            # El índice devuelve, ya ordenados, solo los lotes que vencen dentro del mayor rango
+            for lote in self.instantanea.vencimientos.hasta(hoy + max(dias_critico, dias_advertencia, dias_preventivo)):
+                dias = lote.vencimiento - hoy
+                if dias < 0: estado = VENCIDO
+                elif dias <= dias_critico: estado = VENCE_CRITICO
+                elif dias <= dias_advertencia: estado = VENCE_ADVERTENCIA
+                elif dias <= dias_preventivo: estado = VENCE_PREVENTIVO
+                else: continue
+                alertas.append({
+                    'estado': estado, 'fecha_vencimiento': lote.fecha_vencimiento, 'dias': dias,
+                    'nombre': lote.producto.nombre, 'cantidad': lote.cantidad, 'codigo': lote.producto.codigo,
+                })
+        return alertas
+
+    def _filas_inventario(self):
+        for p in self.catalogo.values():
+            for l in p.lotes:
+                yield [p.codigo, p.nombre, p.marca, l.cantidad, l.fecha_vencimiento, p.precio_costo, p.precio_venta]
+
+    def _filas_movimientos(self):
+        return zip(*(self.movimientos.columnas()[c] for c in movimientos_headers))
+
+    @cronometrar()
+    def exportar(self, tabla, formato):
+        """Bytes del archivo de inventario o movimientos ('csv' o 'xlsx'), generado por trozos"""
+        with self.lock:
+            if tabla == INVENTARIO_WS:
+                cabeceras, filas = columnas_inventario, self._filas_inventario()
+            else:
+                cabeceras, filas = movimientos_headers, self._filas_movimientos()
+            if formato == "xlsx":
+                return exportar_excel(cabeceras, filas, tabla)
+            return b"".join(exportar_csv(cabeceras, filas))
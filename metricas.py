@@ -0,0 +1,183 @@
+import functools
+import json
+import logging
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+
+log = logging.getLogger("inventario.metricas")
+
+# Filas que se miden para estimar el tamaño de una lista grande
+_MUESTRA = 50
+
+
+class Ronda:
+    """Lo medido durante un rerun: tiempo por función y llamadas/bytes a la API externa."""
+
+    def __init__(self, etiqueta=""):
+        self.etiqueta = etiqueta
+        self.inicio = time.time()
+        self._inicio_reloj = time.perf_counter()
+        self.duracion = None
+        self.tiempos = {}  # nombre -> [veces, segundos]
+        self.llamadas = Counter()
+        self.bytes_enviados = 0
+        self.bytes_recibidos = 0
+        self.segundos_api = 0.0
+        self._lock = threading.Lock()
+
+    def sumar_tiempo(self, nombre, segundos):
+        with self._lock:
+            acumulado = self.tiempos.setdefault(nombre, [0, 0.0])
+            acumulado[0] += 1
+            acumulado[1] += segundos
+
+    def sumar_llamada(self, metodo, segundos, enviados, recibidos):
+        with self._lock:
+            self.llamadas[metodo] += 1
+            self.segundos_api += segundos
+            self.bytes_enviados += enviados
+            self.bytes_recibidos += recibidos
+
+    def terminar(self):
+        if self.duracion is None:
+            self.duracion = time.perf_counter() - self._inicio_reloj
+
+    def resumen(self):
+        """Dict serializable, con los tiempos de mayor a menor"""
+        with self._lock:
+            duracion = self.duracion if self.duracion is not None else time.perf_counter() - self._inicio_reloj
+            return {
+                'etiqueta': self.etiqueta,
+                'inicio': datetime.fromtimestamp(self.inicio).isoformat(timespec="seconds"),
+                'segundos': round(duracion, 4),
+                'tiempos': {
+                    nombre: {'veces': veces, 'segundos': round(segundos, 4)}
+                    for nombre, (veces, segundos) in sorted(self.tiempos.items(), key=lambda x: -x[1][1])
+                },
+                'llamadas_api': dict(self.llamadas),
+                'total_llamadas_api': sum(self.llamadas.values()),
+                'segundos_api': round(self.segundos_api, 4),
+                'bytes_enviados': self.bytes_enviados,
+                'bytes_recibidos': self.bytes_recibidos,
+            }
+
+
+# Acumulado del proceso (todas las sesiones y el hilo de escritura diferida)
+TOTALES = Ronda("proceso")
+_activa = threading.local()
+
+
+def activar(ronda):
+    """Hace de `ronda` la destinataria de lo que se mida en este hilo (None para ninguna)"""
+    _activa.ronda = ronda
+
+
+def ronda_actual():
+    return getattr(_activa, "ronda", None)
+
+
+def _destinos():
+    ronda = ronda_actual()
+    return (TOTALES,) if ronda is None else (TOTALES, ronda)
+
+
+@contextmanager
+def medir(nombre):
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        segundos = time.perf_counter() - inicio
+        for destino in _destinos():
+            destino.sumar_tiempo(nombre, segundos)
+
+
+def cronometrar(nombre=None):
+    """Decorador: mide cada llamada a la función con `medir`"""
+    def decorador(funcion):
+        etiqueta = nombre or funcion.__qualname__
+        @functools.wraps(funcion)
+        def envoltura(*args, **kwargs):
+            with medir(etiqueta):
+                return funcion(*args, **kwargs)
+        return envoltura
+    return decorador
+
+
+def registrar_llamada(metodo, segundos, enviados=0, recibidos=0):
+    for destino in _destinos():
+        destino.sumar_llamada(metodo, segundos, enviados, recibidos)
+
+
+def estimar_bytes(valor):
+    """Tamaño aproximado de un valor de la API; en listas largas se extrapola de una muestra"""
+    if valor is None: return 0
+    if isinstance(valor, (str, bytes)): return len(valor)
+    if isinstance(valor, (int, float)): return len(str(valor))
+    if isinstance(valor, dict):
+        return sum(len(str(k)) + estimar_bytes(v) for k, v in valor.items())
+    if isinstance(valor, (list, tuple)):
+        if len(valor) <= _MUESTRA:
+            return sum(estimar_bytes(v) for v in valor)
+        paso = len(valor) // _MUESTRA
+        return sum(estimar_bytes(v) for v in valor[::paso][:_MUESTRA]) * len(valor) // _MUESTRA
+    return 0
+
+
+class _ApiMedida:
+    """Envuelve un objeto de gspread: cada método público cuenta como una llamada a la API"""
+
+    # Métodos que devuelven pestañas, que también se envuelven
+    _DEVUELVEN_PESTANAS = ('worksheet', 'worksheets', 'add_worksheet')
+
+    def __init__(self, objeto, prefijo):
+        self._objeto = objeto
+        self._prefijo = prefijo
+
+    def __getattr__(self, nombre):
+        valor = getattr(self._objeto, nombre)
+        if nombre.startswith("_") or not callable(valor):
+            return valor
+
+        metodo = f"{self._prefijo}.{nombre}"
+        def llamada(*args, **kwargs):
+            inicio = time.perf_counter()
+            resultado = valor(*args, **kwargs)
+            registrar_llamada(
+                metodo, time.perf_counter() - inicio, estimar_bytes(args) + estimar_bytes(kwargs),
+                estimar_bytes(resultado) if nombre not in self._DEVUELVEN_PESTANAS else 0,
+            )
+            if nombre == 'worksheets':
+                return [_ApiMedida(ws, "Worksheet") for ws in resultado]
+            if nombre in self._DEVUELVEN_PESTANAS:
+                return _ApiMedida(resultado, "Worksheet")
+            return resultado
+        return llamada
+
+
+def medir_libro(sh):
+    """`gspread.Spreadsheet` que registra cada petición (y la de sus pestañas) en las métricas"""
+    return _ApiMedida(sh, "Spreadsheet")
+
+
+class RegistroMetricas:
+    """Escribe el resumen de cada ronda como una línea JSON en `ruta` y en el log `inventario.metricas`"""
+
+    def __init__(self, ruta=None):
+        self.ruta = ruta
+        self._lock = threading.Lock()
+
+    def escribir(self, ronda):
+        ronda.terminar()
+        linea = json.dumps(ronda.resumen(), ensure_ascii=False)
+        log.debug(linea)
+        if not self.ruta: return
+        with self._lock:
+            try:
+                with open(self.ruta, "a", encoding="utf-8") as f:
+                    f.write(linea + "\n")
+            except OSError as e:
+                log.warning("No se pudo escribir %s: %s", self.ruta, e)
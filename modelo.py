@@ -0,0 +1,256 @@
+from bisect import bisect_left, insort
+from datetime import date
+
+# Ordinal usado para lotes sin fecha (o con una fecha ilegible): ordena al final en FIFO
+SIN_VENCIMIENTO = date.max.toordinal()
+
+
+def fecha_a_ordinal(fecha: str) -> int:
+    """'AAAA-MM-DD' -> date.toordinal(); vacía o inválida -> SIN_VENCIMIENTO"""
+    if not fecha: return SIN_VENCIMIENTO
+    try:
+        return date.fromisoformat(fecha).toordinal()
+    except ValueError:
+        return SIN_VENCIMIENTO
+
+
+class StockInsuficiente(ValueError):
+    def __init__(self, codigo, disponible):
+        super().__init__(f"Stock insuficiente para {codigo}. Disponible: {disponible}")
+        self.codigo = codigo
+        self.disponible = disponible
+
+
+class Producto:
+    """Entrada del catálogo: datos de un código, su stock mínimo y sus lotes.
+
+    Nombre, marca, precios y stock mínimo (None si no tiene) son la fila del
+    catálogo; los lotes solo guardan cantidad y vencimiento. `lotes` está siempre en orden FIFO (vencimiento
+    ascendente, sin fecha al final) y `_por_fecha` lleva de la fecha de
+    vencimiento a su lote. `stock` es la suma de las cantidades de sus lotes y
+    se mantiene al modificar `Lote.cantidad`; si el producto está registrado en
+    un `ResumenStock` o en un `IndiceVencimientos`, estos también se actualizan.
+    """
+
+    __slots__ = (
+        'codigo', 'nombre', 'marca', 'precio_costo', 'precio_venta', 'stock_minimo', 'lotes',
+        '_por_fecha', 'stock', 'resumen', 'vencimientos',
+    )
+
+    def __init__(self, codigo, nombre="", marca="", precio_costo=0, precio_venta=0, stock_minimo=None):
+        self.codigo = codigo
+        self.nombre = nombre
+        self.marca = marca
+        self.precio_costo = precio_costo
+        self.precio_venta = precio_venta
+        self.stock_minimo = stock_minimo
+        self.lotes = []
+        self._por_fecha = {}
+        self.stock = 0
+        self.resumen = None
+        self.vencimientos = None
+
+    def stock_total(self) -> int:
+        return self.stock
+
+    def fila(self):
+        """Fila de la pestaña catálogo"""
+        minimo = "" if self.stock_minimo is None else self.stock_minimo
+        return [self.codigo, self.nombre, self.marca, self.precio_costo, self.precio_venta, minimo]
+
+    def _sumar(self, delta):
+        self.stock += delta
+        if self.resumen is not None:
+            self.resumen.fijar_stock(self.codigo, self.stock)
+
+    def buscar_lote(self, fecha_vencimiento):
+        return self._por_fecha.get(fecha_vencimiento or "")
+
+    def agregar_lote(self, cantidad, fecha_vencimiento, version=None, vencimiento=None, fecha_guardada=None):
+        """Inserta el lote en su posición FIFO; si ya hay uno con esa fecha, le suma la cantidad.
+
+        `version` es el sello de la fila guardada, `vencimiento` el ordinal ya
+        calculado de la fecha y `fecha_guardada` el texto de la fecha en la
+        fila (solo al cargar un lote del almacenamiento).
+        """
+        lote = self.buscar_lote(fecha_vencimiento)
+        if lote is not None:
+            lote.cantidad += int(cantidad)
+            return lote
+        lote = Lote(self, cantidad, fecha_vencimiento, version, vencimiento, fecha_guardada)
+        # A igual vencimiento queda detrás de los existentes (insort usa bisect_right)
+        insort(self.lotes, lote, key=lambda l: l.vencimiento)
+        self._por_fecha[lote.fecha_vencimiento] = lote
+        if self.vencimientos is not None:
+            self.vencimientos.agregar(lote)
+        return lote
+
+    def consumir(self, cantidad):
+        """Descuenta `cantidad` desde el lote más antiguo y saca de la cabeza los que se vacían.
+
+        Devuelve [(lote, tomado)] de cada lote tocado, en orden FIFO. Los lotes
+        que ya estaban en 0 al frente también se quitan (con tomado = 0).
+        """
+        tocados = []
+        restante = cantidad
+        n = 0
+        for lote in self.lotes:
+            if restante <= 0 and lote.cantidad > 0: break
+            toma = min(lote.cantidad, restante)
+            lote.cantidad -= toma
+            restante -= toma
+            tocados.append((lote, toma))
+            if lote.cantidad > 0: break
+            n += 1
+
+        vacios = self.lotes[:n]
+        del self.lotes[:n]
+        for lote in vacios:
+            del self._por_fecha[lote.fecha_vencimiento]
+            if self.vencimientos is not None:
+                self.vencimientos.quitar(lote)
+        return tocados
+
+
+class Lote:
+    """Un lote de un producto: cantidad entera y vencimiento ya convertido a ordinal.
+
+    `fecha_vencimiento` es la fecha sin hora (la clave del lote en memoria) y
+    `vencimiento` el ordinal que usan FIFO y las alertas. `fecha_guardada` es
+    el texto de la fecha tal como está en la fila guardada (puede tener hora):
+    es la clave con la que se escribe la fila. `version` y `guardada` son el
+    sello y la cantidad de la fila tal como está en el almacenamiento (None y
+    0 si el lote todavía no se guardó).
+    """
+
+    __slots__ = ('producto', '_cantidad', 'fecha_vencimiento', 'fecha_guardada', 'vencimiento', 'version', 'guardada')
+
+    def __init__(self, producto, cantidad, fecha_vencimiento, version=None, vencimiento=None, fecha_guardada=None):
+        self.producto = producto
+        self._cantidad = 0
+        self.fecha_vencimiento = fecha_vencimiento or ""
+        self.fecha_guardada = self.fecha_vencimiento if fecha_guardada is None else fecha_guardada
+        self.vencimiento = fecha_a_ordinal(self.fecha_vencimiento) if vencimiento is None else vencimiento
+        self.cantidad = cantidad
+        self.version = version
+        self.guardada = self._cantidad if version is not None else 0
+
+    @property
+    def cantidad(self) -> int:
+        return self._cantidad
+
+    @cantidad.setter
+    def cantidad(self, valor):
+        valor = int(valor)
+        self.producto._sumar(valor - self._cantidad)
+        self._cantidad = valor
+
+    def fila(self):
+        """Fila de la pestaña inventario"""
+        return [self.producto.codigo, self.cantidad, self.fecha_guardada, self.version or ""]
+
+
+# Estados del semáforo de stock
+CRITICO = 'critico'
+ADVERTENCIA = 'advertencia'
+OPTIMO = 'optimo'
+
+
+class ResumenStock:
+    """Stock total de cada producto con lotes.
+
+    Se actualiza en O(1) por cada cambio de cantidad, así que no hace falta
+    recorrer el inventario para consultar un stock. Un producto sin lotes no
+    figura y su stock es 0.
+    """
+
+    def __init__(self):
+        self.totales = {}
+
+    def clear(self):
+        self.totales.clear()
+
+    def stock(self, codigo) -> int:
+        return self.totales.get(codigo, 0)
+
+    def registrar(self, producto):
+        """Empieza a seguir un producto agregado al inventario"""
+        producto.resumen = self
+        self.fijar_stock(producto.codigo, producto.stock)
+
+    def quitar(self, codigo):
+        """El producto se quedó sin lotes"""
+        self.totales.pop(codigo, None)
+
+    def fijar_stock(self, codigo, total):
+        self.totales[codigo] = total
+
+    def reconstruir(self, catalogo):
+        self.clear()
+        for producto in catalogo.values():
+            producto.resumen = self
+            if producto.lotes:
+                self.fijar_stock(producto.codigo, producto.stock)
+
+
+class IndiceVencimientos:
+    """Todos los lotes con fecha, ordenados por (vencimiento, código, fecha).
+
+    Se mantiene al agregar y quitar lotes de los productos registrados, así que
+    "lo que vence hasta tal día" o "lo ya vencido" es una búsqueda binaria más
+    el recorrido de los lotes que caen en el rango.
+    """
+
+    def __init__(self):
+        self._claves = []
+        self._lotes = {}
+
+    def __len__(self):
+        return len(self._claves)
+
+    def clear(self):
+        self._claves.clear()
+        self._lotes.clear()
+
+    @staticmethod
+    def _clave(lote):
+        return (lote.vencimiento, lote.producto.codigo, lote.fecha_vencimiento)
+
+    def registrar(self, producto):
+        producto.vencimientos = self
+        for lote in producto.lotes:
+            self.agregar(lote)
+
+    def agregar(self, lote):
+        if lote.vencimiento == SIN_VENCIMIENTO: return
+        clave = self._clave(lote)
+        if clave not in self._lotes:
+            insort(self._claves, clave)
+        self._lotes[clave] = lote
+
+    def quitar(self, lote):
+        clave = self._clave(lote)
+        if self._lotes.pop(clave, None) is None: return
+        del self._claves[bisect_left(self._claves, clave)]
+
+    def entre(self, desde, hasta):
+        """Lotes con desde <= vencimiento <= hasta (ordinales), en orden de vencimiento"""
+        ini = bisect_left(self._claves, (desde,))
+        fin = bisect_left(self._claves, (hasta + 1,))
+        return [self._lotes[c] for c in self._claves[ini:fin]]
+
+    def hasta(self, ordinal):
+        """Lotes que vencen hasta `ordinal` inclusive (los ya vencidos también)"""
+        return self.entre(0, ordinal)
+
+    def vencidos(self, hoy):
+        return self.entre(0, hoy - 1)
+
+    def reconstruir(self, catalogo):
+        self.clear()
+        for producto in catalogo.values():
+            producto.vencimientos = self
+            for lote in producto.lotes:
+                if lote.vencimiento != SIN_VENCIMIENTO:
+                    self._lotes[self._clave(lote)] = lote
+        self._claves = sorted(self._lotes)
@@ -0,0 +1,236 @@
+import os
+from bisect import bisect_left
+
+import numpy as np
+import pandas as pd
+
+# Filas del log entre dos puntos de control
+PUNTOS_CADA = 10000
+
+# Efecto de cada tipo de movimiento sobre el stock del lote (los demás no lo cambian)
+_SIGNOS = {'entrada': 1, 'salida': -1}
+# Fecha máxima de un tramo sin fechas legibles: anterior a cualquier consulta
+_SIN_FECHA = np.iinfo(np.int64).min
+_SEPARADOR_HUELLA = "\x1f"
+
+
+def _deltas(columnas, cantidades, ini, fin, mascara=None):
+    """Cambio de stock por (codigo, fecha_vencimiento) de las filas ini..fin-1 del log.
+
+    Devuelve (codigos, fechas, cantidades) como arreglos, sin los cambios nulos.
+    """
+    tipos = np.array(columnas['tipo'][ini:fin], dtype=object)
+    signos = np.select([tipos == t for t in _SIGNOS], list(_SIGNOS.values()), 0)
+    df = pd.DataFrame({
+        'codigo': columnas['codigo'][ini:fin],
+        'fecha_vencimiento': columnas['fecha_vencimiento'][ini:fin],
+        'delta': cantidades[ini:fin] * signos,
+    })
+    if mascara is not None:
+        df = df[mascara]
+    return _agrupar(df)
+
+
+def _agrupar(df):
+    sumas = df.groupby(['codigo', 'fecha_vencimiento'], sort=False)['delta'].sum().round().astype(np.int64)
+    sumas = sumas[sumas != 0]
+    return (
+        sumas.index.get_level_values(0).to_numpy(str), sumas.index.get_level_values(1).to_numpy(str),
+        sumas.to_numpy(np.int64),
+    )
+
+
+def _sumar_deltas(deltas, signo=1):
+    """Un solo delta con la suma (o la resta, con signo -1) de varios"""
+    if not deltas:
+        return np.array([], str), np.array([], str), np.array([], np.int64)
+    return _agrupar(pd.DataFrame({
+        'codigo': np.concatenate([d[0] for d in deltas]),
+        'fecha_vencimiento': np.concatenate([d[1] for d in deltas]),
+        'delta': np.concatenate([d[2] for d in deltas]) * signo,
+    }))
+
+
+def _aplicar(stock, delta):
+    """Suma el delta al dict {(codigo, fecha_vencimiento): cantidad}; los lotes en 0 se quitan"""
+    for clave, cambio in zip(zip(delta[0].tolist(), delta[1].tolist()), delta[2].tolist()):
+        total = stock.get(clave, 0) + cambio
+        if total:
+            stock[clave] = total
+        else:
+            stock.pop(clave, None)
+
+
+def _como_delta(stock):
+    claves = list(stock)
+    return (
+        np.array([c for c, _ in claves], dtype=str), np.array([f for _, f in claves], dtype=str),
+        np.array(list(stock.values()), dtype=np.int64),
+    )
+
+
+class ProyeccionStock:
+    """Stock de cada lote (código, vencimiento) calculado desde el log de movimientos.
+
+    Las entradas suman y las salidas restan, así que aplicar todo el log da el
+    stock actual. Para no recorrerlo entero hay un punto de control cada `cada`
+    filas: su posición en el log, la huella de esa fila (para detectar que el
+    log se reescribió), la mayor fecha vista hasta ahí y el cambio de stock
+    desde el punto anterior. El stock en el último punto se guarda completo.
+
+    Un arranque parte del último punto (guardado en un `.npz` local) y aplica
+    solo las filas siguientes. `stock_al` arma el stock de un momento pasado
+    sumando los cambios de los puntos anteriores (o restando los posteriores al
+    último, lo que sea menos) más las filas que faltan hasta ese momento.
+    """
+
+    def __init__(self, ruta=None, cada=PUNTOS_CADA):
+        self.ruta = ruta
+        self.cada = cada
+        self._reiniciar(None)
+        self._cargar()
+
+    def _reiniciar(self, origen):
+        self.origen = origen
+        self.stock = {}        # (codigo, fecha_vencimiento) -> cantidad tras las primeras `posicion` filas
+        self.posicion = 0
+        self.puntos = []       # [{'posicion', 'fecha_max', 'huella', 'delta'}]
+        self._base = {}        # stock en el último punto
+        self._pendiente = {}   # cambio desde el último punto
+        self._huella = None
+        self._fecha_max = _SIN_FECHA
+
+    @staticmethod
+    def _sigue(historial, posicion, huella):
+        """True si las primeras `posicion` filas del log son las que se aplicaron"""
+        return posicion == 0 or (posicion <= len(historial) and historial.huella_en(posicion - 1) == huella)
+
+    def sincronizar(self, historial):
+        """Aplica las filas del log que faltan (`historial` es un `HistorialMovimientos`); devuelve cuántas"""
+        if historial.origen != self.origen:
+            self._reiniciar(historial.origen)
+        if not self._sigue(historial, self.posicion, self._huella):
+            self._volver_a_punto_valido(historial)
+
+        n = len(historial)
+        inicio, ultimo_punto = self.posicion, None
+        if inicio == n:
+            return 0
+        fechas, cantidades = historial.fechas_y_cantidades()
+        columnas = historial.columnas()
+        while self.posicion < n:
+            # Tramos alineados a múltiplos de `cada`: cada punto cubre exactamente `cada` filas
+            fin = min(n, (self.posicion // self.cada + 1) * self.cada)
+            delta = _deltas(columnas, cantidades, self.posicion, fin)
+            _aplicar(self.stock, delta)
+            _aplicar(self._pendiente, delta)
+            tramo = fechas[self.posicion:fin]
+            tramo = tramo[~np.isnat(tramo)]
+            if len(tramo):
+                self._fecha_max = max(self._fecha_max, int(tramo.max().astype(np.int64)))
+            self.posicion = fin
+            if fin % self.cada == 0:
+                ultimo_punto = self._agregar_punto(historial)
+        self._huella = historial.huella_en(n - 1)
+        if ultimo_punto is not None:
+            # Stock en el último punto: el actual menos lo aplicado después
+            self._base = dict(self.stock)
+            codigos, fechas_vto, cambios = _como_delta(self._pendiente)
+            _aplicar(self._base, (codigos, fechas_vto, -cambios))
+            self._guardar()
+        return n - inicio
+
+    def _agregar_punto(self, historial):
+        self.puntos.append({
+            'posicion': self.posicion, 'fecha_max': self._fecha_max,
+            'huella': historial.huella_en(self.posicion - 1), 'delta': _como_delta(self._pendiente),
+        })
+        self._pendiente = {}
+        return self.posicion
+
+    def _stock_en(self, k):
+        """Stock tras los primeros `k` puntos, desde cero o desde el último, lo más corto"""
+        if k == 0:
+            return {}
+        if k <= len(self.puntos) - k:
+            stock = {}
+            _aplicar(stock, _sumar_deltas([p['delta'] for p in self.puntos[:k]]))
+            return stock
+        stock = dict(self._base)
+        _aplicar(stock, _sumar_deltas([p['delta'] for p in self.puntos[k:]], -1))
+        return stock
+
+    def _volver_a_punto_valido(self, historial):
+        """El log ya no empieza como se aplicó: se vuelve al último punto que sigue valiendo"""
+        k = len(self.puntos)
+        while k and not self._sigue(historial, self.puntos[k - 1]['posicion'], self.puntos[k - 1]['huella']):
+            k -= 1
+        self.stock = self._stock_en(k)
+        del self.puntos[k:]
+        self._base = dict(self.stock)
+        self._pendiente = {}
+        ultimo = self.puntos[-1] if self.puntos else None
+        self.posicion = ultimo['posicion'] if ultimo else 0
+        self._huella = ultimo['huella'] if ultimo else None
+        self._fecha_max = ultimo['fecha_max'] if ultimo else _SIN_FECHA
+
+    def stock_al(self, historial, hasta):
+        """{(codigo, fecha_vencimiento): cantidad} de los lotes con stock según los movimientos anteriores a `hasta`"""
+        self.sincronizar(historial)
+        limite = int(np.datetime64(hasta, 's').astype(np.int64))
+        if self._fecha_max < limite:
+            stock = dict(self.stock)
+        else:
+            # Puntos con todas sus filas anteriores a `hasta` (la fecha máxima no decrece)
+            k = bisect_left([p['fecha_max'] for p in self.puntos], limite)
+            stock = self._stock_en(k)
+            desde = self.puntos[k - 1]['posicion'] if k else 0
+            fechas, cantidades = historial.fechas_y_cantidades()
+            tramo = fechas[desde:]
+            mascara = ~np.isnat(tramo) & (tramo.astype(np.int64) < limite)
+            _aplicar(stock, _deltas(historial.columnas(), cantidades, desde, len(historial), mascara))
+        return {clave: cantidad for clave, cantidad in stock.items() if cantidad > 0}
+
+    # --- Archivo local ---
+
+    def _cargar(self):
+        if not self.ruta or not os.path.exists(self.ruta):
+            return
+        try:
+            with np.load(self.ruta) as datos:
+                limites = np.cumsum(datos['largos'])[:-1]
+                deltas = zip(*(np.split(datos[c], limites) for c in ('codigos', 'fechas', 'cantidades')))
+                puntos = [
+                    {'posicion': int(p), 'fecha_max': int(f), 'huella': str(h).split(_SEPARADOR_HUELLA), 'delta': d}
+                    for p, f, h, d in zip(datos['posiciones'], datos['fechas_max'], datos['huellas'], deltas)
+                ]
+                base = dict(zip(zip(datos['base_codigos'].tolist(), datos['base_fechas'].tolist()),
+                                datos['base_cantidades'].tolist()))
+                origen = str(datos['origen'])
+        except Exception:
+            # Archivo corrupto o de otra versión: se recalcula desde el log
+            return
+        if not puntos:
+            return
+        self._reiniciar(origen)
+        self.puntos, self._base, self.stock = puntos, base, dict(base)
+        ultimo = puntos[-1]
+        self.posicion, self._huella, self._fecha_max = ultimo['posicion'], ultimo['huella'], ultimo['fecha_max']
+
+    def _guardar(self):
+        if not self.ruta:
+            return
+        deltas = [p['delta'] for p in self.puntos]
+        base = _como_delta(self._base)
+        tmp = self.ruta + ".tmp.npz"
+        np.savez_compressed(
+            tmp, origen=np.array(self.origen or ""),
+            posiciones=np.array([p['posicion'] for p in self.puntos], dtype=np.int64),
+            fechas_max=np.array([p['fecha_max'] for p in self.puntos], dtype=np.int64),
+            huellas=np.array([_SEPARADOR_HUELLA.join(p['huella']) for p in self.puntos], dtype=str),
+            largos=np.array([len(d[2]) for d in deltas], dtype=np.int64),
+            codigos=np.concatenate([d[0] for d in deltas]), fechas=np.concatenate([d[1] for d in deltas]),
+            cantidades=np.concatenate([d[2] for d in deltas]),
+            base_codigos=base[0], base_fechas=base[1], base_cantidades=base[2],
+        )
+        os.replace(tmp, self.ruta)
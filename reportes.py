@@ -0,0 +1,52 @@
+import numpy as np
+import pandas as pd
+
+from modelo import CRITICO, ADVERTENCIA, OPTIMO
+
+# Estados en el orden en que se listan (más urgente primero)
+ESTADOS = np.array([CRITICO, ADVERTENCIA, OPTIMO], dtype=object)
+
+
+def columnas_stock(catalogo):
+    """Arreglos tipados de los productos con lotes o con stock mínimo.
+
+    Es lo único que recorre el catálogo en Python; conviene cachearlo por
+    versión de los datos y reutilizarlo para distintos umbrales.
+    """
+    productos = [p for p in catalogo.values() if p.lotes or p.stock_minimo is not None]
+    n = len(productos)
+    return {
+        'codigo': np.array([p.codigo for p in productos], dtype=object),
+        'nombre': np.array([p.nombre or 'Sin nombre' for p in productos], dtype=object),
+        'stock_min': np.fromiter((p.stock_minimo or 0 for p in productos), dtype=np.int64, count=n),
+        'stock_total_calc': np.fromiter((p.stock for p in productos), dtype=np.int64, count=n),
+    }
+
+
+def clasificar(stock, minimos, factor_advertencia=1.5):
+    """Índice en ESTADOS de cada producto: crítico si stock <= mínimo,
+    advertencia si stock <= factor * mínimo, óptimo en otro caso"""
+    return np.select(
+        [stock <= minimos, stock <= factor_advertencia * minimos], [0, 1], default=2
+    )
+
+
+def reporte_stock(columnas, factor_advertencia=1.5):
+    """Tabla de niveles de stock ordenada por estado y stock, y conteo por estado.
+
+    Devuelve (DataFrame con columnas codigo, stock_min, nombre,
+    stock_total_calc, Estado; dict estado -> cantidad de productos).
+    """
+    stock, minimos = columnas['stock_total_calc'], columnas['stock_min']
+    rango = clasificar(stock, minimos, factor_advertencia)
+    orden = np.lexsort((stock, rango))
+    conteo = np.bincount(rango, minlength=len(ESTADOS))
+
+    df = pd.DataFrame({
+        'codigo': columnas['codigo'][orden],
+        'stock_min': minimos[orden],
+        'nombre': columnas['nombre'][orden],
+        'stock_total_calc': stock[orden],
+        'Estado': ESTADOS[rango[orden]],
+    })
+    return df, dict(zip(ESTADOS, conteo.tolist()))
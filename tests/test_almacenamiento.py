@@ -0,0 +1,67 @@
+import pytest
+
+from almacenamiento import CATALOGO_WS, INVENTARIO_WS, AlmacenamientoSheets, AlmacenamientoSQLite
+from benchmarks.hoja_falsa import LibroFalso
+from instantanea import Instantanea
+from inventario import Inventario
+
+
+@pytest.fixture(params=["sheets", "sqlite"])
+def conectar(request, tmp_path):
+    """Devuelve una función que abre otra conexión (otra terminal) al mismo almacenamiento"""
+    if request.param == "sheets":
+        libro = LibroFalso()
+        return lambda: AlmacenamientoSheets(libro, peticiones_por_minuto=None)
+    ruta = str(tmp_path / "inventario.db")
+    return lambda: AlmacenamientoSQLite(ruta)
+
+
+def terminal(alm):
+    inv = Inventario(alm, Instantanea(intervalo_revision=0))
+    inv.sincronizar()
+    return inv
+
+
+def test_escritura_propia_no_obliga_a_recargar(conectar):
+    a = terminal(conectar())
+    a.registrar_entrada("1", 10, "", "Arroz")
+    assert not a.instantanea.necesita_recarga(a.alm)
+
+
+def test_escritura_ajena_antes_de_la_propia_obliga_a_recargar(conectar):
+    a, b = terminal(conectar()), terminal(conectar())
+    b.registrar_entrada("2", 5, "", "Fideos")
+    # a escribe justo después, sin haber visto la escritura de b
+    a.registrar_entrada("1", 10, "", "Arroz")
+
+    assert a.instantanea.necesita_recarga(a.alm)
+    a.sincronizar()
+    assert a.stock_total("2") == 5
+
+
+def test_escribir_una_pestana_no_invalida_el_indice_de_las_otras():
+    libro = LibroFalso()
+    alm = AlmacenamientoSheets(libro, peticiones_por_minuto=None)
+    alm.preparar()
+    alm.leer_varias({CATALOGO_WS: 0, INVENTARIO_WS: 0})
+    alm.actualizar(CATALOGO_WS, [["1", "Arroz", "", "1", "2", ""]])
+
+    libro.llamadas.clear()
+    alm.actualizar(INVENTARIO_WS, [["1", "10", "", "v1"]], esperadas={("1", ""): None})
+    # El índice del inventario sigue valiendo: no se vuelve a leer la pestaña entera
+    assert libro.llamadas['get_all_values'] == 0
+
+
+def test_lote_guardado_con_hora_se_vende_sobre_su_fila(conectar):
+    alm = conectar()
+    alm.preparar()
+    alm.actualizar(CATALOGO_WS, [["1", "Arroz", "", "1", "2", ""]])
+    alm.actualizar(INVENTARIO_WS, [["1", "10", "2031-01-01 10:00", "v1"]])
+
+    a = terminal(alm)
+    assert a.catalogo["1"].buscar_lote("2031-01-01").cantidad == 10
+    a.confirmar_salida({"1": 4})
+
+    # Se escribió sobre la misma fila, no se agregó otra para el mismo lote
+    assert [f[:3] for f in conectar().leer(INVENTARIO_WS)] == [["1", "6", "2031-01-01 10:00"]]
+    assert terminal(conectar()).stock_total("1") == 6
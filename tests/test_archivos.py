@@ -0,0 +1,68 @@
+import io
+
+from almacenamiento import AlmacenamientoSheets
+from archivos import leer_entregas
+from benchmarks.hoja_falsa import LibroFalso
+from instantanea import Instantanea
+from inventario import Inventario
+
+
+def entregas(texto, existentes=(), tamano=5000):
+    return leer_entregas(io.BytesIO(texto.encode()), "entrega.csv", set(existentes), tamano)
+
+
+def test_precio_ilegible_se_informa_en_vez_de_quedar_en_cero():
+    lotes, errores = entregas(
+        "codigo;cantidad;nombre;precio_costo;precio_venta;stock_min\n"
+        "1;5;Arroz;1,5;2;\n"
+        "2;3;Fideos;1;2;x\n"
+        "3;4;Yerba;1.5;;7\n"
+    )
+    assert lotes["codigo"].tolist() == ["3"]
+    assert lotes["precio_venta"].tolist() == [0]
+    assert errores[["fila", "codigo", "motivo"]].values.tolist() == [
+        [2, "1", "Precio no numérico"], [3, "2", "Stock mínimo no numérico"],
+    ]
+
+
+def test_importar_fija_el_minimo_solo_en_productos_o_lotes_nuevos():
+    inv = Inventario(AlmacenamientoSheets(LibroFalso(), peticiones_por_minuto=None), Instantanea(intervalo_revision=0))
+    inv.sincronizar()
+    inv.registrar_entrada("1", 10, "2030-01-01", "Arroz", stock_minimo=5)
+
+    lotes, _ = entregas(
+        "codigo,cantidad,fecha_vencimiento,stock_min\n"
+        "1,2,2030-01-01,50\n", existentes=inv.catalogo,
+    )
+    inv.importar_lotes(lotes)
+    assert inv.catalogo["1"].stock_minimo == 5
+
+    lotes, _ = entregas(
+        "codigo,cantidad,fecha_vencimiento,stock_min\n"
+        "1,2,2031-01-01,8\n", existentes=inv.catalogo,
+    )
+    inv.importar_lotes(lotes)
+    assert inv.catalogo["1"].stock_minimo == 8
+    assert inv.stock_total("1") == 14
+
+
+def test_bloques_se_unen_en_lotes_y_numeran_errores_del_archivo():
+    lotes, errores = entregas(
+        "codigo,cantidad,fecha_vencimiento,nombre,precio_venta,stock_min\n"
+        "1,5,2030-01-01,,100,\n"
+        "1,3,2030-01-01 10:00,Arroz,200,4\n"
+        "2,0,,Fideos,,\n"
+        "1,2,01/01/2030,,,6\n"
+        "3,1,,,,\n"
+        "2,4,,Fideos,50,\n",
+        tamano=2,
+    )
+    # Las filas del mismo lote se suman aunque vengan en bloques distintos y con otro formato de fecha;
+    # el nombre es el primero no vacío del código, el precio el primero del lote y el mínimo el último
+    assert lotes.drop(columns="stock_min").values.tolist() == [
+        ["1", "2030-01-01", 10, "Arroz", "", 0, 100], ["2", "", 4, "Fideos", "", 0, 50],
+    ]
+    assert lotes["stock_min"].fillna(-1).tolist() == [6, -1]
+    assert errores[["fila", "codigo", "motivo"]].values.tolist() == [
+        [4, "2", "La cantidad debe ser un entero positivo"], [6, "3", "Producto nuevo sin nombre"],
+    ]
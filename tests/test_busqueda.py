@@ -0,0 +1,22 @@
+from busqueda import IndiceBusqueda
+from modelo import Producto
+
+
+def catalogo(*productos):
+    return {p.codigo: p for p in productos}
+
+
+def test_reconstruir_indexa_en_la_primera_busqueda():
+    productos = catalogo(Producto("780", "Leche Entera", "Colun"), Producto("781", "Pañal", "Babysec"))
+    indice = IndiceBusqueda()
+    indice.reconstruir(productos)
+    assert not indice._campos
+
+    # Lo que cambie en el catálogo antes de buscar ya entra en el índice
+    productos["900"] = Producto("900", "Leche Descremada", "Soprole")
+    indice.registrar(productos["900"])
+    assert indice.buscar("leche") == ["900", "780"]
+    assert indice.buscar("panal") == ["781"]
+
+    indice.quitar("900")
+    assert indice.buscar("leche") == ["780"]
@@ -0,0 +1,60 @@
+from datetime import date
+
+import numpy as np
+
+from carga import tipar_catalogo, tipar_inventario, valores_catalogo, valores_inventario
+from modelo import SIN_VENCIMIENTO
+
+
+def test_catalogo_informa_precios_y_minimos_ilegibles():
+    columnas, informe = tipar_catalogo([
+        ["1", "Arroz", "Tucapel", "1000", "1500", "5"],
+        ["2", "Fideos", "", "1,5", "", "x"],
+        ["3", "Sal"],
+    ])
+    assert informe[["fila", "codigo", "columna", "valor", "motivo"]].values.tolist() == [
+        [3, "2", "precio_costo", "1,5", "Precio no numérico"],
+        [3, "2", "stock_min", "x", "Stock mínimo no numérico"],
+    ]
+    # Lo ilegible queda en 0 (precio) o sin mínimo; las celdas que faltan, vacías
+    assert list(valores_catalogo(columnas)) == [
+        ("1", "Arroz", "Tucapel", 1000, 1500, 5), ("2", "Fideos", "", 0, 0, None), ("3", "Sal", "", 0, 0, None),
+    ]
+
+
+def test_inventario_descarta_cantidades_invalidas_y_numera_las_filas_de_la_hoja():
+    columnas, informe = tipar_inventario([
+        ["1", "10", "2030-01-01", "v1"],
+        ["", "", "", ""],  # fila vaciada al borrar un lote
+        ["2", "dos", "2030-01-01", "v2"],
+        ["3", "1.5", "", "v3"],
+        ["4", "7", "31/12/2030", "v4"],
+    ])
+    assert informe[["fila", "codigo", "columna", "motivo"]].values.tolist() == [
+        [4, "2", "cantidad", "Cantidad no numérica"],
+        [5, "3", "cantidad", "La cantidad debe ser un entero"],
+        [6, "4", "fecha_vencimiento", "Fecha de vencimiento inválida"],
+    ]
+    # La fecha ilegible se informa pero el lote queda, sin vencimiento
+    assert columnas["codigo"].tolist() == ["1", "4"]
+    assert columnas["fila"].tolist() == [2, 6]
+    assert columnas["cantidad"].dtype == np.int64
+
+
+def test_vencimientos_en_datetime64_y_fecha_guardada_con_hora():
+    columnas, informe = tipar_inventario([
+        ["1", "1", "2031-01-01 10:00", "v1"],
+        ["2", "2", "2031-02-03T08:30:00", "v2"],
+        ["3", "3", " 2031-03-04 ", "v3"],
+        ["4", "4", "", "v4"],
+    ])
+    assert informe.empty
+    assert columnas["fecha_vencimiento"].tolist() == ["2031-01-01", "2031-02-03", "2031-03-04", ""]
+    assert columnas["vencimiento"].dtype == np.dtype("datetime64[D]")
+    assert columnas["vencimiento"][:3].tolist() == [date(2031, 1, 1), date(2031, 2, 3), date(2031, 3, 4)]
+    assert np.isnat(columnas["vencimiento"][3])
+
+    lotes = list(valores_inventario(columnas))
+    # El ordinal es el de `date.toordinal` y la fecha guardada conserva la hora (clave de la fila)
+    assert lotes[0] == ("1", 1, "2031-01-01", date(2031, 1, 1).toordinal(), "v1", "2031-01-01 10:00")
+    assert lotes[3][3] == SIN_VENCIMIENTO
@@ -0,0 +1,207 @@
+import time
+
+import pytest
+
+from almacenamiento import INVENTARIO_WS, MOVIMIENTOS_WS, AlmacenamientoSheets
+from benchmarks.hoja_falsa import LibroFalso
+from escritura_diferida import ColaEscritura
+from instantanea import Instantanea
+from inventario import Inventario, StockInsuficiente
+
+VENCE = "2030-01-01"
+
+
+def terminal(libro, ruta_diario=None, espera_inicial=0.01):
+    """Un Inventario sobre la hoja compartida `libro`, ya cargado (con cola si se da `ruta_diario`)"""
+    alm = AlmacenamientoSheets(libro, peticiones_por_minuto=None)
+    cola = ColaEscritura(alm, str(ruta_diario), espera_inicial=espera_inicial) if ruta_diario else None
+    inv = Inventario(alm, Instantanea(intervalo_revision=0), cola)
+    inv.sincronizar()
+    return inv
+
+
+def lotes(libro):
+    """{(codigo, vencimiento): cantidad} guardado en la hoja"""
+    return {(f[0], f[2]): int(f[1]) for f in libro.hoja(INVENTARIO_WS)._filas[1:] if f and f[0]}
+
+
+def salidas(libro):
+    return sum(1 for f in libro.hoja(MOVIMIENTOS_WS)._filas[1:] if f and f[1] == "salida")
+
+
+def fallar_una_vez(hoja, metodo):
+    """La próxima llamada a `metodo` de la hoja falla (como un corte de red); las siguientes funcionan"""
+    original = getattr(hoja, metodo)
+
+    def falla(*args, **kwargs):
+        setattr(hoja, metodo, original)
+        raise ConnectionError("conexión cortada")
+    setattr(hoja, metodo, falla)
+
+
+def esperar_intento_fallido(cola, timeout=5):
+    limite = time.monotonic() + timeout
+    while cola.estado()['intentos'] == 0:
+        assert time.monotonic() < limite, "la cola no llegó a fallar"
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def libro():
+    libro = LibroFalso()
+    terminal(libro).registrar_entrada("1", 10, VENCE, "Arroz")
+    return libro
+
+
+def test_conflicto_rebasa_sobre_la_otra_terminal(libro):
+    a, b = terminal(libro), terminal(libro)
+    a.confirmar_salida({"1": 3})
+    b.confirmar_salida({"1": 2})
+
+    assert lotes(libro) == {("1", VENCE): 5}
+    assert salidas(libro) == 2
+    # b guardó la diferencia sobre lo que vendió a, así que su memoria se recarga
+    assert not b.instantanea.cargada
+    b.sincronizar()
+    assert b.stock_total("1") == 5
+
+
+def test_rebase_sin_stock_suficiente_no_escribe(libro):
+    a, b = terminal(libro), terminal(libro)
+    a.confirmar_salida({"1": 8})
+    with pytest.raises(StockInsuficiente) as error:
+        b.confirmar_salida({"1": 5})
+
+    assert error.value.disponible == 2
+    assert lotes(libro) == {("1", VENCE): 2}
+    assert salidas(libro) == 1
+    assert not b.instantanea.cargada
+
+
+def test_operacion_sobre_memoria_vieja_no_pisa_un_lote_rebasado(libro):
+    a, b = terminal(libro), terminal(libro)
+    a.confirmar_salida({"1": 8})
+    b.confirmar_salida({"1": 1})
+    assert lotes(libro) == {("1", VENCE): 1}
+    # Sin recargar, b todavía cree que quedan 9 unidades
+    with pytest.raises(StockInsuficiente):
+        b.confirmar_salida({"1": 5})
+
+    assert lotes(libro) == {("1", VENCE): 1}
+
+
+def test_rebase_sobre_lote_agotado_por_otra_terminal(libro):
+    a, b = terminal(libro), terminal(libro)
+    a.confirmar_salida({"1": 10})
+    with pytest.raises(StockInsuficiente):
+        b.confirmar_salida({"1": 1})
+
+    assert lotes(libro) == {}
+    assert salidas(libro) == 1
+
+
+def test_reintento_tras_guardado_parcial_no_descuenta_dos_veces(libro, tmp_path):
+    a = terminal(libro, tmp_path / "diario.jsonl")
+    # Se escribe el inventario pero falla el agregado de los movimientos
+    fallar_una_vez(libro.hoja(MOVIMIENTOS_WS), "append_rows")
+    a.confirmar_salida({"1": 4})
+
+    assert a.cola.vaciar(timeout=5)
+    assert lotes(libro) == {("1", VENCE): 6}
+    assert salidas(libro) == 1
+    # Lo guardado coincide con la memoria: no hace falta recargar
+    assert a.instantanea.cargada
+    assert a.stock_total("1") == 6
+
+
+def test_reintento_con_operaciones_nuevas_en_el_lote(libro, tmp_path):
+    a = terminal(libro, tmp_path / "diario.jsonl", espera_inicial=60)
+    fallar_una_vez(libro.hoja(MOVIMIENTOS_WS), "append_rows")
+    a.confirmar_salida({"1": 4})
+    esperar_intento_fallido(a.cola)
+    # El reintento junta la operación a medio guardar con una nueva
+    a.confirmar_salida({"1": 1})
+    a.cola.reintentar()
+
+    assert a.cola.vaciar(timeout=5)
+    assert lotes(libro) == {("1", VENCE): 5}
+    assert salidas(libro) == 2
+
+
+def test_cola_invalida_la_memoria_tras_rebasar(libro, tmp_path):
+    a, b = terminal(libro), terminal(libro, tmp_path / "diario.jsonl")
+    a.confirmar_salida({"1": 3})
+    b.confirmar_salida({"1": 2})
+
+    assert b.cola.vaciar(timeout=5)
+    assert lotes(libro) == {("1", VENCE): 5}
+    assert b.cola.estado()['rebasadas'] == 1
+    assert not b.instantanea.cargada
+    b.sincronizar()
+    assert b.stock_total("1") == 5
+
+
+def test_reintento_no_repite_movimientos_ya_guardados(libro, tmp_path):
+    a = terminal(libro, tmp_path / "diario.jsonl")
+    # Todo se guarda pero falla la actualización de la celda de revisión del final
+    fallar_una_vez(libro, "values_update")
+    a.confirmar_salida({"1": 4})
+
+    assert a.cola.vaciar(timeout=5)
+    assert lotes(libro) == {("1", VENCE): 6}
+    assert salidas(libro) == 1
+
+
+def test_diario_recuperado_no_repite_lo_ya_guardado(libro, tmp_path, monkeypatch):
+    ruta = tmp_path / "diario.jsonl"
+    a = terminal(libro, ruta)
+    # Se cae después de guardar y antes de quitar la operación del diario
+    monkeypatch.setattr(ColaEscritura, "_reescribir_diario", lambda self: (_ for _ in ()).throw(OSError()))
+    a.confirmar_salida({"1": 4})
+    assert a.cola.vaciar(timeout=5)
+    monkeypatch.undo()
+
+    reiniciada = terminal(libro, ruta)
+    assert reiniciada.cola.vaciar(timeout=5)
+    assert lotes(libro) == {("1", VENCE): 6}
+    assert salidas(libro) == 1
+    assert ruta.read_text() == ""
+
+
+def test_error_definitivo_aparta_la_operacion(libro, tmp_path):
+    a, b = terminal(libro), terminal(libro, tmp_path / "diario.jsonl")
+    a.confirmar_salida({"1": 8})
+    b.confirmar_salida({"1": 5})
+
+    assert b.cola.vaciar(timeout=5)
+    assert lotes(libro) == {("1", VENCE): 2}
+    assert salidas(libro) == 1
+    assert b.cola.estado()['descartadas'] == 1
+    assert b.cola.descartadas()[0]['movimientos'] == "salida 5 × 1"
+    assert "Stock insuficiente" in b.cola.descartadas()[0]['error']
+    # La memoria tenía la venta: se recarga
+    assert not b.instantanea.cargada
+
+    # Sigue sin haber stock: vuelve a quedar apartada
+    b.cola.reenviar_descartadas()
+    assert b.cola.vaciar(timeout=5)
+    assert b.cola.estado()['descartadas'] == 1
+    b.cola.borrar_descartadas()
+    assert b.cola.estado()['descartadas'] == 0
+    assert (tmp_path / "diario.jsonl.descartadas").read_text() == ""
+
+
+def test_error_definitivo_aparta_solo_la_operacion_que_falla(libro, tmp_path):
+    a, b = terminal(libro), terminal(libro, tmp_path / "diario.jsonl", espera_inicial=60)
+    fallar_una_vez(libro.hoja(INVENTARIO_WS), "batch_update")
+    b.confirmar_salida({"1": 1})
+    esperar_intento_fallido(b.cola)
+    a.confirmar_salida({"1": 8})
+    # b todavía cree que quedan 9 unidades; el lote junto ya no entra
+    b.confirmar_salida({"1": 5})
+    b.cola.reintentar()
+
+    assert b.cola.vaciar(timeout=5)
+    assert lotes(libro) == {("1", VENCE): 1}
+    assert salidas(libro) == 2
+    assert [d['movimientos'] for d in b.cola.descartadas()] == ["salida 5 × 1"]
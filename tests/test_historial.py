@@ -0,0 +1,55 @@
+import os
+
+import historial
+from almacenamiento import MOVIMIENTOS_WS, AlmacenamientoSQLite
+from historial import HistorialMovimientos
+
+
+def mover(alm, n, desde=0):
+    alm.agregar(MOVIMIENTOS_WS, [
+        [f"2026-01-01 10:{i:02d}:00", "entrada", str(i), "Arroz", "1", "", "1", "2"] for i in range(desde, desde + n)
+    ])
+
+
+def terminar_compactacion(hist):
+    if hist._hilo_compactacion is not None:
+        hist._hilo_compactacion.join()
+
+
+def test_cache_agrega_segmentos_y_se_recupera(tmp_path):
+    ruta = str(tmp_path / "movimientos_cache.npz")
+    alm = AlmacenamientoSQLite(str(tmp_path / "inventario.db"))
+    alm.preparar()
+    mover(alm, 3)
+    hist = HistorialMovimientos(ruta)
+    hist.sincronizar(alm)
+    terminar_compactacion(hist)
+    mover(alm, 2, desde=3)
+    assert hist.sincronizar(alm) == 2
+
+    # La sincronización solo escribió sus filas en un segmento; la base no se tocó
+    assert os.path.exists(ruta + ".1.npz")
+    copia = HistorialMovimientos(ruta)
+    assert copia.columnas() == hist.columnas()
+    assert len(copia) == 5
+
+
+def test_cache_compacta_los_segmentos(tmp_path, monkeypatch):
+    monkeypatch.setattr(historial, "MAX_SEGMENTOS", 2)
+    ruta = str(tmp_path / "movimientos_cache.npz")
+    alm = AlmacenamientoSQLite(str(tmp_path / "inventario.db"))
+    alm.preparar()
+    mover(alm, 3)
+    hist = HistorialMovimientos(ruta)
+    hist.sincronizar(alm)
+    terminar_compactacion(hist)
+    for i in range(3):
+        mover(alm, 1, desde=3 + i)
+        hist.sincronizar(alm)
+        terminar_compactacion(hist)
+
+    cache = sorted(f for f in os.listdir(tmp_path) if f.startswith("movimientos_cache"))
+    assert cache == ["movimientos_cache.npz", "movimientos_cache.npz.3.npz"]
+    copia = HistorialMovimientos(ruta)
+    assert copia.columnas() == hist.columnas()
+    assert len(copia) == 6
@@ -0,0 +1,25 @@
+from almacenamiento import AlmacenamientoSheets
+from benchmarks.hoja_falsa import LibroFalso
+from instantanea import Instantanea
+from inventario import Inventario, interpretar_escaneo
+
+
+def test_interpretar_escaneo():
+    assert interpretar_escaneo(" A1 ") == ("A1", 1)
+    assert interpretar_escaneo("3*A1") == ("A1", 3)
+    assert interpretar_escaneo("x*A1") == ("A1", None)
+    assert interpretar_escaneo("*A1") == ("A1", None)
+
+
+def test_rafaga_rechaza_cantidades_invalidas():
+    inv = Inventario(AlmacenamientoSheets(LibroFalso(), peticiones_por_minuto=None), Instantanea(intervalo_revision=0))
+    inv.sincronizar()
+    inv.registrar_entrada("A1", 10, "", "Arroz")
+
+    carrito = {}
+    agregados, rechazados = inv.agregar_escaneos(carrito, "A1\nx*A1\n2*A1\n0*A1\n1.5*A1\n20*A1\nB2\n")
+    assert carrito == agregados == {"A1": 3}
+    assert rechazados == [
+        ("x*A1", "Cantidad inválida"), ("0*A1", "Cantidad inválida"), ("1.5*A1", "Cantidad inválida"),
+        ("20*A1", "Stock insuficiente (disponible: 10)"), ("B2", "El código no existe"),
+    ]
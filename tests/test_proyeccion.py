@@ -0,0 +1,97 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from almacenamiento import MOVIMIENTOS_WS, AlmacenamientoSQLite
+from historial import HistorialMovimientos
+from proyeccion import ProyeccionStock
+
+CADA = 5
+INICIO = datetime(2026, 1, 1, 10)
+
+
+def movimientos(n, desde=0, semilla=0, inicio=INICIO):
+    """Filas del log: un movimiento por hora sobre 3 códigos y 2 vencimientos, con alguna salida"""
+    rng = np.random.default_rng(semilla)
+    filas = []
+    for i in range(desde, desde + n):
+        tipo = "salida" if i % 3 == 2 else "entrada"
+        filas.append([
+            (inicio + timedelta(hours=i)).isoformat(timespec="seconds"), tipo, str(rng.integers(3)), "Arroz",
+            str(rng.integers(1, 4)), ["2030-01-01", ""][i % 2], "1", "2",
+        ])
+    return filas
+
+
+def esperado(filas, hasta=None):
+    """Stock recorriendo el log fila a fila (solo los movimientos anteriores a `hasta`)"""
+    stock = {}
+    for timestamp, tipo, codigo, _, cantidad, fv, *_ in filas:
+        if hasta is not None and datetime.fromisoformat(timestamp) >= hasta: continue
+        clave = (codigo, fv)
+        stock[clave] = stock.get(clave, 0) + int(cantidad) * (1 if tipo == "entrada" else -1)
+    return {clave: cantidad for clave, cantidad in stock.items() if cantidad > 0}
+
+
+def log(tmp_path, filas):
+    alm = AlmacenamientoSQLite(str(tmp_path / "inventario.db"))
+    alm.preparar()
+    alm.agregar(MOVIMIENTOS_WS, filas)
+    hist = HistorialMovimientos()
+    hist.sincronizar(alm)
+    return alm, hist
+
+
+def test_arranque_desde_el_punto_guardado_da_lo_mismo_que_todo_el_log(tmp_path):
+    ruta = str(tmp_path / "stock_puntos.npz")
+    filas = movimientos(23)
+    alm, hist = log(tmp_path, filas)
+    ProyeccionStock(ruta, cada=CADA).sincronizar(hist)
+
+    nuevas = movimientos(9, desde=23)
+    alm.agregar(MOVIMIENTOS_WS, nuevas)
+    hist.sincronizar(alm)
+    desde_punto = ProyeccionStock(ruta, cada=CADA)
+    assert desde_punto.posicion == 20
+    # Solo se aplican las filas posteriores al último punto
+    assert desde_punto.sincronizar(hist) == 12
+
+    completa = ProyeccionStock(cada=CADA)
+    completa.sincronizar(hist)
+    assert desde_punto.stock == completa.stock
+    assert {k: v for k, v in desde_punto.stock.items() if v > 0} == esperado(filas + nuevas)
+
+
+def test_stock_al_antes_y_despues_de_un_punto(tmp_path):
+    filas = movimientos(23)
+    _, hist = log(tmp_path, filas)
+    proyeccion = ProyeccionStock(cada=CADA)
+    proyeccion.sincronizar(hist)
+
+    # Justo en un punto, a mitad de tramos, antes de todo y después de todo
+    for horas in (0, 3, 5, 7, 12, 15, 22, 23, 100):
+        hasta = INICIO + timedelta(hours=horas)
+        assert proyeccion.stock_al(hist, hasta) == esperado(filas, hasta), horas
+
+
+def test_punto_corrupto_o_de_otro_log_se_recalcula(tmp_path):
+    ruta = str(tmp_path / "stock_puntos.npz")
+    filas = movimientos(23)
+    alm, hist = log(tmp_path, filas)
+    ProyeccionStock(ruta, cada=CADA).sincronizar(hist)
+
+    # Otro log en el mismo almacenamiento: los puntos guardados ya no coinciden con sus filas
+    otras = movimientos(23, semilla=1, inicio=INICIO + timedelta(minutes=30))
+    alm.sobrescribir(MOVIMIENTOS_WS, otras)
+    otro = HistorialMovimientos()
+    otro.sincronizar(alm)
+    vieja = ProyeccionStock(ruta, cada=CADA)
+    vieja.sincronizar(otro)
+    assert vieja.stock_al(otro, INICIO + timedelta(days=30)) == esperado(otras)
+    assert vieja.stock_al(otro, INICIO + timedelta(hours=8)) == esperado(otras, INICIO + timedelta(hours=8))
+
+    with open(ruta, "wb") as archivo:
+        archivo.write(b"no es un npz")
+    corrupta = ProyeccionStock(ruta, cada=CADA)
+    assert corrupta.posicion == 0
+    assert corrupta.stock_al(otro, INICIO + timedelta(days=30)) == esperado(otras)
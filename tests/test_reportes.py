@@ -0,0 +1,26 @@
+import numpy as np
+
+from modelo import ADVERTENCIA, CRITICO, OPTIMO, Producto
+from reportes import clasificar, columnas_stock, reporte_stock
+
+
+def test_umbrales_critico_advertencia_optimo():
+    minimos = np.array([10, 10, 10, 10, 10, 0, 0])
+    stock = np.array([0, 10, 11, 15, 16, 0, 1])
+    assert clasificar(stock, minimos, 1.5).tolist() == [0, 0, 1, 1, 2, 0, 2]
+    assert clasificar(stock, minimos, 1.0).tolist() == [0, 0, 2, 2, 2, 0, 2]
+
+
+def test_reporte_ordena_por_estado_y_stock_y_cuenta():
+    catalogo = {}
+    for codigo, stock, minimo in (("a", 20, 5), ("b", 3, 5), ("c", 7, 5), ("d", 0, 2), ("e", 0, None)):
+        producto = catalogo[codigo] = Producto(codigo, codigo.upper(), stock_minimo=minimo)
+        if stock:
+            producto.agregar_lote(stock, "")
+
+    df, conteo = reporte_stock(columnas_stock(catalogo), 1.5)
+    # "e" no tiene lotes ni mínimo: no entra en el reporte
+    assert df[["codigo", "stock_total_calc", "Estado"]].values.tolist() == [
+        ["d", 0, CRITICO], ["b", 3, CRITICO], ["c", 7, ADVERTENCIA], ["a", 20, OPTIMO],
+    ]
+    assert conteo == {CRITICO: 2, ADVERTENCIA: 1, OPTIMO: 1}